@@ -3,7 +3,9 @@ Django settings for ELD Trip Planner project.
 """
 
 from pathlib import Path
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -48,6 +50,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'trips.middleware.TimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,3 +143,124 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', '')
+
+# Geocode cache (in-process LRU in front of the GeocodeCacheEntry table)
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '2048'))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))  # 30 days
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', '3600'))  # 1 hour
+GEOCODE_CACHE_PERSISTENT = os.getenv('GEOCODE_CACHE_PERSISTENT', 'True') == 'True'
+
+# Route cache (in-process, keyed on waypoints rounded to ROUTE_CACHE_PRECISION decimals)
+ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', '512'))
+ROUTE_CACHE_PRECISION = int(os.getenv('ROUTE_CACHE_PRECISION', '3'))  # ~100 m
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', str(6 * 3600)))
+ROUTE_CACHE_STALE_TTL = int(os.getenv('ROUTE_CACHE_STALE_TTL', str(24 * 3600)))  # 0 disables stale-while-revalidate
+
+# Distance matrix cache (in-process, one float32 array per set of locations at ROUTE_CACHE_PRECISION)
+MATRIX_CACHE_SIZE = int(os.getenv('MATRIX_CACHE_SIZE', '128'))
+MATRIX_CACHE_TTL = int(os.getenv('MATRIX_CACHE_TTL', str(6 * 3600)))
+
+# Nominatim usage policy: at most this many requests per second, shared by every worker
+# process through a locked state file (empty for a separate limit per process)
+NOMINATIM_RATE_LIMIT = float(os.getenv('NOMINATIM_RATE_LIMIT', '1'))
+NOMINATIM_RATE_BURST = float(os.getenv('NOMINATIM_RATE_BURST', '1'))
+NOMINATIM_RATE_LIMIT_FILE = os.getenv(
+    'NOMINATIM_RATE_LIMIT_FILE', os.path.join(tempfile.gettempdir(), 'eld-trip-planner-nominatim.bucket')
+)
+
+# Upstream services (point these at self-hosted OSRM/Nominatim instances)
+OSRM_URL = os.getenv('OSRM_URL', 'http://router.project-osrm.org')
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org')
+
+# Shared keep-alive HTTP session: connections kept per upstream host, and timeouts
+OSRM_POOL_SIZE = int(os.getenv('OSRM_POOL_SIZE', '10'))
+NOMINATIM_POOL_SIZE = int(os.getenv('NOMINATIM_POOL_SIZE', '4'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+
+# Batch trip planning (POST /api/trips/calculate/batch/)
+BATCH_MAX_TRIPS = int(os.getenv('BATCH_MAX_TRIPS', '500'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '8'))
+
+# Distance matrices (POST /api/trips/matrix/); OSRM's table service allows 100 by default
+MATRIX_MAX_LOCATIONS = int(os.getenv('MATRIX_MAX_LOCATIONS', '100'))
+
+# Background trip jobs (POST /api/trips/jobs/)
+TRIP_JOB_WORKERS = int(os.getenv('TRIP_JOB_WORKERS', '2'))  # threads per process
+TRIP_JOB_MAX_WAIT = float(os.getenv('TRIP_JOB_MAX_WAIT', '25'))  # longest long-poll under ASGI, seconds
+TRIP_JOB_STALE_AFTER = float(os.getenv('TRIP_JOB_STALE_AFTER', '300'))  # unfinished jobs without a heartbeat this long fail
+
+# Serve /api/trips/calculate/ and job long-polls from the async views; enable when running config.asgi
+TRIPS_ASYNC_VIEWS = os.getenv('TRIPS_ASYNC_VIEWS', 'False') == 'True'
+
+# Offline gazetteer index (built with `manage.py build_gazetteer`); skipped if the file is missing
+GAZETTEER_INDEX = os.getenv('GAZETTEER_INDEX', str(BASE_DIR / 'data' / 'gazetteer.idx'))
+GAZETTEER_FUZZY_CUTOFF = float(os.getenv('GAZETTEER_FUZZY_CUTOFF', '0.85'))
+
+# Offline road graph (built with `manage.py build_road_graph`); opt-in, routes are tried on it
+# before OSRM. Waypoints farther than MAX_SNAP_MILES from a road, and searches that settle more
+# than MAX_SETTLED nodes (0 = no limit) or run past the trip deadline, go to OSRM
+ROAD_GRAPH_ENABLED = os.getenv('ROAD_GRAPH_ENABLED', 'False') == 'True'
+ROAD_GRAPH_INDEX = os.getenv('ROAD_GRAPH_INDEX', str(BASE_DIR / 'data' / 'roads.graph'))
+ROAD_GRAPH_MAX_SNAP_MILES = float(os.getenv('ROAD_GRAPH_MAX_SNAP_MILES', '2'))
+ROAD_GRAPH_MAX_SETTLED = int(os.getenv('ROAD_GRAPH_MAX_SETTLED', '50000'))
+
+# Default map zoom the response route geometry is simplified for (empty for full detail)
+ROUTE_SIMPLIFY_ZOOM = os.getenv('ROUTE_SIMPLIFY_ZOOM', '14')
+ROUTE_SIMPLIFY_ZOOM = float(ROUTE_SIMPLIFY_ZOOM) if ROUTE_SIMPLIFY_ZOOM else None
+
+# HOS rule set used when a request doesn't pick one (see trips/services/hos_rules.py)
+HOS_RULE_SET = os.getenv('HOS_RULE_SET', 'property_70_8')
+
+# Most departure times one POST /api/trips/calculate/departure/ request may sweep
+DEPARTURE_MAX_CANDIDATES = int(os.getenv('DEPARTURE_MAX_CANDIDATES', '2000'))
+
+# Store calculated trips (TripPlan) so they can be re-planned mid-trip and fetched by id
+TRIP_PLANS_PERSISTENT = os.getenv('TRIP_PLANS_PERSISTENT', 'True') == 'True'
+# Identical requests within the same start-time bucket get the stored plan (0 disables)
+TRIP_PLAN_BUCKET_MINUTES = int(os.getenv('TRIP_PLAN_BUCKET_MINUTES', '15'))
+
+# Per-request stage timings: Server-Timing response header and JSON request log lines
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'True') == 'True'
+# Prometheus-format metrics at GET /api/metrics/
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+
+# Per-upstream circuit breaker: opens when FAILURE_RATE of the last WINDOW calls (at least
+# MIN_CALLS) failed or took longer than SLOW_SECONDS, then rejects calls for OPEN_SECONDS
+UPSTREAM_BREAKER_WINDOW = int(os.getenv('UPSTREAM_BREAKER_WINDOW', '20'))
+UPSTREAM_BREAKER_MIN_CALLS = int(os.getenv('UPSTREAM_BREAKER_MIN_CALLS', '10'))
+UPSTREAM_BREAKER_FAILURE_RATE = float(os.getenv('UPSTREAM_BREAKER_FAILURE_RATE', '0.5'))
+UPSTREAM_BREAKER_SLOW_SECONDS = float(os.getenv('UPSTREAM_BREAKER_SLOW_SECONDS', '5'))
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.getenv('UPSTREAM_BREAKER_OPEN_SECONDS', '30'))
+# Send a duplicate request when the first is slower than the upstream's recent quantile.
+# Off for Nominatim by default: its usage policy counts every request
+OSRM_HEDGE = os.getenv('OSRM_HEDGE', 'True') == 'True'
+NOMINATIM_HEDGE = os.getenv('NOMINATIM_HEDGE', 'False') == 'True'
+UPSTREAM_HEDGE_QUANTILE = float(os.getenv('UPSTREAM_HEDGE_QUANTILE', '0.95'))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.getenv('UPSTREAM_HEDGE_MIN_DELAY', '0.05'))
+# Route estimates when OSRM can't be used: road miles per straight-line mile (optionally per
+# region, as a JSON list of {"name", "bbox": [min_lng, min_lat, max_lng, max_lat], "factor"};
+# the first region containing a leg's midpoint wins), average speed, and vertex spacing
+ROUTE_CIRCUITY_FACTOR = float(os.getenv('ROUTE_CIRCUITY_FACTOR', '1.2'))
+ROUTE_CIRCUITY_REGIONS = json.loads(os.getenv('ROUTE_CIRCUITY_REGIONS', '[]'))
+ROUTE_FALLBACK_SPEED_MPH = float(os.getenv('ROUTE_FALLBACK_SPEED_MPH', '60'))
+ROUTE_FALLBACK_SEGMENT_MILES = float(os.getenv('ROUTE_FALLBACK_SEGMENT_MILES', '10'))
+# Seconds a trip calculation may spend on geocoding and routing before falling back (0 disables)
+TRIP_DEADLINE_SECONDS = float(os.getenv('TRIP_DEADLINE_SECONDS', '15'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # trips.requests logs one JSON line per request at INFO
+        'trips': {
+            'handlers': ['console'],
+            'level': os.getenv('TRIPS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -1,6 +1,48 @@
+import signal
+import threading
+
 from django.apps import AppConfig
+from django.core.signals import setting_changed
+
+# Settings read when the shared services are built
+SERVICE_SETTINGS = {
+    'OSRM_URL', 'NOMINATIM_URL', 'OSRM_POOL_SIZE', 'NOMINATIM_POOL_SIZE', 'HTTP_POOL_SIZE',
+    'HTTP_CONNECT_TIMEOUT', 'HTTP_READ_TIMEOUT', 'NOMINATIM_RATE_LIMIT', 'NOMINATIM_RATE_BURST',
+    'NOMINATIM_RATE_LIMIT_FILE', 'GAZETTEER_INDEX', 'GAZETTEER_FUZZY_CUTOFF', 'HOS_RULE_SET',
+    'UPSTREAM_BREAKER_WINDOW', 'UPSTREAM_BREAKER_MIN_CALLS', 'UPSTREAM_BREAKER_FAILURE_RATE',
+    'UPSTREAM_BREAKER_SLOW_SECONDS', 'UPSTREAM_BREAKER_OPEN_SECONDS', 'OSRM_HEDGE', 'NOMINATIM_HEDGE',
+    'UPSTREAM_HEDGE_QUANTILE', 'UPSTREAM_HEDGE_MIN_DELAY',
+    'ROAD_GRAPH_ENABLED', 'ROAD_GRAPH_INDEX', 'ROAD_GRAPH_MAX_SNAP_MILES', 'ROAD_GRAPH_MAX_SETTLED',
+    'ROUTE_CIRCUITY_FACTOR', 'ROUTE_CIRCUITY_REGIONS', 'ROUTE_FALLBACK_SPEED_MPH', 'ROUTE_FALLBACK_SEGMENT_MILES',
+}
+CACHE_SETTINGS = {
+    'GEOCODE_CACHE_SIZE', 'GEOCODE_CACHE_TTL', 'GEOCODE_CACHE_NEGATIVE_TTL', 'GEOCODE_CACHE_PERSISTENT',
+    'ROUTE_CACHE_SIZE', 'ROUTE_CACHE_PRECISION', 'ROUTE_CACHE_TTL', 'ROUTE_CACHE_STALE_TTL',
+    'MATRIX_CACHE_SIZE', 'MATRIX_CACHE_TTL',
+}
+
+
+def reload_services(setting, **kwargs):
+    """Rebuild the shared services when one of their settings changes."""
+    if setting in SERVICE_SETTINGS or setting in CACHE_SETTINGS:
+        from .services import container
+        container.reload(clear_caches=setting in CACHE_SETTINGS)
+
+
+def reload_on_hangup(signum, frame):
+    """SIGHUP: rebuild the shared services, e.g. to pick up a rebuilt gazetteer or road graph."""
+    from .services import container
+    # Not from the handler itself: the interrupted thread may be holding the container's lock
+    threading.Thread(target=container.reload, name="service-reload", daemon=True).start()
 
 
 class TripsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trips'
+
+    def ready(self):
+        setting_changed.connect(reload_services)
+        # Gunicorn loads the app after setting up each worker's signals, so this
+        # handler is per worker (the master keeps HUP for restarting workers)
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, reload_on_hangup)
@@ -0,0 +1,8 @@
+"""
+Benchmark suite for the trip planning pipeline (see ``manage.py benchmark``).
+
+Recorded Nominatim and OSRM responses are replayed by a local stand-in
+server, so every stage runs its real code path (HTTP client, parsing,
+caching) without touching the public services, and timings are
+comparable between runs and commits.
+"""
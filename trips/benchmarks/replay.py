@@ -0,0 +1,190 @@
+"""
+Recorded upstream responses and the local server that replays them.
+
+A fixture is one trip: the request body plus the Nominatim search and
+OSRM route responses needed to plan it, stored as gzipped JSON::
+    
+    {
+        "name": "short",
+        "request": {"current_location": ..., "current_cycle_hours": ...},
+        "nominatim": {"<address>": [<search result>, ...]},
+        "osrm": {"<lng,lat;lng,lat;...>": <route response>},
+        "recorded": {"source": ..., "at": ...}
+    }
+"""
+import gzip
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from ..services.cache import normalize_address
+from ..services.http_client import get_nominatim_url, get_osrm_url, get_session, get_timeout
+from ..services.rate_limit import get_nominatim_limiter
+from ..services.route_service import RouteService
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# Benchmarked trips, shortest first
+TRIPS = ("short", "medium", "cross_country")
+
+LOCATION_FIELDS = ("current_location", "pickup_location", "dropoff_location")
+
+OSRM_ROUTE_PREFIX = "/route/v1/driving/"
+
+
+def fixture_path(name: str) -> Path:
+    return FIXTURES_DIR / f"{name}.json.gz"
+
+
+def load_fixture(name: str) -> Dict:
+    with gzip.open(fixture_path(name), "rt", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_fixture(fixture: Dict):
+    # mtime=0 keeps re-recorded fixtures byte-identical when nothing changed
+    with open(fixture_path(fixture["name"]), "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as handle:
+            handle.write(json.dumps(fixture, separators=(",", ":")).encode("utf-8"))
+
+
+def record_fixture(fixture: Dict) -> Dict:
+    """
+    Re-record a fixture's responses from the configured upstreams.
+    
+    Uses NOMINATIM_URL and OSRM_URL, so this needs network access (or
+    self-hosted instances). Nominatim lookups go through the shared rate
+    limiter.
+    """
+    session = get_session()
+    timeout = get_timeout()
+    limiter = get_nominatim_limiter()
+    
+    nominatim = {}
+    waypoints = []
+    for field in LOCATION_FIELDS:
+        address = fixture["request"][field]
+        limiter.acquire()
+        response = session.get(
+            f"{get_nominatim_url()}/search",
+            params={"q": address, "format": "json", "limit": 1},
+            headers={"User-Agent": "eld-trip-planner"},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            raise ValueError(f"Nominatim has no match for {address!r}")
+        nominatim[address] = results
+        waypoints.append((float(results[0]["lat"]), float(results[0]["lon"])))
+    
+    # Build the URL exactly as RouteService does, so replay finds it by path
+    url, params = RouteService()._osrm_request(waypoints)
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    
+    return dict(
+        fixture,
+        nominatim=nominatim,
+        osrm={unquote(urlsplit(url).path).split(OSRM_ROUTE_PREFIX, 1)[1]: response.json()},
+        recorded={
+            "source": [get_nominatim_url(), get_osrm_url()],
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+        }
+    )
+
+
+class ReplayServer:
+    """
+    Local stand-in for Nominatim and OSRM that serves recorded responses.
+    
+    Responses are encoded once up front and served over keep-alive
+    HTTP/1.1, so the server adds little beyond the client's own cost.
+    ``latency`` (seconds) delays every response to model a remote upstream.
+    Requests with no recording get a 404 and are counted in ``misses``.
+        
+        with ReplayServer(fixtures) as server:
+            ... point OSRM_URL and NOMINATIM_URL at server.url ...
+    """
+    
+    def __init__(self, fixtures: Iterable[Dict], latency: float = 0.0):
+        self.routes: Dict[str, bytes] = {}
+        self.places: Dict[str, bytes] = {}
+        for fixture in fixtures:
+            for coords, response in fixture["osrm"].items():
+                self.routes[coords] = json.dumps(response).encode("utf-8")
+            for address, results in fixture["nominatim"].items():
+                self.places[normalize_address(address)] = json.dumps(results).encode("utf-8")
+        
+        self.latency = latency
+        self.requests = 0
+        self.misses: List[str] = []
+        self._server = None
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "ReplayServer":
+        replay = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this, Nagle's
+            # algorithm and delayed ACKs add ~40 ms to every response
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                replay.requests += 1
+                if replay.latency:
+                    time.sleep(replay.latency)
+                body = replay.lookup(self.path)
+                if body is None:
+                    replay.misses.append(self.path)
+                    self.send_response(404)
+                    body = b'{"code":"NoRecording"}'
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="benchmark-replay", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+    
+    def lookup(self, path: str):
+        """Recorded response body for a request path, or None."""
+        parts = urlsplit(path)
+        if parts.path.startswith(OSRM_ROUTE_PREFIX):
+            return self.routes.get(unquote(parts.path[len(OSRM_ROUTE_PREFIX):]))
+        if parts.path == "/search":
+            query = parse_qs(parts.query).get("q", [""])[0]
+            return self.places.get(normalize_address(query))
+        return None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,201 @@
+"""
+Benchmark cases, timing and result history.
+
+Each pipeline stage is timed on its own for every fixture trip:
+    
+    geocode          RouteService.geocode over the trip's three addresses
+    calculate_route  RouteService.calculate_route over the geocoded waypoints
+    calculate_stops  TripCalculator._calculate_stops on the route
+    simulate_trip    ELDSimulator.simulate_trip on those stops
+    view             POST /api/trips/calculate/ through the Django test client
+
+Stages that cache are timed ``cold`` (caches cleared before every round,
+so upstream replay and parsing are included) and ``warm``.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.test import Client
+from django.urls import reverse
+
+from ..services import container
+
+# Fixed so simulate_trip's day boundaries don't depend on when the suite runs
+START_TIME = datetime(2024, 1, 8, 8, 0)
+
+
+class Benchmark:
+    """One timed case; ``setup`` runs untimed before every round."""
+    
+    __slots__ = ("name", "func", "setup")
+    
+    def __init__(self, name: str, func: Callable, setup: Optional[Callable] = None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+
+def measure(benchmark: Benchmark, rounds: int = 15) -> Dict:
+    """
+    Time a benchmark and return its statistics in seconds per call.
+    
+    Cases without setup run several calls per round (calibrated with
+    timeit's autorange) so fast stages aren't lost in timer noise. timeit
+    pauses garbage collection while timing.
+    """
+    timer = timeit.Timer(benchmark.func)
+    
+    # Warm-up call, also the first chance for a stage to fail loudly
+    if benchmark.setup:
+        benchmark.setup()
+    benchmark.func()
+    
+    number = 1 if benchmark.setup else timer.autorange()[0]
+    samples = []
+    for _ in range(rounds):
+        if benchmark.setup:
+            benchmark.setup()
+        samples.append(timer.timeit(number) / number)
+    
+    return {
+        "rounds": rounds,
+        "number": number,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def trip_benchmarks(name: str, fixture: Dict) -> List[Benchmark]:
+    """The benchmarks for one fixture trip, in pipeline order."""
+    calculator = container.trip_calculator
+    route_service = calculator.route_service
+    simulator = calculator.eld_simulator
+    request = fixture["request"]
+    addresses = [request["current_location"], request["pickup_location"], request["dropoff_location"]]
+    
+    waypoints = [route_service.geocode(address) for address in addresses]
+    route = route_service.calculate_route(waypoints)
+    stops = calculator._calculate_stops(route)
+    
+    client = Client()
+    url = reverse("calculate-trip")
+    body = json.dumps(request)
+    
+    def post():
+        response = client.post(url, body, content_type="application/json")
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.content[:200]!r}")
+    
+    def clear_caches():
+        route_service.geocode_cache.clear()
+        route_service.route_cache.clear()
+    
+    return [
+        Benchmark(
+            f"geocode.cold[{name}]",
+            lambda: [route_service.geocode(address) for address in addresses],
+            setup=route_service.geocode_cache.clear
+        ),
+        Benchmark(f"geocode.warm[{name}]", lambda: [route_service.geocode(address) for address in addresses]),
+        Benchmark(
+            f"calculate_route.cold[{name}]",
+            lambda: route_service.calculate_route(waypoints),
+            setup=route_service.route_cache.clear
+        ),
+        Benchmark(f"calculate_route.warm[{name}]", lambda: route_service.calculate_route(waypoints)),
+        Benchmark(f"calculate_stops[{name}]", lambda: calculator._calculate_stops(route)),
+        Benchmark(
+            f"simulate_trip[{name}]",
+            lambda: simulator.simulate_trip(
+                route["distance"], stops, float(request["current_cycle_hours"]), start_time=START_TIME
+            )
+        ),
+        Benchmark(f"view.cold[{name}]", post, setup=clear_caches),
+        Benchmark(f"view.warm[{name}]", post),
+    ]
+
+
+def git_revision() -> Dict:
+    """The checked-out commit and whether the tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": False}
+    return {"commit": commit, "dirty": dirty}
+
+
+def resolve_commit(ref: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--verify", f"{ref}^{{commit}}"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ResultHistory:
+    """
+    Benchmark runs saved as JSON, one file per commit.
+    
+    Runs are named after the commit they measured, so comparing against
+    a commit means loading its file; re-running a commit replaces it.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+    
+    def save(self, results: Dict[str, Dict], revision: Dict, options: Dict) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        commit = revision["commit"] or "unversioned"
+        run = {
+            "commit": revision["commit"],
+            "dirty": revision["dirty"],
+            "saved_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "machine": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "processor": platform.machine(),
+            },
+            "options": options,
+            "results": results,
+        }
+        path = self.directory / f"{commit}{'-dirty' if revision['dirty'] else ''}.json"
+        path.write_text(json.dumps(run, indent=2, sort_keys=True), encoding="utf-8")
+        return path
+    
+    def load(self, ref: str) -> Optional[Dict]:
+        """Load a saved run by file path, commit-ish, or ``latest`` (the most recently saved)."""
+        if ref == "latest":
+            runs = [json.loads(p.read_text(encoding="utf-8")) for p in self.directory.glob("*.json")]
+            return max(runs, key=lambda run: run["saved_at"], default=None)
+        
+        path = Path(ref)
+        if not path.is_file():
+            commit = resolve_commit(ref)
+            path = self.directory / f"{commit}.json"
+            if commit is None or not path.is_file():
+                return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> Dict[str, float]:
+    """Relative change in median time (0.2 is 20% slower) per benchmark present in both runs."""
+    return {
+        name: stats["median"] / baseline[name]["median"] - 1
+        for name, stats in results.items()
+        if name in baseline and baseline[name]["median"] > 0
+    }
@@ -0,0 +1,157 @@
+"""
+Benchmark the trip planning pipeline against recorded upstream responses.
+    
+    python manage.py benchmark --save
+    python manage.py benchmark --save --compare            # against the last saved run
+    python manage.py benchmark --compare main --threshold 0.1
+    python manage.py benchmark --record                    # refresh fixtures from live services
+"""
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from trips.benchmarks.replay import TRIPS, ReplayServer, load_fixture, record_fixture, save_fixture
+from trips.benchmarks.suite import ResultHistory, compare, git_revision, measure, trip_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time geocoding, routing, stop planning, HOS simulation and the calculate view per trip size"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--trip",
+            action="append",
+            dest="trips",
+            choices=TRIPS,
+            help="Fixture trip to benchmark; repeat for several (default: all)"
+        )
+        parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+        parser.add_argument("--rounds", type=int, default=15, help="Timed rounds per benchmark (default: 15)")
+        parser.add_argument(
+            "--upstream-latency",
+            type=float,
+            default=0.0,
+            help="Milliseconds the stand-in server waits before each response (default: 0)"
+        )
+        parser.add_argument("--save", action="store_true", help="Save results under --storage, keyed by commit")
+        parser.add_argument(
+            "--compare",
+            nargs="?",
+            const="latest",
+            metavar="REF",
+            help="Compare with a saved run: a commit-ish, a results file, or the latest run when omitted"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Relative slowdown in median time that counts as a regression (default: 0.2)"
+        )
+        parser.add_argument(
+            "--storage",
+            default=".benchmarks",
+            help="Directory of saved runs (default: .benchmarks)"
+        )
+        parser.add_argument(
+            "--record",
+            action="store_true",
+            help="Re-record fixture responses from OSRM_URL and NOMINATIM_URL instead of benchmarking"
+        )
+    
+    def handle(self, *args, **options):
+        trips = options["trips"] or list(TRIPS)
+        if options["rounds"] < 2:
+            raise CommandError("--rounds must be at least 2")
+        
+        fixtures = {name: load_fixture(name) for name in trips}
+        if options["record"]:
+            for name, fixture in fixtures.items():
+                try:
+                    save_fixture(record_fixture(fixture))
+                except Exception as e:
+                    raise CommandError(f"Could not record {name}: {e}")
+                self.stdout.write(f"Recorded {name}")
+            return
+        
+        history = ResultHistory(options["storage"])
+        baseline = None
+        if options["compare"]:
+            baseline = history.load(options["compare"])
+            if baseline is None:
+                raise CommandError(f"No saved run for {options['compare']!r} in {options['storage']}")
+        
+        with ReplayServer(fixtures.values(), latency=options["upstream_latency"] / 1000) as server:
+            results = self._run(fixtures, server, options)
+        
+        if options["save"]:
+            path = history.save(results, git_revision(), {"rounds": options["rounds"], "trips": trips})
+            self.stdout.write(f"Saved results to {path}")
+        
+        if baseline is not None:
+            self._report_comparison(results, baseline, options["threshold"])
+    
+    def _run(self, fixtures, server, options):
+        # Everything goes to the stand-in; nothing is persisted or rate limited
+        overrides = {
+            "OSRM_URL": server.url,
+            "NOMINATIM_URL": server.url,
+            "NOMINATIM_RATE_LIMIT": 0,
+            "GEOCODE_CACHE_PERSISTENT": False,
+            "TRIP_PLANS_PERSISTENT": False,
+            "GAZETTEER_INDEX": "",
+            "ROAD_GRAPH_INDEX": "",
+            "ALLOWED_HOSTS": ["testserver"],
+        }
+        results = {}
+        # One request log line per timed view call would swamp the report
+        request_log = logging.getLogger("trips.requests")
+        level = request_log.level
+        request_log.setLevel(logging.WARNING)
+        try:
+            # Changing these settings rebuilds the shared services with empty caches
+            with override_settings(**overrides):
+                for name, fixture in fixtures.items():
+                    try:
+                        benchmarks = trip_benchmarks(name, fixture)
+                    except ValueError as e:
+                        raise CommandError(f"Fixture {name} could not be planned: {e}")
+                    # A missing route would silently fall back to a straight line
+                    if server.misses:
+                        raise CommandError(f"Fixture {name} has no recording for {server.misses[0]}")
+                    
+                    for benchmark in benchmarks:
+                        if options["filter"] not in benchmark.name:
+                            continue
+                        stats = results[benchmark.name] = measure(benchmark, options["rounds"])
+                        self.stdout.write(
+                            f"{benchmark.name:<36} median {stats['median'] * 1000:10.3f} ms"
+                            f"  min {stats['min'] * 1000:10.3f} ms  ({stats['rounds']} x {stats['number']})"
+                        )
+        finally:
+            request_log.setLevel(level)
+        return results
+    
+    def _report_comparison(self, results, baseline, threshold):
+        changes = compare(results, baseline["results"])
+        if not changes:
+            self.stdout.write("No benchmarks in common with the baseline run")
+            return
+        
+        label = (baseline["commit"] or "unversioned")[:12] + ("-dirty" if baseline["dirty"] else "")
+        self.stdout.write(f"\nChange in median time against {label}:")
+        regressions = []
+        for name, change in changes.items():
+            line = f"{name:<36} {change * 100:+8.1f}%"
+            if change > threshold:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + "  regression"))
+            elif change < -threshold:
+                self.stdout.write(self.style.SUCCESS(line + "  faster"))
+            else:
+                self.stdout.write(line)
+        
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) slowed down by more than {threshold:.0%}: {', '.join(regressions)}"
+            )
@@ -0,0 +1,43 @@
+"""
+Compile a US places file into the offline gazetteer index.
+    
+    python manage.py build_gazetteer uscities.csv
+    python manage.py build_gazetteer US.txt --format geonames
+"""
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.services.gazetteer import build_index, read_geonames, read_places_csv
+
+
+class Command(BaseCommand):
+    help = "Build the offline gazetteer index used by RouteService.geocode"
+    
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Places CSV (city,state,lat,lng[,population]) or GeoNames dump")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "geonames"],
+            default="csv",
+            help="Input format (default: csv)"
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.GAZETTEER_INDEX,
+            help="Index file to write (default: GAZETTEER_INDEX)"
+        )
+    
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        if not source.exists():
+            raise CommandError(f"Source file not found: {source}")
+        
+        output = Path(options["output"])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        
+        reader = read_geonames if options["format"] == "geonames" else read_places_csv
+        count = build_index(reader(str(source)), str(output))
+        
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} places to {output}"))
@@ -0,0 +1,39 @@
+"""
+Compile an OpenStreetMap extract into the offline road graph.
+    
+    python manage.py build_road_graph texas-latest.osm.pbf
+    python manage.py build_road_graph area.osm.bz2 --output /srv/roads.graph
+"""
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.services.road_graph import build_graph, read_extract
+
+
+class Command(BaseCommand):
+    help = "Build the offline road graph used by RouteService.calculate_route"
+    
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="OSM extract: .osm.pbf (needs osmium) or .osm / .osm.bz2 / .osm.gz XML")
+        parser.add_argument(
+            "--output",
+            default=settings.ROAD_GRAPH_INDEX,
+            help="Graph file to write (default: ROAD_GRAPH_INDEX)"
+        )
+    
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        if not source.exists():
+            raise CommandError(f"Source file not found: {source}")
+        
+        output = Path(options["output"])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        
+        try:
+            nodes, edges = build_graph(read_extract(str(source)), str(output))
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(f"Wrote {nodes} nodes and {edges} road segments to {output}"))
@@ -0,0 +1,216 @@
+"""
+Run HOS what-if simulations over a file of lanes.
+    
+    python manage.py simulate_lanes lanes.csv --output results.csv
+    python manage.py simulate_lanes lanes.parquet --output results.parquet \
+        --rule-set property_70_8 --rule-set property_60_7 --resume
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from trips.services import container
+from trips.services.cache import normalize_address
+from trips.services.fleet import (
+    LANE_FIELDS,
+    completed_lanes,
+    error_row,
+    open_result_writer,
+    parse_cycle_hours,
+    read_lanes,
+    simulate_jobs
+)
+from trips.services.hos_rules import RULE_SETS
+
+
+class Command(BaseCommand):
+    help = "Simulate HOS schedules for every lane in a CSV or Parquet file"
+    
+    # Simulations sent to a worker process per task
+    JOBS_PER_TASK = 64
+    
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Lanes file (.csv or .parquet) with current, pickup and dropoff locations")
+        parser.add_argument("--output", required=True, help="Results file (.csv) or Parquet directory (.parquet)")
+        parser.add_argument(
+            "--rule-set",
+            action="append",
+            dest="rule_sets",
+            choices=sorted(RULE_SETS),
+            help="Rule set to simulate each lane under; repeat for several (default: HOS_RULE_SET)"
+        )
+        parser.add_argument(
+            "--cycle-hours",
+            type=float,
+            default=0.0,
+            help="Cycle hours for lanes without a current_cycle_hours column (default: 0)"
+        )
+        parser.add_argument(
+            "--start-hour",
+            type=float,
+            default=8.0,
+            help="Hour of day every lane departs at (default: 8)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=500, help="Lanes per chunk (default: 500)")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.BATCH_MAX_CONCURRENCY,
+            help="Concurrent geocoding/routing requests (default: BATCH_MAX_CONCURRENCY)"
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Simulation worker processes; 0 simulates in this process (default: CPU count)"
+        )
+        parser.add_argument(
+            "--estimate-routes",
+            action="store_true",
+            help="Estimate routes from straight-line distance and circuity instead of calling OSRM"
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue an existing output, skipping lanes it already has"
+        )
+    
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        if not source.exists():
+            raise CommandError(f"Source file not found: {source}")
+        
+        output = options["output"]
+        if os.path.exists(output) and not options["resume"]:
+            raise CommandError(f"Output already exists: {output} (pass --resume to continue it)")
+        if options["chunk_size"] < 1 or options["concurrency"] < 1 or options["processes"] < 0:
+            raise CommandError("--chunk-size and --concurrency must be at least 1, --processes at least 0")
+        
+        rule_sets = options["rule_sets"] or [settings.HOS_RULE_SET]
+        try:
+            done = completed_lanes(output) if options["resume"] else set()
+            writer = open_result_writer(output)
+            lanes = read_lanes(str(source))
+        except ImportError as e:
+            raise CommandError(str(e))
+        
+        pool = None
+        if options["processes"]:
+            # Workers set Django up first so spawned (non-forked) processes can import trips.services
+            pool = ProcessPoolExecutor(max_workers=options["processes"], initializer=django.setup)
+        # One set of routing threads for the whole run, not a new set per chunk
+        threads = ThreadPoolExecutor(max_workers=options["concurrency"], thread_name_prefix="lane-route")
+        processed = errors = skipped = 0
+        started = time.monotonic()
+        
+        try:
+            while True:
+                chunk = list(islice(lanes, options["chunk_size"]))
+                if not chunk:
+                    break
+                
+                rows, chunk_skipped = self._run_chunk(chunk, rule_sets, done, options, pool, threads)
+                writer.write(rows)
+                
+                processed += len(rows)
+                errors += sum(1 for row in rows if row["status"] == "error")
+                skipped += chunk_skipped
+                rate = processed / max(time.monotonic() - started, 1e-9)
+                self.stdout.write(
+                    f"{processed} results written ({errors} errors, {skipped} already done), {rate:.1f}/s"
+                )
+        except KeyError as e:
+            raise CommandError(f"Lanes file is missing column {e}")
+        finally:
+            writer.close()
+            threads.shutdown()
+            if pool is not None:
+                pool.shutdown()
+        
+        self.stdout.write(self.style.SUCCESS(f"Wrote {processed} results to {output}"))
+    
+    def _run_chunk(self, chunk, rule_sets, done, options, pool, threads):
+        """Geocode and route a chunk once per lane, then simulate it under every rule set."""
+        route_service = container.route_service
+        calculator = container.trip_calculator
+        start_hour = options["start_hour"] % 24
+        
+        rows = []
+        skipped = 0
+        pending = []
+        for lane in chunk:
+            # A rule_set column picks the profile for that lane
+            lane_rule_sets = [lane["rule_set"]] if lane.get("rule_set") else rule_sets
+            todo = [rule_set for rule_set in lane_rule_sets if (lane["lane_id"], rule_set) not in done]
+            skipped += len(lane_rule_sets) - len(todo)
+            if not todo:
+                continue
+            
+            cycle_hours = parse_cycle_hours(lane.get("current_cycle_hours"), options["cycle_hours"])
+            if cycle_hours is None:
+                rows.extend(error_row(lane["lane_id"], r, "Invalid current_cycle_hours") for r in todo)
+            elif todo[0] not in RULE_SETS:
+                rows.append(error_row(lane["lane_id"], todo[0], f"Unknown HOS rule set: {todo[0]}"))
+            else:
+                pending.append((lane, todo, cycle_hours))
+        
+        # Geocode every distinct address in the chunk once (cache, gazetteer, then Nominatim)
+        geocoded = route_service.geocode_unique(
+            [lane[field] for lane, _, _ in pending for field in LANE_FIELDS],
+            max_workers=options["concurrency"]
+        )
+        
+        routable = []
+        for lane, todo, cycle_hours in pending:
+            waypoints = [geocoded[normalize_address(lane[field])] for field in LANE_FIELDS]
+            failed = next((coords for coords in waypoints if isinstance(coords, ValueError)), None)
+            if failed is not None:
+                rows.extend(error_row(lane["lane_id"], r, str(failed)) for r in todo)
+            else:
+                routable.append((lane, todo, cycle_hours, waypoints))
+        
+        if options["estimate_routes"]:
+            # Every lane of the chunk in one vectorized call
+            routes = route_service.estimator.estimate_many([item[3] for item in routable])
+        else:
+            # Route with bounded concurrency; identical chains hit the route cache
+            routes = list(threads.map(
+                lambda item: self._try_route(route_service, item[3]), routable
+            ))
+        
+        jobs = []
+        for (lane, todo, cycle_hours, _), route in zip(routable, routes):
+            if isinstance(route, Exception):
+                rows.extend(error_row(lane["lane_id"], r, str(route)) for r in todo)
+                continue
+            stops = [
+                {key: stop[key] for key in ("type", "distance_from_start", "duration")}
+                for stop in calculator._calculate_stops(route)
+            ]
+            jobs.extend(
+                (lane["lane_id"], rule_set, cycle_hours, route["distance"], stops, start_hour)
+                for rule_set in todo
+            )
+        
+        batches = [jobs[i:i + self.JOBS_PER_TASK] for i in range(0, len(jobs), self.JOBS_PER_TASK)]
+        results = pool.map(simulate_jobs, batches) if pool is not None else map(simulate_jobs, batches)
+        for batch_rows in results:
+            rows.extend(batch_rows)
+        return rows, skipped
+    
+    @staticmethod
+    def _try_route(route_service, waypoints):
+        try:
+            return route_service.calculate_route(waypoints)
+        except Exception as e:
+            return e
+        finally:
+            # Routing threads live for the whole run; drop any connection that has gone stale
+            close_old_connections()
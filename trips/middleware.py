@@ -0,0 +1,77 @@
+"""
+Request timing middleware.
+
+Collects the stage timings recorded during a request (see
+``trips.services.metrics``) and reports them three ways: a
+``Server-Timing`` response header, one JSON log line per request on the
+``trips.requests`` logger, and the ``trips_request_seconds`` histogram.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .services.metrics import REQUEST_SECONDS, record_stage, start_timings, stop_timings
+
+logger = logging.getLogger("trips.requests")
+
+
+class TimingMiddleware:
+    """Times every request and the stages recorded while it ran."""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = start_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_timings(token)
+        self._finish(request, response, timings)
+        return response
+    
+    async def __acall__(self, request):
+        timings, token = start_timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_timings(token)
+        self._finish(request, response, timings)
+        return response
+    
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that as its own stage
+        started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: record_stage("render", time.perf_counter() - started))
+        return response
+    
+    def _finish(self, request, response, timings):
+        total = timings.elapsed()
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match is not None else "unmatched"
+        REQUEST_SECONDS.observe(total, view=view, method=request.method, status=str(response.status_code))
+        
+        if getattr(settings, "SERVER_TIMING_ENABLED", True):
+            response["Server-Timing"] = timings.server_timing(total)
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "event": "request",
+                "method": request.method,
+                "path": request.path,
+                "view": view,
+                "status": response.status_code,
+                "duration_ms": round(total * 1000, 2),
+                "stages": {name: round(seconds * 1000, 2) for name, seconds in timings.stages.items()},
+            }))
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:17
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0002_trip_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripPlan',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('request', models.JSONField()),
+                ('waypoints', models.JSONField()),
+                ('route', models.JSONField()),
+                ('geometry', models.BinaryField()),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replans', to='trips.tripplan')),
+            ],
+        ),
+    ]
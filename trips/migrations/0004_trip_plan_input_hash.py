@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0003_trip_plan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripplan',
+            name='input_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
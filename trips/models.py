@@ -1,3 +1,77 @@
+import uuid
+
 from django.db import models
 
-# This app uses stateless calculations, no models needed
+
+class GeocodeCacheEntry(models.Model):
+    """Persistent tier of the geocode cache (see trips.services.cache)."""
+
+    key = models.CharField(max_length=255, primary_key=True)
+    # Null coordinates record a failed lookup (negative cache entry)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.key
+
+
+class TripJob(models.Model):
+    """A trip calculation queued for background processing."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    request = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    error = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+
+class TripPlan(models.Model):
+    """
+    A calculated trip, kept so it can be re-planned from mid-route.
+
+    The full-resolution route geometry is stored compressed alongside the
+    response so a re-plan can reuse the remaining part of the route.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    parent = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.SET_NULL, related_name="replans"
+    )
+    # Hash of the normalized inputs (see PlanStore.key); null for plans that aren't reusable
+    input_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    request = models.JSONField()
+    # [[lat, lng], ...]: start, pickup (until completed), dropoff
+    waypoints = models.JSONField()
+    # Route distance, duration and legs; coordinates live in ``geometry``
+    route = models.JSONField()
+    # zlib-compressed float64 [lng, lat] pairs
+    geometry = models.BinaryField()
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return str(self.id)
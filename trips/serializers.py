@@ -1,8 +1,15 @@
 """
 Serializers for trip calculation API.
 """
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
+from .services.departure_optimizer import OBJECTIVES
+from .services.hos_rules import RULE_SETS
+
 
 class TripCalculationRequestSerializer(serializers.Serializer):
     """Validates incoming trip calculation requests."""
@@ -21,15 +28,185 @@ class TripCalculationRequestSerializer(serializers.Serializer):
     )
     current_cycle_hours = serializers.FloatField(
         min_value=0,
-        max_value=70,
-        help_text="Hours already used in current 70-hour cycle"
+        help_text="Hours already used in the current cycle (70 for the default rule set)"
+    )
+    rule_set = serializers.ChoiceField(
+        choices=[(name, rules.description) for name, rules in RULE_SETS.items()],
+        default=lambda: settings.HOS_RULE_SET,
+        help_text="HOS rule set to plan the trip under"
+    )
+    geometry_format = serializers.ChoiceField(
+        choices=["coordinates", "polyline"],
+        default="coordinates",
+        help_text="Route geometry as a [lng, lat] list or an encoded polyline"
+    )
+    simplify_zoom = serializers.FloatField(
+        min_value=0,
+        max_value=22,
+        allow_null=True,
+        default=lambda: settings.ROUTE_SIMPLIFY_ZOOM,
+        help_text="Simplify the route geometry for this map zoom level (null for full detail)"
+    )
+    
+    def validate(self, attrs):
+        """Ensure cycle hours fit the selected rule set's cycle."""
+        max_hours = RULE_SETS[attrs["rule_set"]].cycle_hours
+        if attrs["current_cycle_hours"] > max_hours:
+            raise serializers.ValidationError({
+                "current_cycle_hours": [f"Current cycle hours must be between 0 and {max_hours:g}"]
+            })
+        return attrs
+
+
+class TripDepartureOptimizationSerializer(TripCalculationRequestSerializer):
+    """Validates departure-time optimization requests."""
+    
+    earliest_departure = serializers.DateTimeField(
+        required=False,
+        help_text="First candidate departure (defaults to now)"
+    )
+    latest_departure = serializers.DateTimeField(
+        required=False,
+        help_text="Last candidate departure (defaults to 24 hours after the first)"
+    )
+    step_minutes = serializers.IntegerField(
+        min_value=1,
+        max_value=1440,
+        default=30,
+        help_text="Minutes between candidate departures"
+    )
+    pickup_window_start = serializers.DateTimeField(required=False, allow_null=True, default=None)
+    pickup_window_end = serializers.DateTimeField(required=False, allow_null=True, default=None)
+    dropoff_window_start = serializers.DateTimeField(required=False, allow_null=True, default=None)
+    dropoff_window_end = serializers.DateTimeField(required=False, allow_null=True, default=None)
+    objective = serializers.ChoiceField(
+        choices=OBJECTIVES,
+        default="duration",
+        help_text="Minimize elapsed trip time or the arrival time"
+    )
+    
+    def validate(self, attrs):
+        """Fill in the departure range and keep the sweep within the server limit."""
+        attrs = super().validate(attrs)
+        
+        earliest = attrs.get("earliest_departure") or timezone.now().replace(second=0, microsecond=0)
+        latest = attrs.get("latest_departure") or earliest + timedelta(hours=24)
+        if latest < earliest:
+            raise serializers.ValidationError({
+                "latest_departure": ["Must not be before earliest_departure"]
+            })
+        
+        max_candidates = settings.DEPARTURE_MAX_CANDIDATES
+        if (latest - earliest) / timedelta(minutes=attrs["step_minutes"]) + 1 > max_candidates:
+            raise serializers.ValidationError({
+                "step_minutes": [f"The departure range may contain at most {max_candidates} candidates"]
+            })
+        
+        for stop in ("pickup", "dropoff"):
+            start, end = attrs[f"{stop}_window_start"], attrs[f"{stop}_window_end"]
+            if start is not None and end is not None and end < start:
+                raise serializers.ValidationError({
+                    f"{stop}_window_end": [f"Must not be before {stop}_window_start"]
+                })
+        
+        attrs["earliest_departure"] = earliest
+        attrs["latest_departure"] = latest
+        return attrs
+
+
+class TripReplanRequestSerializer(serializers.Serializer):
+    """Validates mid-trip re-plan requests."""
+    
+    latitude = serializers.FloatField(min_value=-90, max_value=90, help_text="Current latitude")
+    longitude = serializers.FloatField(min_value=-180, max_value=180, help_text="Current longitude")
+    current_cycle_hours = serializers.FloatField(
+        min_value=0,
+        help_text="Hours used in the current cycle as of now"
+    )
+    driving_hours = serializers.FloatField(
+        min_value=0,
+        default=0,
+        help_text="Hours driven since the last 10-hour rest"
+    )
+    window_hours = serializers.FloatField(
+        min_value=0,
+        default=0,
+        help_text="Hours since the current duty window opened"
+    )
+    driving_since_break = serializers.FloatField(
+        min_value=0,
+        default=0,
+        help_text="Hours driven since the last 30-minute break"
+    )
+    pickup_completed = serializers.BooleanField(
+        default=False,
+        help_text="Whether the pickup has already been made"
+    )
+    as_of = serializers.DateTimeField(
+        required=False,
+        help_text="Time of the position report (defaults to now)"
+    )
+    geometry_format = serializers.ChoiceField(
+        choices=["coordinates", "polyline"],
+        required=False,
+        help_text="Defaults to the original plan's"
+    )
+    simplify_zoom = serializers.FloatField(
+        min_value=0,
+        max_value=22,
+        required=False,
+        help_text="Defaults to the original plan's"
+    )
+    rule_set = serializers.ChoiceField(
+        choices=[(name, rules.description) for name, rules in RULE_SETS.items()],
+        required=False,
+        help_text="Defaults to the original plan's"
+    )
+
+
+class TripBatchRequestSerializer(serializers.Serializer):
+    """Validates batch trip calculation requests."""
+    
+    trips = TripCalculationRequestSerializer(
+        many=True,
+        allow_empty=False,
+        help_text="Trip requests to calculate"
+    )
+    concurrency = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text="Maximum trips processed in parallel"
+    )
+    
+    def validate_trips(self, value):
+        """Keep batches within the configured size."""
+        max_trips = settings.BATCH_MAX_TRIPS
+        if len(value) > max_trips:
+            raise serializers.ValidationError(
+                f"A batch may contain at most {max_trips} trips"
+            )
+        return value
+    
+    def validate_concurrency(self, value):
+        """Cap requested concurrency at the server limit."""
+        return min(value, settings.BATCH_MAX_CONCURRENCY)
+
+
+class DistanceMatrixRequestSerializer(serializers.Serializer):
+    """Validates distance matrix requests."""
+    
+    locations = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        min_length=2,
+        help_text="Locations to measure between (e.g., 'Chicago, IL'), in matrix row order"
     )
     
-    def validate_current_cycle_hours(self, value):
-        """Ensure cycle hours are reasonable."""
-        if value < 0 or value > 70:
+    def validate_locations(self, value):
+        """Keep matrices within the configured size."""
+        max_locations = settings.MATRIX_MAX_LOCATIONS
+        if len(value) > max_locations:
             raise serializers.ValidationError(
-                "Current cycle hours must be between 0 and 70"
+                f"A matrix may contain at most {max_locations} locations"
             )
         return value
 
@@ -1,5 +1,6 @@
 from .trip_calculator import TripCalculator
 from .eld_simulator import ELDSimulator
 from .route_service import RouteService
+from .container import ServiceContainer, container, get_trip_calculator
 
-__all__ = ['TripCalculator', 'ELDSimulator', 'RouteService']
+__all__ = ['TripCalculator', 'ELDSimulator', 'RouteService', 'ServiceContainer', 'container', 'get_trip_calculator']
@@ -0,0 +1,405 @@
+"""
+Caching primitives shared by the trip planning services.
+
+The in-process LRU tier is shared by every service instance in a worker;
+the geocode cache adds a persistent database tier behind it so results
+survive restarts and are shared between gunicorn workers. Routes are kept
+in memory only, compressed, keyed on quantized waypoints; distance
+matrices likewise, keyed on the set of quantized locations.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sentinel returned on a cache miss (None is a valid cached value).
+MISSING = object()
+
+
+def normalize_address(address: str) -> str:
+    """Normalize an address into a cache key ('  Dallas ,TX ' -> 'dallas, tx')."""
+    key = re.sub(r"\s+", " ", address.lower()).strip()
+    key = re.sub(r"\s*,\s*", ", ", key)
+    return key.strip(" ,.")
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with per-entry TTL."""
+    
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, default=MISSING):
+        """Return the cached value for key, or default if absent/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store value under key, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def stats(self) -> Dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class GeocodeCache:
+    """
+    Two-tier geocode cache keyed on the normalized address.
+    
+    Lookups hit the in-process LRU first, then the persistent database
+    tier (``GeocodeCacheEntry``). Failed lookups are cached as ``None``
+    with a shorter TTL so unknown addresses don't hammer Nominatim.
+    """
+    
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: float = 30 * 24 * 3600,
+        negative_ttl: float = 3600,
+        persistent: bool = True
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.persistent = persistent
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.persistent_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+    
+    def get(self, address: str):
+        """
+        Return cached coordinates for an address.
+        
+        Returns a (lat, lng) tuple on a hit, None for a cached failure,
+        or MISSING when the address has not been seen.
+        """
+        key = normalize_address(address)
+        value = self.memory.get(key)
+        if value is MISSING and self.persistent:
+            value = self._load_into_memory(key)
+        return self._count(value)
+    
+    async def aget(self, address: str):
+        """Async version of get(); only the database tier runs in a thread."""
+        from asgiref.sync import sync_to_async
+        
+        key = normalize_address(address)
+        value = self.memory.get(key)
+        if value is MISSING and self.persistent:
+            value = await sync_to_async(self._load_into_memory)(key)
+        return self._count(value)
+    
+    def _load_into_memory(self, key: str):
+        value = self._load(key)
+        if value is not MISSING:
+            self.persistent_hits += 1
+            self.memory.set(key, value, ttl=self.negative_ttl if value is None else None)
+        return value
+    
+    def _count(self, value):
+        if value is MISSING:
+            self.misses += 1
+        elif value is None:
+            self.negative_hits += 1
+        return value
+    
+    def set(self, address: str, coords: Optional[Tuple[float, float]]):
+        """Cache coordinates for an address; pass None to cache a failed lookup."""
+        key = normalize_address(address)
+        ttl = self.negative_ttl if coords is None else self.ttl
+        self.memory.set(key, coords, ttl=ttl)
+        if self.persistent:
+            self._store(key, coords, ttl)
+    
+    async def aset(self, address: str, coords: Optional[Tuple[float, float]]):
+        """Async version of set(); only the database tier runs in a thread."""
+        from asgiref.sync import sync_to_async
+        
+        if self.persistent:
+            await sync_to_async(self.set)(address, coords)
+        else:
+            self.set(address, coords)
+    
+    def clear(self):
+        self.memory.clear()
+        self.persistent_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "persistent_hits": self.persistent_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+        }
+    
+    def _load(self, key: str):
+        from django.db import DatabaseError
+        from django.utils import timezone
+        from ..models import GeocodeCacheEntry
+        
+        try:
+            entry = GeocodeCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        except DatabaseError as e:
+            self._disable_persistent(e)
+            return MISSING
+        
+        if entry is None:
+            return MISSING
+        if entry.latitude is None or entry.longitude is None:
+            return None
+        return (entry.latitude, entry.longitude)
+    
+    def _store(self, key: str, coords: Optional[Tuple[float, float]], ttl: float):
+        from django.db import DatabaseError
+        from django.utils import timezone
+        from ..models import GeocodeCacheEntry
+        
+        lat, lng = coords if coords is not None else (None, None)
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    "latitude": lat,
+                    "longitude": lng,
+                    "expires_at": timezone.now() + timedelta(seconds=ttl),
+                }
+            )
+        except DatabaseError as e:
+            self._disable_persistent(e)
+    
+    def _disable_persistent(self, error: Exception):
+        # Typically an unmigrated database; keep serving from memory.
+        logger.warning("Geocode cache database tier disabled: %s", error)
+        self.persistent = False
+
+
+class RouteCache:
+    """
+    Size-bounded cache of routed results keyed on quantized waypoints.
+    
+    Route metadata is stored as zlib-compressed JSON and the geometry as
+    zlib-compressed float64 bytes, so each hit returns a fresh copy.
+    Entries older than ``ttl`` but younger than ``ttl + stale_ttl`` are
+    served stale while a background thread refreshes them.
+    """
+    
+    def __init__(
+        self,
+        maxsize: int = 512,
+        precision: int = 3,
+        ttl: float = 6 * 3600,
+        stale_ttl: float = 24 * 3600
+    ):
+        self.precision = precision
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self.stale_hits = 0
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+    
+    def key(self, waypoints: List[Tuple[float, float]]) -> Tuple:
+        """Quantize (lat, lng) waypoints to the configured number of decimals."""
+        return tuple((round(lat, self.precision), round(lng, self.precision)) for lat, lng in waypoints)
+    
+    def get(self, key: Tuple) -> Tuple[Optional[Dict], bool]:
+        """Return (route, is_fresh); route is None on a miss."""
+        entry = self.memory.get(key)
+        if entry is MISSING:
+            return None, False
+        blob, stored_at = entry
+        fresh = time.monotonic() - stored_at < self.ttl
+        if not fresh:
+            self.stale_hits += 1
+        return self._unpack(blob), fresh
+    
+    def set(self, key: Tuple, route: Dict):
+        self.memory.set(key, (self._pack(route), time.monotonic()))
+    
+    def _pack(self, route: Dict) -> Tuple[bytes, bytes]:
+        meta = {k: v for k, v in route.items() if k != "coordinates"}
+        coords = np.ascontiguousarray(route["coordinates"], dtype=np.float64)
+        return (
+            zlib.compress(json.dumps(meta, separators=(",", ":")).encode()),
+            zlib.compress(coords.tobytes()),
+        )
+    
+    def _unpack(self, blob: Tuple[bytes, bytes]) -> Dict:
+        meta, coords = blob
+        route = json.loads(zlib.decompress(meta))
+        route["coordinates"] = np.frombuffer(zlib.decompress(coords), dtype=np.float64).reshape(-1, 2)
+        return route
+    
+    def refresh(self, key: Tuple, fetch: Callable[[], Dict]):
+        """Re-fetch a stale entry in the background (one refresh per key at a time)."""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def run():
+            try:
+                self.set(key, fetch())
+            except Exception as e:
+                logger.warning("Route cache refresh failed: %s", e)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def clear(self):
+        self.memory.clear()
+        self.stale_hits = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "stale_hits": self.stale_hits}
+
+
+class MatrixCache:
+    """
+    Size-bounded cache of distance/duration matrices keyed on a set of locations.
+    
+    Locations are quantized like route waypoints and sorted, so the same
+    places requested in another order are a hit: each matrix is stored
+    once, in sorted location order, as a single float32 (2, n, n) array
+    of [distances, durations] and permuted back to the caller's order.
+    """
+    
+    def __init__(self, maxsize: int = 128, precision: int = 3, ttl: float = 6 * 3600):
+        self.precision = precision
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+    
+    def _canonical(self, waypoints: List[Tuple[float, float]]) -> Tuple[Tuple, np.ndarray]:
+        """The cache key and the caller-to-sorted order of the locations."""
+        quantized = [(round(lat, self.precision), round(lng, self.precision)) for lat, lng in waypoints]
+        order = np.array(sorted(range(len(quantized)), key=quantized.__getitem__), dtype=np.intp)
+        return tuple(quantized[i] for i in order), order
+    
+    def get(self, waypoints: List[Tuple[float, float]]) -> Optional[Dict]:
+        """Return {"distances", "durations", "source"} in the caller's order, or None on a miss."""
+        key, order = self._canonical(waypoints)
+        entry = self.memory.get(key)
+        if entry is MISSING:
+            return None
+        matrix, source = entry
+        back = np.argsort(order)
+        matrix = matrix[:, back][:, :, back].astype(np.float64)
+        return {"distances": matrix[0], "durations": matrix[1], "source": source}
+    
+    def set(self, waypoints: List[Tuple[float, float]], result: Dict):
+        key, order = self._canonical(waypoints)
+        matrix = np.stack((result["distances"], result["durations"])).astype(np.float32)
+        self.memory.set(key, (np.ascontiguousarray(matrix[:, order][:, :, order]), result["source"]))
+    
+    def clear(self):
+        self.memory.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats()}
+
+
+_default_geocode_cache = None
+_default_route_cache = None
+_default_matrix_cache = None
+_default_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """Return the process-wide geocode cache configured from Django settings."""
+    global _default_geocode_cache
+    if _default_geocode_cache is None:
+        with _default_lock:
+            if _default_geocode_cache is None:
+                from django.conf import settings
+                _default_geocode_cache = GeocodeCache(
+                    maxsize=getattr(settings, "GEOCODE_CACHE_SIZE", 2048),
+                    ttl=getattr(settings, "GEOCODE_CACHE_TTL", 30 * 24 * 3600),
+                    negative_ttl=getattr(settings, "GEOCODE_CACHE_NEGATIVE_TTL", 3600),
+                    persistent=getattr(settings, "GEOCODE_CACHE_PERSISTENT", True),
+                )
+    return _default_geocode_cache
+
+
+def get_route_cache() -> RouteCache:
+    """Return the process-wide route cache configured from Django settings."""
+    global _default_route_cache
+    if _default_route_cache is None:
+        with _default_lock:
+            if _default_route_cache is None:
+                from django.conf import settings
+                _default_route_cache = RouteCache(
+                    maxsize=getattr(settings, "ROUTE_CACHE_SIZE", 512),
+                    precision=getattr(settings, "ROUTE_CACHE_PRECISION", 3),
+                    ttl=getattr(settings, "ROUTE_CACHE_TTL", 6 * 3600),
+                    stale_ttl=getattr(settings, "ROUTE_CACHE_STALE_TTL", 24 * 3600),
+                )
+    return _default_route_cache
+
+
+def get_matrix_cache() -> MatrixCache:
+    """Return the process-wide distance matrix cache configured from Django settings."""
+    global _default_matrix_cache
+    if _default_matrix_cache is None:
+        with _default_lock:
+            if _default_matrix_cache is None:
+                from django.conf import settings
+                _default_matrix_cache = MatrixCache(
+                    maxsize=getattr(settings, "MATRIX_CACHE_SIZE", 128),
+                    precision=getattr(settings, "ROUTE_CACHE_PRECISION", 3),
+                    ttl=getattr(settings, "MATRIX_CACHE_TTL", 6 * 3600),
+                )
+    return _default_matrix_cache
+
+
+def reset_caches():
+    """Drop the process-wide caches; the next lookup rebuilds them from settings."""
+    global _default_geocode_cache, _default_route_cache, _default_matrix_cache
+    with _default_lock:
+        _default_geocode_cache = None
+        _default_route_cache = None
+        _default_matrix_cache = None
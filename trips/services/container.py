@@ -0,0 +1,83 @@
+"""
+Application-scoped service container.
+
+Services are built once per worker process and shared by every request,
+so caches, connection pools and the Nominatim rate limiter stay warm
+across requests instead of being rebuilt per call.
+
+A worker rebuilds its services on SIGHUP (see trips.apps), for instance
+after ``build_gazetteer`` or ``build_road_graph`` has written a new
+index. In tests, overriding a service setting rebuilds them too.
+"""
+import threading
+
+from django.conf import settings
+
+from .cache import reset_caches
+from .eld_simulator import ELDSimulator
+from .gazetteer import reset_gazetteer
+from .hos_rules import DEFAULT_RULE_SET
+from .http_client import reset_session
+from .rate_limit import reset_nominatim_limiter
+from .resilience import reset_upstreams
+from .road_graph import reset_road_graph
+from .route_estimate import reset_route_estimator
+from .route_service import RouteService
+from .trip_calculator import TripCalculator
+
+
+class ServiceContainer:
+    """Thread-safe holder for the long-lived trip planning services."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trip_calculator = None
+    
+    @property
+    def trip_calculator(self) -> TripCalculator:
+        calculator = self._trip_calculator
+        if calculator is None:
+            with self._lock:
+                if self._trip_calculator is None:
+                    self._trip_calculator = self._build()
+                calculator = self._trip_calculator
+        return calculator
+    
+    @property
+    def route_service(self) -> RouteService:
+        return self.trip_calculator.route_service
+    
+    @property
+    def eld_simulator(self) -> ELDSimulator:
+        return self.trip_calculator.eld_simulator
+    
+    def reload(self, clear_caches: bool = False):
+        """
+        Rebuild services from the current settings.
+        
+        The new services are swapped in atomically; requests already holding
+        the old ones finish with them. Caches stay warm unless
+        ``clear_caches`` is set.
+        """
+        with self._lock:
+            reset_session()
+            reset_nominatim_limiter()
+            reset_upstreams()
+            reset_route_estimator()
+            reset_gazetteer()
+            reset_road_graph()
+            if clear_caches:
+                reset_caches()
+            self._trip_calculator = self._build()
+    
+    def _build(self) -> TripCalculator:
+        rule_set = getattr(settings, "HOS_RULE_SET", DEFAULT_RULE_SET)
+        return TripCalculator(route_service=RouteService(), eld_simulator=ELDSimulator(rule_set))
+
+
+container = ServiceContainer()
+
+
+def get_trip_calculator() -> TripCalculator:
+    """Return the worker-wide TripCalculator."""
+    return container.trip_calculator
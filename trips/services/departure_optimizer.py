@@ -0,0 +1,147 @@
+"""
+Departure-time optimization.
+
+Sweeps candidate departure times over a trip that has already been
+geocoded, routed and given its stops; only the HOS simulation is re-run
+per candidate. A simulation depends on the departure only through the
+hour of day (cycle day boundaries) and the appointment offsets, so
+candidates that share both share one simulation.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .eld_simulator import ELDSimulator, Schedule
+
+# (opens, closes); either end may be None
+Window = Tuple[Optional[datetime], Optional[datetime]]
+
+OBJECTIVES = ("duration", "arrival")
+
+
+def departure_candidates(earliest: datetime, latest: datetime, step_minutes: int) -> List[datetime]:
+    """Departure times from ``earliest`` to ``latest`` (inclusive) every ``step_minutes``."""
+    step = timedelta(minutes=step_minutes)
+    count = int((latest - earliest) / step) + 1
+    return [earliest + step * i for i in range(max(count, 1))]
+
+
+class DepartureCandidate:
+    """One evaluated departure time."""
+    
+    __slots__ = ("departure", "schedule", "stops", "lateness")
+    
+    def __init__(self, departure: datetime, schedule: Schedule, stops: List[Dict], lateness: float):
+        self.departure = departure
+        self.schedule = schedule
+        self.stops = stops
+        self.lateness = lateness  # Hours past the close of every window, summed
+    
+    @property
+    def feasible(self) -> bool:
+        return self.lateness <= ELDSimulator.EPSILON
+    
+    @property
+    def arrival(self) -> datetime:
+        return self.departure + timedelta(hours=self.schedule.total_hours)
+    
+    def to_dict(self) -> Dict:
+        return {
+            "departure": self.departure.isoformat(),
+            "arrival": self.arrival.isoformat(),
+            "total_hours": round(self.schedule.total_hours, 2),
+            "lateness_hours": round(self.lateness, 2),
+            "feasible": self.feasible
+        }
+
+
+class DepartureOptimizer:
+    """Finds the best departure time for a trip under one simulator's rules."""
+    
+    def __init__(self, simulator: ELDSimulator):
+        self.simulator = simulator
+        self.simulations = 0
+    
+    def sweep(
+        self,
+        stops: List[Dict],
+        current_cycle_hours: float,
+        departures: List[datetime],
+        windows: Dict[int, Window] = None
+    ) -> List[DepartureCandidate]:
+        """
+        Simulate the trip for every departure time.
+        
+        Args:
+            stops: Stops from TripCalculator._calculate_stops
+            current_cycle_hours: Hours already used in current cycle
+            departures: Candidate departure times
+            windows: Appointment window per stop index; the driver waits
+                for a window to open and is late after it closes
+        
+        Returns:
+            One DepartureCandidate per departure, in input order
+        """
+        windows = windows or {}
+        memo = {}
+        candidates = []
+        
+        for departure in departures:
+            start_hour = self.simulator.hour_of_day(departure)
+            opens = {
+                i: self._offset(opened, departure)
+                for i, (opened, _) in windows.items()
+                if opened is not None
+            }
+            key = (round(start_hour, 6), tuple(sorted((i, round(h, 6)) for i, h in opens.items())))
+            
+            cached = memo.get(key)
+            if cached is None:
+                trip_stops = [
+                    dict(stop, not_before=opens[i]) if i in opens else stop
+                    for i, stop in enumerate(stops)
+                ]
+                schedule = self.simulator.simulate(trip_stops, current_cycle_hours, start_hour)
+                self.simulations += 1
+                cached = memo[key] = (schedule, trip_stops)
+            schedule, trip_stops = cached
+            
+            candidates.append(DepartureCandidate(
+                departure, schedule, trip_stops, self._lateness(schedule, departure, windows, opens)
+            ))
+        
+        return candidates
+    
+    @staticmethod
+    def rank(candidates: List[DepartureCandidate], objective: str = "duration") -> List[DepartureCandidate]:
+        """
+        Order candidates best first.
+        
+        Candidates that meet every window come first; among them the
+        objective decides: "duration" (shortest elapsed time) or "arrival"
+        (earliest finish). Ties go to the earlier departure.
+        """
+        if objective == "arrival":
+            key = lambda c: (round(c.lateness, 6), c.arrival, c.departure)
+        else:
+            key = lambda c: (round(c.lateness, 6), round(c.schedule.total_hours, 6), c.departure)
+        return sorted(candidates, key=key)
+    
+    @staticmethod
+    def _offset(moment: datetime, departure: datetime) -> float:
+        return (moment - departure).total_seconds() / 3600
+    
+    def _lateness(
+        self,
+        schedule: Schedule,
+        departure: datetime,
+        windows: Dict[int, Window],
+        opens: Dict[int, float]
+    ) -> float:
+        lateness = 0.0
+        for i, (_, closes) in windows.items():
+            if closes is None:
+                continue
+            # Service starts on arrival, or when the window opens
+            service_start = max(schedule.arrivals[i], opens.get(i, 0.0))
+            lateness += max(0.0, service_start - self._offset(closes, departure))
+        return lateness
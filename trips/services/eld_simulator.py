@@ -1,20 +1,163 @@
 """
 ELD (Electronic Logging Device) simulation service.
 Implements HOS (Hours of Service) regulations for property-carrying drivers.
+
+The simulation works on a compact event stream (``DutyEvent`` with float
+hours since trip start). Dates, dicts and ISO strings are only produced
+when the daily logs are rendered for the API, so what-if loops can call
+``simulate()`` directly without paying for them.
 """
-from typing import List, Dict
+import math
+from typing import List, Dict, Union
 from datetime import datetime, timedelta
+from django.utils import timezone
+from .hos_rules import DEFAULT_RULE_SET, HOSRules, get_rule_set
+
+
+class DutyEvent:
+    """One duty status interval, in hours since the trip started."""
+    
+    __slots__ = ("status", "start", "end", "description")
+    
+    def __init__(self, status: str, start: float, end: float, description: str):
+        self.status = status
+        self.start = start
+        self.end = end
+        self.description = description
+    
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Schedule:
+    """Result of a simulation: the event stream, arrival at each stop and final counters."""
+    
+    __slots__ = ("events", "total_hours", "final_cycle_hours", "arrivals")
+    
+    def __init__(
+        self,
+        events: List[DutyEvent],
+        total_hours: float,
+        final_cycle_hours: float,
+        arrivals: List[float] = None
+    ):
+        self.events = events
+        self.total_hours = total_hours
+        self.final_cycle_hours = final_cycle_hours
+        self.arrivals = arrivals if arrivals is not None else []
+
+
+class DutyStatus:
+    """A driver's HOS counters when a simulation starts, e.g. mid-trip."""
+    
+    __slots__ = ("driving_hours", "window_hours", "driving_since_break")
+    
+    def __init__(self, driving_hours: float = 0.0, window_hours: float = 0.0, driving_since_break: float = 0.0):
+        self.driving_hours = driving_hours  # Driving since the last required rest
+        self.window_hours = window_hours  # Time since the duty window opened
+        self.driving_since_break = driving_since_break
+
+
+class DutyState:
+    """
+    Incremental HOS counters carried through a simulation.
+    
+    Every counter is updated as events are appended, so checking a limit
+    never re-scans earlier events.
+    """
+    
+    __slots__ = (
+        "t", "events", "start_hour", "driving", "window_start", "since_break",
+        "cycle_days", "day_hours", "cycle_total", "split_end", "split_driving", "split_first"
+    )
+    
+    def __init__(
+        self,
+        cycle_days: int,
+        current_cycle_hours: float,
+        start_hour: float,
+        status: DutyStatus = None
+    ):
+        self.t = 0.0
+        self.events = []
+        self.start_hour = start_hour
+        self.driving = 0.0  # Since the last required rest
+        self.window_start = None  # When the current duty window opened
+        self.since_break = 0.0  # Driving since the last qualifying break
+        self.cycle_days = cycle_days
+        # On-duty hours per calendar day (oldest first). Hours used before
+        # the trip are booked on the previous day, so they roll off last.
+        self.day_hours = {int(start_hour // 24) - 1: current_cycle_hours}
+        self.cycle_total = current_cycle_hours
+        self.split_end = None  # End of a pending sleeper-berth split period
+        self.split_driving = 0.0  # Driving done before that period
+        self.split_first = None  # Status of that period (sleeper or off duty)
+        
+        if status is not None:
+            self.driving = status.driving_hours
+            self.window_start = -status.window_hours if status.window_hours > 0 else None
+            self.since_break = status.driving_since_break
+    
+    def on_duty(self, hours: float, status: str, description: str):
+        """Append an on-duty (or driving) event and book its hours by day."""
+        start = self.t
+        self.t += hours
+        self.events.append(DutyEvent(status, start, self.t, description))
+        if self.window_start is None:
+            self.window_start = start
+        
+        begin = start + self.start_hour
+        finish = self.t + self.start_hour
+        while finish > begin:
+            day = int(begin // 24)
+            segment_end = min(finish, (day + 1) * 24)
+            self.day_hours[day] = self.day_hours.get(day, 0.0) + segment_end - begin
+            self.cycle_total += segment_end - begin
+            begin = segment_end
+    
+    def off_duty(self, hours: float, status: str, description: str):
+        """Append an off-duty (or sleeper) event."""
+        start = self.t
+        self.t += hours
+        self.events.append(DutyEvent(status, start, self.t, description))
+    
+    def cycle_used(self) -> float:
+        """On-duty hours inside the rolling cycle ending now."""
+        oldest = int((self.t + self.start_hour) // 24) - self.cycle_days + 1
+        for day in list(self.day_hours):
+            if day >= oldest:
+                break
+            self.cycle_total -= self.day_hours.pop(day)
+        return self.cycle_total
+    
+    def restart_cycle(self):
+        self.day_hours.clear()
+        self.cycle_total = 0.0
+    
+    def reset_duty_period(self):
+        """Start a fresh duty period after a full rest."""
+        self.driving = 0.0
+        self.window_start = None
+        self.since_break = 0.0
+        self.split_end = None
 
 
 class ELDSimulator:
     """
     Simulates ELD logs based on HOS regulations.
     
-    Regulations (Property-Carrying):
+    Default regulations (Property-Carrying, see hos_rules.PROPERTY_70_8):
     - 11-hour driving limit
-    - 14-hour on-duty limit
+    - 14-hour on-duty window
+    - 30-minute break after 8 hours of driving
     - 10-hour rest break required
-    - 70 hours / 8 days cycle
+    - 70 hours / 8 days cycle, reset by a 34-hour restart
+    
+    Other profiles are selected by passing a rule set or its registered
+    name. Drive segments are split at the exact moment a limit is reached
+    and the required break, rest or restart is inserted before driving
+    resumes.
     """
     
     # Duty statuses
@@ -23,18 +166,40 @@ class ELDSimulator:
     DRIVING = "driving"
     ON_DUTY = "on_duty"
     
-    def __init__(self):
-        self.max_driving_hours = 11
-        self.max_on_duty_hours = 14
-        self.required_rest_hours = 10
-        self.max_cycle_hours = 70
+    # Descriptions of the events the rules insert
+    BREAK_DESCRIPTION = "30-minute break"
+    REST_DESCRIPTION = "Required rest break"
+    RESTART_DESCRIPTION = "{hours:g}-hour restart"
+    
+    AVERAGE_SPEED_MPH = 60
+    
+    # Tolerance for floating point hour comparisons
+    EPSILON = 1e-9
+    
+    def __init__(self, rules: Union[HOSRules, str] = DEFAULT_RULE_SET):
+        if isinstance(rules, str):
+            rules = get_rule_set(rules)
+        self.rules = rules
+        self.max_driving_hours = rules.max_driving_hours
+        self.max_on_duty_hours = rules.duty_window_hours
+        self.required_rest_hours = rules.required_rest_hours
+        self.max_cycle_hours = rules.cycle_hours
+        
+        # Resolve optional rules once so the drive loop never checks for them
+        self._break_after = (
+            rules.break_after_driving_hours if rules.break_after_driving_hours is not None else math.inf
+        )
+        self._rest = self._split_rest if rules.sleeper_split else self._full_rest
+        self._break = self._split_break if rules.sleeper_split else self._short_break
+        self._reset_cycle = self._restart if rules.restart_hours is not None else self._wait_for_cycle
     
     def simulate_trip(
         self,
         total_distance: float,
         stops: List[Dict],
         current_cycle_hours: float,
-        start_time: datetime = None
+        start_time: datetime = None,
+        status: DutyStatus = None
     ) -> Dict:
         """
         Simulate ELD logs for entire trip.
@@ -43,158 +208,251 @@ class ELDSimulator:
             total_distance: Total trip distance in miles
             stops: List of stops with type, duration, distance_from_start
             current_cycle_hours: Hours already used in current cycle
-            start_time: Trip start time (defaults to now)
+            start_time: Trip start time (defaults to now); days are split in the
+                server's TIME_ZONE, naive times are taken to be in it already
+            status: Driver's duty counters at start_time (defaults to fresh)
         
         Returns:
             Dict with daily_logs and summary
         """
         if start_time is None:
-            start_time = datetime.now().replace(minute=0, second=0, microsecond=0)
+            start_time = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        elif timezone.is_aware(start_time):
+            start_time = timezone.localtime(start_time)
         
-        # Initialize tracking
-        current_time = start_time
-        current_cycle = current_cycle_hours
-        daily_driving = 0
-        daily_on_duty = 0
-        current_distance = 0
+        schedule = self.simulate(stops, current_cycle_hours, self.hour_of_day(start_time), status)
+        end_time = start_time + timedelta(hours=schedule.total_hours)
+        daily_logs = self._daily_logs(schedule.events, start_time)
         
-        events = []
-        daily_logs = []
-        current_day_events = []
-        current_day_start = start_time.date()
+        return {
+            "daily_logs": daily_logs,
+            "summary": {
+                "total_days": len(daily_logs),
+                "final_cycle_hours": round(schedule.final_cycle_hours, 2),
+                "cycle_hours_remaining": round(self.max_cycle_hours - schedule.final_cycle_hours, 2),
+                "rule_set": self.rules.name,
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat()
+            }
+        }
+    
+    def simulate(
+        self,
+        stops: List[Dict],
+        current_cycle_hours: float,
+        start_hour: float = 0.0,
+        status: DutyStatus = None
+    ) -> Schedule:
+        """
+        Build the duty event stream for a trip without rendering it.
+        
+        Args:
+            stops: List of stops with type, duration, distance_from_start
+                and optionally not_before (appointment, hours since start)
+            current_cycle_hours: Hours already used in current cycle
+            start_hour: Hour of day the trip starts at (for day boundaries)
+            status: Driver's duty counters at the start (defaults to fresh)
+        
+        Returns:
+            Schedule with events in hours since trip start
+        """
+        state = DutyState(self.rules.cycle_days, current_cycle_hours, start_hour, status)
+        arrivals = []
+        current_distance = 0
         
         # Process each stop
-        for i, stop in enumerate(stops):
-            # Calculate driving to this stop
+        for stop in stops:
+            # Drive to this stop
             distance_to_stop = stop["distance_from_start"] - current_distance
-            
             if distance_to_stop > 0:
-                # Check if we need rest before driving
-                if daily_driving >= self.max_driving_hours or daily_on_duty >= self.max_on_duty_hours:
-                    # Take required rest
-                    rest_event = self._create_rest_event(current_time, self.required_rest_hours)
-                    current_day_events.append(rest_event)
-                    current_time = rest_event["end_time"]
-                    
-                    # Check if we crossed into a new day
-                    if current_time.date() != current_day_start:
-                        daily_logs.append(self._create_daily_log(current_day_start, current_day_events))
-                        current_day_events = []
-                        current_day_start = current_time.date()
-                    
-                    # Reset daily counters
-                    daily_driving = 0
-                    daily_on_duty = 0
-                
-                # Drive to stop
-                drive_hours = distance_to_stop / 60  # Assume 60 mph
-                drive_event = {
-                    "status": self.DRIVING,
-                    "start_time": current_time,
-                    "end_time": current_time + timedelta(hours=drive_hours),
-                    "duration": drive_hours,
-                    "description": f"Driving to {stop['type']}"
-                }
-                
-                current_day_events.append(drive_event)
-                current_time = drive_event["end_time"]
-                daily_driving += drive_hours
-                daily_on_duty += drive_hours
-                current_cycle += drive_hours
+                self._drive(state, distance_to_stop / self.AVERAGE_SPEED_MPH, f"Driving to {stop['type']}")
                 current_distance = stop["distance_from_start"]
-                
-                # Check day boundary
-                if current_time.date() != current_day_start:
-                    daily_logs.append(self._create_daily_log(current_day_start, current_day_events))
-                    current_day_events = []
-                    current_day_start = current_time.date()
-                    daily_driving = 0
-                    daily_on_duty = 0
+            arrivals.append(state.t)
+            
+            # Wait off duty for the appointment
+            not_before = stop.get("not_before")
+            if not_before is not None and not_before > state.t + self.EPSILON:
+                self._wait(state, not_before - state.t)
             
             # Handle stop activity
             if stop["duration"] > 0:
-                stop_event = {
-                    "status": self.ON_DUTY,
-                    "start_time": current_time,
-                    "end_time": current_time + timedelta(hours=stop["duration"]),
-                    "duration": stop["duration"],
-                    "description": stop["type"]
-                }
-                
-                current_day_events.append(stop_event)
-                current_time = stop_event["end_time"]
-                daily_on_duty += stop["duration"]
-                current_cycle += stop["duration"]
-                
-                # Check day boundary
-                if current_time.date() != current_day_start:
-                    daily_logs.append(self._create_daily_log(current_day_start, current_day_events))
-                    current_day_events = []
-                    current_day_start = current_time.date()
-                    daily_driving = 0
-                    daily_on_duty = 0
+                state.on_duty(stop["duration"], self.ON_DUTY, stop["type"])
+                # On-duty time that isn't driving counts toward the 30-minute break
+                if stop["duration"] >= self.rules.break_hours - self.EPSILON:
+                    state.since_break = 0.0
         
-        # Add final day if there are remaining events
-        if current_day_events:
-            daily_logs.append(self._create_daily_log(current_day_start, current_day_events))
+        return Schedule(state.events, state.t, state.cycle_used(), arrivals)
+    
+    def _drive(self, state: DutyState, hours: float, description: str):
+        """Drive for ``hours``, stopping for breaks, rests and restarts as the rules require."""
+        rules = self.rules
+        remaining = hours
         
-        return {
-            "daily_logs": daily_logs,
-            "summary": {
-                "total_days": len(daily_logs),
-                "final_cycle_hours": round(current_cycle, 2),
-                "cycle_hours_remaining": round(self.max_cycle_hours - current_cycle, 2),
-                "start_time": start_time.isoformat(),
-                "end_time": current_time.isoformat()
-            }
-        }
+        while remaining > self.EPSILON:
+            window_used = state.t - state.window_start if state.window_start is not None else 0.0
+            driving_left = rules.max_driving_hours - state.driving
+            window_left = rules.duty_window_hours - window_used
+            cycle_left = rules.cycle_hours - state.cycle_used()
+            break_left = self._break_after - state.since_break
+            available = min(driving_left, window_left, cycle_left, break_left)
+            
+            if available <= self.EPSILON:
+                if cycle_left <= self.EPSILON:
+                    self._reset_cycle(state)
+                elif driving_left <= self.EPSILON or window_left <= self.EPSILON:
+                    self._rest(state, driving_left)
+                else:
+                    self._break(state, driving_left, window_left)
+                continue
+            
+            segment = min(available, remaining)
+            state.on_duty(segment, self.DRIVING, description)
+            state.driving += segment
+            state.since_break += segment
+            remaining -= segment
     
-    def _create_rest_event(self, start_time: datetime, duration: float) -> Dict:
-        """Create a rest/sleeper event."""
-        return {
-            "status": self.SLEEPER,
-            "start_time": start_time,
-            "end_time": start_time + timedelta(hours=duration),
-            "duration": duration,
-            "description": "Required rest break"
-        }
+    def _wait(self, state: DutyState, hours: float):
+        """Wait off duty; a long enough wait counts as the break or the required rest."""
+        state.off_duty(hours, self.OFF_DUTY, "Waiting for appointment")
+        if hours >= self.rules.required_rest_hours - self.EPSILON:
+            state.reset_duty_period()
+        elif hours >= self.rules.break_hours - self.EPSILON:
+            state.since_break = 0.0
+    
+    def _short_break(self, state: DutyState, driving_left: float, window_left: float):
+        state.off_duty(self.rules.break_hours, self.OFF_DUTY, self.BREAK_DESCRIPTION)
+        state.since_break = 0.0
+    
+    def _full_rest(self, state: DutyState, driving_left: float):
+        """Take the required rest, resetting the driving limit, duty window and break."""
+        state.off_duty(self.rules.required_rest_hours, self.SLEEPER, self.REST_DESCRIPTION)
+        state.reset_duty_period()
+    
+    def _split_break(self, state: DutyState, driving_left: float, window_left: float):
+        """
+        Take the break as the short split period when the window would end the day first.
+        
+        The short period satisfies the 30-minute break and stops the window
+        clock, so the remaining driving hours fit inside the day.
+        """
+        if state.split_end is None and window_left < driving_left:
+            self._split_period(state, self.OFF_DUTY)
+        else:
+            self._short_break(state, driving_left, window_left)
+    
+    def _split_rest(self, state: DutyState, driving_left: float):
+        """
+        Rest using the sleeper-berth split.
+        
+        Completes a pending pair with its other period; otherwise starts a
+        pair with the sleeper period if driving hours remain, or takes a
+        full rest when the driving limit is what stopped the truck.
+        """
+        if state.split_end is not None:
+            self._split_period(state, self.SLEEPER if state.split_first == self.OFF_DUTY else self.OFF_DUTY)
+        elif driving_left > self.EPSILON:
+            self._split_period(state, self.SLEEPER)
+        else:
+            self._full_rest(state, driving_left)
     
-    def _create_daily_log(self, date, events: List[Dict]) -> Dict:
-        """Create a daily log from events."""
-        # Convert events to timeline format (0-24 hours)
+    def _split_period(self, state: DutyState, status: str):
+        """
+        Take one period of a sleeper-berth split.
+        
+        Neither period counts against the duty window. Once the pair is
+        complete, the driving limit and window are recomputed from the end
+        of the first period.
+        """
+        sleeper, off_duty = self.rules.sleeper_split
+        hours = sleeper if status == self.SLEEPER else off_duty
+        description = f"Sleeper berth ({hours:g} hours)" if status == self.SLEEPER else f"Split rest ({hours:g} hours)"
+        state.off_duty(hours, status, description)
+        state.since_break = 0.0
+        
+        if state.split_end is None:
+            if state.window_start is not None:
+                state.window_start += hours
+            state.split_end = state.t
+            state.split_driving = state.driving
+            state.split_first = status
+        else:
+            state.driving -= state.split_driving
+            state.window_start = state.split_end + hours
+            state.split_end = None
+    
+    def _restart(self, state: DutyState):
+        """Take the restart, which gives back the whole cycle."""
+        hours = self.rules.restart_hours
+        state.off_duty(hours, self.OFF_DUTY, self.RESTART_DESCRIPTION.format(hours=hours))
+        state.restart_cycle()
+        state.reset_duty_period()
+    
+    def _wait_for_cycle(self, state: DutyState):
+        """Without a restart, stay off duty until midnight, when the oldest day leaves the cycle."""
+        until_midnight = 24 - (state.t + state.start_hour) % 24
+        state.off_duty(max(until_midnight, self.rules.required_rest_hours), self.OFF_DUTY, "Off duty (cycle limit)")
+        state.reset_duty_period()
+    
+    def _daily_logs(self, events: List[DutyEvent], start_time: datetime) -> List[Dict]:
+        """
+        Render events as one log per calendar day in a single linear pass.
+        
+        Events crossing midnight are split so each day's timeline covers
+        only that day (0-24 hours).
+        """
+        start_hour = self.hour_of_day(start_time)
+        first_date = start_time.date()
+        daily_logs = []
+        
+        day = None
         timeline = []
+        driving_hours = 0.0
+        on_duty_hours = 0.0
         
         for event in events:
-            start_hour = event["start_time"].hour + event["start_time"].minute / 60
-            end_hour = event["end_time"].hour + event["end_time"].minute / 60
+            begin = event.start + start_hour
+            finish = event.end + start_hour
             
-            # Handle events that span midnight
-            if event["end_time"].date() > event["start_time"].date():
-                # Split into two segments
-                timeline.append({
-                    "status": event["status"],
-                    "start": start_hour,
-                    "end": 24,
-                    "description": event["description"]
-                })
-            else:
+            while finish > begin:
+                event_day = int(begin // 24)
+                if event_day != day:
+                    if day is not None:
+                        daily_logs.append(self._create_daily_log(
+                            first_date + timedelta(days=day), timeline, driving_hours, on_duty_hours
+                        ))
+                    day = event_day
+                    timeline = []
+                    driving_hours = 0.0
+                    on_duty_hours = 0.0
+                
+                day_start = day * 24
+                segment_end = min(finish, day_start + 24)
+                hours = segment_end - begin
+                
                 timeline.append({
-                    "status": event["status"],
-                    "start": start_hour,
-                    "end": end_hour,
-                    "description": event["description"]
+                    "status": event.status,
+                    "start": begin - day_start,
+                    "end": segment_end - day_start,
+                    "description": event.description
                 })
+                if event.status == self.DRIVING:
+                    driving_hours += hours
+                    on_duty_hours += hours
+                elif event.status == self.ON_DUTY:
+                    on_duty_hours += hours
+                
+                begin = segment_end
         
-        # Calculate daily totals
-        driving_hours = sum(
-            e["duration"] for e in events 
-            if e["status"] == self.DRIVING and e["start_time"].date() == date
-        )
-        on_duty_hours = sum(
-            e["duration"] for e in events 
-            if e["status"] in [self.DRIVING, self.ON_DUTY] and e["start_time"].date() == date
-        )
+        # Add final day if there are remaining events
+        if timeline:
+            daily_logs.append(self._create_daily_log(
+                first_date + timedelta(days=day), timeline, driving_hours, on_duty_hours
+            ))
         
+        return daily_logs
+    
+    def _create_daily_log(self, date, timeline: List[Dict], driving_hours: float, on_duty_hours: float) -> Dict:
+        """Create a daily log from a day's timeline and totals."""
         return {
             "date": date.isoformat(),
             "timeline": timeline,
@@ -204,3 +462,26 @@ class ELDSimulator:
                 "off_duty": round(24 - on_duty_hours, 2)
             }
         }
+    
+    @staticmethod
+    def hour_of_day(moment: datetime) -> float:
+        """Hour of day in the server's TIME_ZONE (naive times are taken to be in it already)."""
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment)
+        return moment.hour + moment.minute / 60 + (moment.second + moment.microsecond / 1e6) / 3600
+
+
+_simulators: Dict[str, ELDSimulator] = {}
+
+
+def get_simulator(rule_set: str = DEFAULT_RULE_SET) -> ELDSimulator:
+    """
+    Return the shared simulator for a registered rule set.
+    
+    Simulators hold no per-trip state, so one per profile is built on
+    first use and reused by every request.
+    """
+    simulator = _simulators.get(rule_set)
+    if simulator is None:
+        simulator = _simulators.setdefault(rule_set, ELDSimulator(rule_set))
+    return simulator
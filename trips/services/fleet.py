@@ -0,0 +1,229 @@
+"""
+Fleet what-if runs over a file of lanes (see ``manage.py simulate_lanes``).
+
+Lanes are streamed from CSV or Parquet in chunks. Each chunk is
+geocoded and routed in the calling process (through the shared caches
+and rate limiter) and its HOS simulations run on a process pool. Result
+rows are appended to the output as each chunk finishes, so an
+interrupted run can be resumed.
+
+Parquet support needs the optional ``pyarrow`` package.
+"""
+import csv
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .eld_simulator import ELDSimulator, get_simulator
+
+LANE_FIELDS = ("current_location", "pickup_location", "dropoff_location")
+
+RESULT_FIELDS = [
+    "lane_id",
+    "rule_set",
+    "status",
+    "error",
+    "distance_miles",
+    "driving_hours",
+    "total_hours",
+    "days",
+    "rests",
+    "breaks",
+    "restarts",
+    "final_cycle_hours",
+]
+
+
+def is_parquet(path: str) -> bool:
+    return path.lower().endswith(".parquet")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files require the pyarrow package (pip install pyarrow)") from None
+    return pyarrow
+
+
+def read_lanes(path: str, batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    Yield lanes from a CSV or Parquet file, one dict per row.
+    
+    Rows need current_location, pickup_location and dropoff_location, and
+    may have lane_id, current_cycle_hours and rule_set. Lanes without a
+    lane_id are numbered by row (from 1), which is stable for resuming as
+    long as the file doesn't change.
+    """
+    if is_parquet(path):
+        pa = _require_pyarrow()
+        yield from _numbered(
+            row
+            for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size)
+            for row in batch.to_pylist()
+        )
+    else:
+        with open(path, newline="", encoding="utf-8") as handle:
+            yield from _numbered(csv.DictReader(handle))
+
+
+def _numbered(rows) -> Iterator[Dict]:
+    for number, row in enumerate(rows, start=1):
+        lane_id = row.get("lane_id")
+        row["lane_id"] = str(lane_id) if lane_id not in (None, "") else str(number)
+        yield row
+
+
+def completed_lanes(path: str) -> Set[Tuple[str, str]]:
+    """(lane_id, rule_set) pairs already present in a result file or Parquet directory."""
+    done = set()
+    if is_parquet(path):
+        if not os.path.isdir(path):
+            return done
+        pa = _require_pyarrow()
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                table = pa.parquet.read_table(os.path.join(path, name), columns=["lane_id", "rule_set"])
+                done.update(zip(table.column("lane_id").to_pylist(), table.column("rule_set").to_pylist()))
+    elif os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as handle:
+            done.update((row["lane_id"], row["rule_set"]) for row in csv.DictReader(handle))
+    return done
+
+
+class CSVResultWriter:
+    """Appends result rows to a CSV file, flushing after every chunk."""
+    
+    def __init__(self, path: str):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.handle = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.handle, fieldnames=RESULT_FIELDS)
+        if new:
+            self.writer.writeheader()
+    
+    def write(self, rows: List[Dict]):
+        self.writer.writerows(rows)
+        self.handle.flush()
+    
+    def close(self):
+        self.handle.close()
+
+
+class ParquetResultWriter:
+    """
+    Writes each chunk of result rows as a new part file in a directory.
+    
+    A Parquet file is only readable once its footer is written, so parts
+    (rather than one growing file) keep finished chunks safe if a run is
+    interrupted.
+    """
+    
+    def __init__(self, path: str):
+        self.pa = _require_pyarrow()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.part = sum(1 for name in os.listdir(path) if name.endswith(".parquet"))
+        self.schema = self.pa.schema([
+            ("lane_id", self.pa.string()),
+            ("rule_set", self.pa.string()),
+            ("status", self.pa.string()),
+            ("error", self.pa.string()),
+            ("distance_miles", self.pa.float64()),
+            ("driving_hours", self.pa.float64()),
+            ("total_hours", self.pa.float64()),
+            ("days", self.pa.int32()),
+            ("rests", self.pa.int32()),
+            ("breaks", self.pa.int32()),
+            ("restarts", self.pa.int32()),
+            ("final_cycle_hours", self.pa.float64()),
+        ])
+    
+    def write(self, rows: List[Dict]):
+        if not rows:
+            return
+        table = self.pa.Table.from_pylist(rows, schema=self.schema)
+        target = os.path.join(self.path, f"part-{self.part:05d}.parquet")
+        # Write then rename so a part is never seen half-written
+        self.pa.parquet.write_table(table, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self.part += 1
+    
+    def close(self):
+        pass
+
+
+def open_result_writer(path: str):
+    return ParquetResultWriter(path) if is_parquet(path) else CSVResultWriter(path)
+
+
+def error_row(lane_id: str, rule_set: str, message: str) -> Dict:
+    return {"lane_id": lane_id, "rule_set": rule_set, "status": "error", "error": message}
+
+
+def summarize(lane_id: str, simulator: ELDSimulator, distance: float, schedule, start_hour: float) -> Dict:
+    """One result row from a simulated schedule."""
+    restart = None
+    if simulator.rules.restart_hours is not None:
+        restart = simulator.RESTART_DESCRIPTION.format(hours=simulator.rules.restart_hours)
+    
+    driving = rests = breaks = restarts = 0
+    for event in schedule.events:
+        if event.status == ELDSimulator.DRIVING:
+            driving += event.end - event.start
+        elif event.status == ELDSimulator.SLEEPER:
+            rests += 1
+        elif event.description == ELDSimulator.BREAK_DESCRIPTION:
+            breaks += 1
+        elif event.description == restart:
+            restarts += 1
+    
+    return {
+        "lane_id": lane_id,
+        "rule_set": simulator.rules.name,
+        "status": "ok",
+        "error": "",
+        "distance_miles": distance,
+        "driving_hours": round(driving, 2),
+        "total_hours": round(schedule.total_hours, 2),
+        # Calendar days the logs span, as in simulate_trip's total_days
+        "days": int((start_hour + schedule.total_hours - ELDSimulator.EPSILON) // 24) + 1,
+        "rests": rests,
+        "breaks": breaks,
+        "restarts": restarts,
+        "final_cycle_hours": round(schedule.final_cycle_hours, 2),
+    }
+
+
+# (lane_id, rule_set, current_cycle_hours, distance, stops, start_hour)
+SimulationJob = Tuple[str, str, float, float, List[Dict], float]
+
+
+def simulate_jobs(jobs: List[SimulationJob]) -> List[Dict]:
+    """
+    Simulate a batch of lanes and return their result rows.
+    
+    Module-level so it can run in a process pool; jobs are batched so
+    each round trip to a worker carries many simulations.
+    """
+    rows = []
+    for lane_id, rule_set, cycle_hours, distance, stops, start_hour in jobs:
+        simulator = get_simulator(rule_set)
+        if cycle_hours > simulator.max_cycle_hours:
+            rows.append(error_row(
+                lane_id, rule_set, f"Current cycle hours must be between 0 and {simulator.max_cycle_hours:g}"
+            ))
+            continue
+        schedule = simulator.simulate(stops, cycle_hours, start_hour)
+        rows.append(summarize(lane_id, simulator, distance, schedule, start_hour))
+    return rows
+
+
+def parse_cycle_hours(value, default: float) -> Optional[float]:
+    """Cycle hours from a lane row, the default when blank, or None when invalid."""
+    if value in (None, ""):
+        return default
+    try:
+        hours = float(value)
+    except (TypeError, ValueError):
+        return None
+    return hours if hours >= 0 else None
@@ -0,0 +1,264 @@
+"""
+Offline geocoder backed by a local gazetteer of US places.
+
+A CSV or GeoNames dump is compiled once (``manage.py build_gazetteer``)
+into a compact, sorted binary index that is memory-mapped at startup, so
+lookups need no network and almost no resident memory.
+
+Index layout (little-endian):
+    header   b"GZT1", count (uint32), key bytes length (uint32)
+    offsets  (count + 1) x uint32 into the key blob
+    records  count x (lat float32, lng float32, population uint32)
+    keys     UTF-8 'city, st' keys, sorted
+"""
+import csv
+import difflib
+import mmap
+import os
+import re
+import struct
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import MISSING, LRUCache
+
+MAGIC = b"GZT1"
+HEADER = struct.Struct("<4sII")
+RECORD = struct.Struct("<ffI")
+
+US_STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "district of columbia": "dc",
+    "florida": "fl", "georgia": "ga", "hawaii": "hi", "idaho": "id", "illinois": "il",
+    "indiana": "in", "iowa": "ia", "kansas": "ks", "kentucky": "ky", "louisiana": "la",
+    "maine": "me", "maryland": "md", "massachusetts": "ma", "michigan": "mi", "minnesota": "mn",
+    "mississippi": "ms", "missouri": "mo", "montana": "mt", "nebraska": "ne", "nevada": "nv",
+    "new hampshire": "nh", "new jersey": "nj", "new mexico": "nm", "new york": "ny",
+    "north carolina": "nc", "north dakota": "nd", "ohio": "oh", "oklahoma": "ok", "oregon": "or",
+    "pennsylvania": "pa", "rhode island": "ri", "south carolina": "sc", "south dakota": "sd",
+    "tennessee": "tn", "texas": "tx", "utah": "ut", "vermont": "vt", "virginia": "va",
+    "washington": "wa", "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy",
+}
+STATE_CODES = set(US_STATES.values())
+
+# Fuzzy results (hits and misses) remembered per process
+FUZZY_MEMO_SIZE = 4096
+
+# Trailing country names that carry no information for a US gazetteer
+COUNTRY_SUFFIX = re.compile(r",\s*(usa|us|u\.s\.a\.|u\.s\.|united states( of america)?)$")
+
+
+def place_key(address: str) -> str:
+    """Normalize 'Dallas , Texas, USA' style input to the index key form 'dallas, tx'."""
+    key = re.sub(r"\s+", " ", address.lower()).strip(" ,.")
+    key = COUNTRY_SUFFIX.sub("", key)
+    parts = [part.strip(" .") for part in key.split(",") if part.strip(" .")]
+    if len(parts) >= 2:
+        parts[-1] = US_STATES.get(parts[-1], parts[-1])
+    return ", ".join(parts)
+
+
+class Gazetteer:
+    """Read-only, memory-mapped place index with exact, prefix and fuzzy lookup."""
+    
+    def __init__(self, path: str, fuzzy_cutoff: float = 0.85):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, keys_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        offsets_start = HEADER.size
+        self._records_start = offsets_start + (self.count + 1) * 4
+        self._keys_start = self._records_start + self.count * RECORD.size
+        self._offsets = memoryview(self._mm)[offsets_start:self._records_start].cast("I")
+        self._keys = _KeyView(self)
+        # A fuzzy pass scans every key with the same first letter, so each answer is kept
+        self._fuzzy_memo = LRUCache(maxsize=FUZZY_MEMO_SIZE)
+    
+    def __len__(self):
+        return self.count
+    
+    def key_at(self, i: int) -> str:
+        start = self._keys_start + self._offsets[i]
+        end = self._keys_start + self._offsets[i + 1]
+        return self._mm[start:end].decode("utf-8")
+    
+    def record_at(self, i: int) -> Tuple[float, float, int]:
+        return RECORD.unpack_from(self._mm, self._records_start + i * RECORD.size)
+    
+    def lookup(self, address: str, fuzzy: bool = True) -> Optional[Tuple[float, float]]:
+        """
+        Return (lat, lng) for an address, or None if the gazetteer can't place it.
+        
+        With ``fuzzy=False`` only exact and prefix matches are tried (both are
+        binary searches); lookup_fuzzy() does the spelling-tolerant pass.
+        """
+        key = self._lookup_key(address)
+        if key is None:
+            return None
+        
+        # Exact 'city, st' match
+        i = bisect_left(self._keys, key)
+        if i < self.count and self.key_at(i) == key:
+            return self._coords(i)
+        
+        # Bare city name (or truncated state): most populous place with this prefix
+        prefix = key if "," in key else key + ","
+        match = self._best_in_range(*self._prefix_range(prefix))
+        if match is not None:
+            return self._coords(match)
+        
+        return self._fuzzy(key) if fuzzy else None
+    
+    def lookup_fuzzy(self, address: str) -> Optional[Tuple[float, float]]:
+        """Return (lat, lng) for a close misspelling of a known place, or None."""
+        key = self._lookup_key(address)
+        return self._fuzzy(key) if key is not None else None
+    
+    def _lookup_key(self, address: str) -> Optional[str]:
+        key = place_key(address)
+        # Only 'city' and 'city, state' inputs; street addresses go upstream
+        if not key or key.count(",") > 1:
+            return None
+        return key
+    
+    def _coords(self, i: int) -> Tuple[float, float]:
+        lat, lng, _ = self.record_at(i)
+        return (round(lat, 5), round(lng, 5))
+    
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        lo = bisect_left(self._keys, prefix)
+        # U+FFFF sorts after every character that can follow the prefix
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+        return lo, hi
+    
+    def _best_in_range(self, lo: int, hi: int) -> Optional[int]:
+        if lo >= hi:
+            return None
+        return max(range(lo, hi), key=lambda i: self.record_at(i)[2])
+    
+    def _fuzzy(self, key: str) -> Optional[Tuple[float, float]]:
+        """Close spelling match among places sharing the first letter (and state, if given)."""
+        coords = self._fuzzy_memo.get(key)
+        if coords is MISSING:
+            coords = self._fuzzy_scan(key)
+            self._fuzzy_memo.set(key, coords)
+        return coords
+    
+    def _fuzzy_scan(self, key: str) -> Optional[Tuple[float, float]]:
+        city, _, state = key.partition(", ")
+        lo, hi = self._prefix_range(city[:1])
+        candidates = {}
+        for i in range(lo, hi):
+            candidate = self.key_at(i)
+            candidate_city, _, candidate_state = candidate.partition(", ")
+            if not state or candidate_state == state:
+                candidates.setdefault(candidate_city if not state else candidate, i)
+        matches = difflib.get_close_matches(city if not state else key, candidates, n=1, cutoff=self.fuzzy_cutoff)
+        return self._coords(candidates[matches[0]]) if matches else None
+
+
+class _KeyView:
+    """Sequence view of index keys so bisect can search the mmap directly."""
+    
+    def __init__(self, gazetteer: Gazetteer):
+        self._gazetteer = gazetteer
+    
+    def __len__(self):
+        return self._gazetteer.count
+    
+    def __getitem__(self, i: int) -> str:
+        return self._gazetteer.key_at(i)
+
+
+def read_places_csv(path: str) -> Iterator[Tuple[str, str, float, float, int]]:
+    """
+    Yield (city, state, lat, lng, population) from a CSV with a header row.
+    
+    Recognized columns: city/name, state_id/state/state_code, lat/latitude,
+    lng/lon/longitude and optionally population (e.g. the simplemaps
+    US cities file).
+    """
+    def column(row: Dict, *names):
+        for name in names:
+            if row.get(name) not in (None, ""):
+                return row[name]
+        return None
+    
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip().lower(): v for k, v in row.items() if k}
+            city = column(row, "city", "city_ascii", "name")
+            state = column(row, "state_id", "state_code", "state", "state_name")
+            lat = column(row, "lat", "latitude")
+            lng = column(row, "lng", "lon", "longitude")
+            if not (city and state and lat and lng):
+                continue
+            population = column(row, "population") or 0
+            yield city, state, float(lat), float(lng), int(float(population))
+
+
+def read_geonames(path: str) -> Iterator[Tuple[str, str, float, float, int]]:
+    """Yield US populated places from a GeoNames dump (e.g. US.txt or cities500.txt)."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15 or fields[6] != "P" or fields[8] != "US":
+                continue
+            yield fields[1], fields[10], float(fields[4]), float(fields[5]), int(fields[14] or 0)
+
+
+def build_index(places: Iterable[Tuple[str, str, float, float, int]], output_path: str) -> int:
+    """Compile places into an index file; returns the number of keys written."""
+    best: Dict[str, Tuple[float, float, int]] = {}
+    for city, state, lat, lng, population in places:
+        key = place_key(f"{city}, {state}")
+        if key.rsplit(", ", 1)[-1] not in STATE_CODES:
+            continue
+        # Keep the most populous place when a name repeats within a state
+        if key not in best or population > best[key][2]:
+            best[key] = (lat, lng, population)
+    
+    keys = sorted(best)
+    encoded = [key.encode("utf-8") for key in keys]
+    offsets: List[int] = [0]
+    for key in encoded:
+        offsets.append(offsets[-1] + len(key))
+    
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(keys), offsets[-1]))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for key in keys:
+            f.write(RECORD.pack(*best[key]))
+        f.write(b"".join(encoded))
+    return len(keys)
+
+
+_gazetteer = None
+_gazetteer_loaded = False
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Return the process-wide gazetteer, or None if no index is configured/built."""
+    global _gazetteer, _gazetteer_loaded
+    if not _gazetteer_loaded:
+        with _gazetteer_lock:
+            if not _gazetteer_loaded:
+                from django.conf import settings
+                path = getattr(settings, "GAZETTEER_INDEX", "")
+                if path and os.path.exists(path):
+                    _gazetteer = Gazetteer(path, fuzzy_cutoff=getattr(settings, "GAZETTEER_FUZZY_CUTOFF", 0.85))
+                _gazetteer_loaded = True
+    return _gazetteer
+
+
+def reset_gazetteer():
+    """Drop the process-wide gazetteer so the next lookup reloads it from settings."""
+    global _gazetteer, _gazetteer_loaded
+    with _gazetteer_lock:
+        _gazetteer = None
+        _gazetteer_loaded = False
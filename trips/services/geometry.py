@@ -0,0 +1,209 @@
+"""
+Route geometry helpers.
+
+Coordinates are carried internally as (n, 2) float64 NumPy arrays of
+[lng, lat] and only converted to lists or an encoded polyline when the
+response is built.
+"""
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def as_coords(coordinates) -> np.ndarray:
+    """Return coordinates as an (n, 2) float64 array of [lng, lat]."""
+    return np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+
+def haversine_miles(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Great-circle distance in miles between matching rows of [lng, lat] arrays."""
+    lng1, lat1 = np.radians(a[..., 0]), np.radians(a[..., 1])
+    lng2, lat2 = np.radians(b[..., 0]), np.radians(b[..., 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(h))
+
+
+def densify_great_circle(a: np.ndarray, b: np.ndarray, pieces: np.ndarray) -> np.ndarray:
+    """
+    Vertices along the great circle of each segment a[i] -> b[i] ([lng, lat] rows).
+    
+    Segment i contributes ``pieces[i]`` vertices at fractions 0, 1/n, ...,
+    (n-1)/n of the way, in segment order; the end point b[i] is left out
+    so consecutive segments don't repeat their shared point.
+    """
+    lng1, lat1 = np.radians(a[:, 0]), np.radians(a[:, 1])
+    lng2, lat2 = np.radians(b[:, 0]), np.radians(b[:, 1])
+    p = np.column_stack((np.cos(lat1) * np.cos(lng1), np.cos(lat1) * np.sin(lng1), np.sin(lat1)))
+    q = np.column_stack((np.cos(lat2) * np.cos(lng2), np.cos(lat2) * np.sin(lng2), np.sin(lat2)))
+    omega = np.arccos(np.clip(np.einsum("ij,ij->i", p, q), -1.0, 1.0))
+    sin_omega = np.sin(omega)
+    
+    # Spherical linear interpolation; (nearly) coincident endpoints fall back to linear
+    segment = np.repeat(np.arange(len(a)), pieces)
+    t = (np.arange(len(segment)) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[segment]
+    close = sin_omega[segment] < 1e-12
+    safe = np.where(close, 1.0, sin_omega[segment])
+    angle = omega[segment]
+    wa = np.where(close, 1.0 - t, np.sin((1.0 - t) * angle) / safe)
+    wb = np.where(close, t, np.sin(t * angle) / safe)
+    v = wa[:, None] * p[segment] + wb[:, None] * q[segment]
+    
+    lat = np.arctan2(v[:, 2], np.hypot(v[:, 0], v[:, 1]))
+    lng = np.arctan2(v[:, 1], v[:, 0])
+    return np.degrees(np.column_stack((lng, lat)))
+
+
+class RouteGeometry:
+    """
+    A route polyline indexed by cumulative distance.
+    
+    The cumulative-miles array is computed once with a vectorized
+    haversine, so "where is the truck at mile X" is a binary search plus
+    linear interpolation between the two surrounding vertices.
+    """
+    
+    def __init__(self, coordinates, total_distance: Optional[float] = None):
+        self.coords = as_coords(coordinates)
+        segments = haversine_miles(self.coords[:-1], self.coords[1:])
+        self.cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+        self.length = float(self.cumulative[-1]) if len(self.coords) else 0.0
+        # Route distances (e.g. OSRM road miles) are scaled onto the polyline length
+        self.scale = self.length / total_distance if total_distance else 1.0
+    
+    def __len__(self):
+        return len(self.coords)
+    
+    def positions_at(self, miles: Sequence[float]) -> np.ndarray:
+        """Return an (m, 2) array of [lng, lat] at each route distance in ``miles``."""
+        target = np.clip(np.asarray(miles, dtype=np.float64) * self.scale, 0.0, self.length)
+        if len(self.coords) < 2 or self.length == 0:
+            return np.repeat(self.coords[:1], len(target), axis=0)
+        
+        # Index of the segment containing each target distance
+        i = np.clip(np.searchsorted(self.cumulative, target, side="right") - 1, 0, len(self.coords) - 2)
+        start = self.cumulative[i]
+        span = self.cumulative[i + 1] - start
+        t = np.divide(target - start, span, out=np.zeros_like(target), where=span > 0)
+        return self.coords[i] + (self.coords[i + 1] - self.coords[i]) * t[:, None]
+    
+    def position_at(self, miles: float) -> Optional[list]:
+        """Return [lng, lat] at a route distance, or None for an empty geometry."""
+        if not len(self.coords):
+            return None
+        return self.positions_at([miles])[0].tolist()
+    
+    def locate(self, lng: float, lat: float) -> Tuple[float, float]:
+        """
+        Project a point onto the route.
+        
+        Returns (route distance of the nearest point on the route, miles
+        between the point and the route). Segments are treated as straight
+        in a local equirectangular projection, which is accurate to well
+        under a percent at route vertex spacing.
+        """
+        if len(self.coords) < 2:
+            if not len(self.coords):
+                return 0.0, float("inf")
+            return 0.0, float(haversine_miles(self.coords[0], np.array([lng, lat])))
+        
+        kx = np.cos(np.radians(lat))
+        a = (self.coords[:-1] - (lng, lat)) * (kx, 1.0)
+        d = (self.coords[1:] - self.coords[:-1]) * (kx, 1.0)
+        length2 = np.einsum("ij,ij->i", d, d)
+        t = np.divide(-np.einsum("ij,ij->i", a, d), length2, out=np.zeros_like(length2), where=length2 > 0)
+        t = np.clip(t, 0.0, 1.0)
+        nearest = a + d * t[:, None]
+        offset2 = np.einsum("ij,ij->i", nearest, nearest)
+        
+        i = int(np.argmin(offset2))
+        along = self.cumulative[i] + t[i] * (self.cumulative[i + 1] - self.cumulative[i])
+        off_route = float(np.sqrt(offset2[i]) * np.radians(1.0) * EARTH_RADIUS_MILES)
+        return float(along / self.scale) if self.scale else 0.0, off_route
+    
+    def suffix(self, miles: float) -> np.ndarray:
+        """The part of the route after a route distance, starting at the interpolated point."""
+        if not len(self.coords):
+            return self.coords
+        target = min(max(miles * self.scale, 0.0), self.length)
+        i = int(np.searchsorted(self.cumulative, target, side="right"))
+        return np.vstack((self.positions_at([miles]), self.coords[i:]))
+
+
+def zoom_tolerance(zoom: float) -> float:
+    """Simplification tolerance in degrees: about one pixel on a 256px tile at this zoom."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def simplify(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification with a tolerance in degrees.
+    
+    Each segment's farthest point is found with one vectorized distance
+    computation, so cost grows with the number of kept points rather
+    than with Python-level work per input point.
+    """
+    n = len(coords)
+    if n < 3 or tolerance <= 0:
+        return coords
+    
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        
+        a = coords[start]
+        dx, dy = coords[end] - a
+        inner = coords[start + 1:end] - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+        
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    
+    return coords[keep]
+
+
+def encode_polyline(coords: np.ndarray, precision: int = 5) -> str:
+    """Encode [lng, lat] coordinates as a Google encoded polyline (lat/lng order)."""
+    if len(coords) == 0:
+        return ""
+    
+    values = np.round(coords[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zigzag-encode the sign into the lowest bit
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    
+    chunks = []
+    for value in deltas.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def render_geometry(coords: np.ndarray, geometry_format: str = "coordinates", zoom: Optional[float] = None) -> dict:
+    """
+    Build the response geometry for a route.
+    
+    Returns {"coordinates": [[lng, lat], ...]} or {"polyline": "..."},
+    simplified for ``zoom`` when one is given.
+    """
+    if zoom is not None:
+        coords = simplify(coords, zoom_tolerance(zoom))
+    if geometry_format == "polyline":
+        return {"polyline": encode_polyline(coords)}
+    return {"coordinates": coords.tolist()}
@@ -0,0 +1,134 @@
+"""
+Declarative Hours of Service rule sets.
+
+A rule set only describes limits; ELDSimulator enforces them. Optional
+rules (the 30-minute break, the restart, the sleeper-berth split) are
+disabled by setting them to None.
+
+Profiles are registered by name in ``RULE_SETS`` so requests can pick one.
+"""
+from typing import Dict, Optional, Tuple
+
+
+class HOSRules:
+    """
+    Limits for one HOS regime, all in hours.
+    
+    Attributes:
+        max_driving_hours: Driving allowed between required rests
+        duty_window_hours: No driving once this long after coming on duty
+        required_rest_hours: Off-duty time that resets driving and the window
+        break_after_driving_hours: Driving allowed before a break is required
+        break_hours: Non-driving time that satisfies the break
+        cycle_hours: On-duty hours allowed in the rolling cycle
+        cycle_days: Length of the rolling cycle in days
+        restart_hours: Off-duty time that resets the cycle
+        sleeper_split: (sleeper, off duty) periods that may replace the
+            required rest, e.g. (7, 3)
+        description: Human-readable name of the regime
+    """
+    
+    __slots__ = (
+        "name",
+        "max_driving_hours",
+        "duty_window_hours",
+        "required_rest_hours",
+        "break_after_driving_hours",
+        "break_hours",
+        "cycle_hours",
+        "cycle_days",
+        "restart_hours",
+        "sleeper_split",
+        "description",
+    )
+    
+    def __init__(
+        self,
+        name: str,
+        max_driving_hours: float = 11,
+        duty_window_hours: float = 14,
+        required_rest_hours: float = 10,
+        break_after_driving_hours: Optional[float] = 8,
+        break_hours: float = 0.5,
+        cycle_hours: float = 70,
+        cycle_days: int = 8,
+        restart_hours: Optional[float] = 34,
+        sleeper_split: Optional[Tuple[float, float]] = None,
+        description: str = ""
+    ):
+        self.name = name
+        self.max_driving_hours = max_driving_hours
+        self.duty_window_hours = duty_window_hours
+        self.required_rest_hours = required_rest_hours
+        self.break_after_driving_hours = break_after_driving_hours
+        self.break_hours = break_hours
+        self.cycle_hours = cycle_hours
+        self.cycle_days = cycle_days
+        self.restart_hours = restart_hours
+        self.sleeper_split = sleeper_split
+        self.description = description or name
+    
+    def __repr__(self):
+        return f"HOSRules({self.name!r})"
+
+
+# Property-carrying, 70 hours / 8 days (FMCSA 49 CFR 395.3)
+PROPERTY_70_8 = HOSRules("property_70_8", description="Property-carrying, 70 hours / 8 days")
+
+# Property-carrying for carriers that don't operate every day of the week
+PROPERTY_60_7 = HOSRules(
+    "property_60_7",
+    cycle_hours=60,
+    cycle_days=7,
+    description="Property-carrying, 60 hours / 7 days"
+)
+
+# Passenger-carrying (49 CFR 395.5): 10 hours driving, no driving after 15
+# hours on duty, 8 hours off duty. No 30-minute break and no restart. The
+# 15-hour limit is modelled as a window.
+PASSENGER = HOSRules(
+    "passenger",
+    max_driving_hours=10,
+    duty_window_hours=15,
+    required_rest_hours=8,
+    break_after_driving_hours=None,
+    restart_hours=None,
+    description="Passenger-carrying, 70 hours / 8 days"
+)
+
+# 150 air-mile short-haul exception (49 CFR 395.1(e)(1)): exempt from the
+# 30-minute break; driving, window and cycle limits still apply.
+SHORT_HAUL = HOSRules(
+    "short_haul",
+    break_after_driving_hours=None,
+    description="Short-haul (150 air-mile), 70 hours / 8 days"
+)
+
+# Property-carrying with the 7/3 sleeper-berth split (49 CFR 395.1(g))
+SLEEPER_SPLIT = HOSRules(
+    "sleeper_split",
+    sleeper_split=(7, 3),
+    description="Property-carrying with 7/3 sleeper-berth split, 70 hours / 8 days"
+)
+
+DEFAULT_RULE_SET = PROPERTY_70_8.name
+
+RULE_SETS: Dict[str, HOSRules] = {}
+
+
+def register_rule_set(rules: HOSRules) -> HOSRules:
+    """Make a rule set selectable by name."""
+    RULE_SETS[rules.name] = rules
+    return rules
+
+
+for _rules in (PROPERTY_70_8, PROPERTY_60_7, PASSENGER, SHORT_HAUL, SLEEPER_SPLIT):
+    register_rule_set(_rules)
+
+
+def get_rule_set(name: str) -> HOSRules:
+    """Return a registered rule set by name."""
+    try:
+        return RULE_SETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown HOS rule set: {name}") from None
@@ -0,0 +1,126 @@
+"""
+Shared, connection-pooled HTTP session for upstream routing and geocoding.
+
+One keep-alive session per process is reused by every RouteService so
+OSRM and Nominatim requests skip the TCP/TLS handshake after the first
+call. Each upstream base URL gets its own pool size. Async code paths use
+an httpx client, one per event loop.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from geopy.adapters import RequestsAdapter
+from requests.adapters import HTTPAdapter
+
+DEFAULT_OSRM_URL = "http://router.project-osrm.org"
+DEFAULT_NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+
+
+def build_session(pool_sizes: Dict[str, int], default_pool_size: int = 10) -> requests.Session:
+    """Build a session with a dedicated connection pool per URL prefix."""
+    session = requests.Session()
+    default_adapter = HTTPAdapter(pool_maxsize=default_pool_size)
+    session.mount("http://", default_adapter)
+    session.mount("https://", default_adapter)
+    for prefix, size in pool_sizes.items():
+        session.mount(prefix.rstrip("/") + "/", HTTPAdapter(pool_maxsize=size))
+    return session
+
+
+def split_base_url(url: str) -> Tuple[str, str]:
+    """Split a base URL into (scheme, domain-with-path) as geopy expects."""
+    parts = urlsplit(url)
+    return parts.scheme or "https", (parts.netloc + parts.path).rstrip("/")
+
+
+def get_osrm_url() -> str:
+    from django.conf import settings
+    return getattr(settings, "OSRM_URL", DEFAULT_OSRM_URL).rstrip("/")
+
+
+def get_nominatim_url() -> str:
+    from django.conf import settings
+    return getattr(settings, "NOMINATIM_URL", DEFAULT_NOMINATIM_URL).rstrip("/")
+
+
+def get_timeout() -> Tuple[float, float]:
+    """Return the (connect, read) timeout for upstream requests."""
+    from django.conf import settings
+    return (
+        getattr(settings, "HTTP_CONNECT_TIMEOUT", 3.05),
+        getattr(settings, "HTTP_READ_TIMEOUT", 10),
+    )
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide pooled session configured from Django settings."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from django.conf import settings
+                _session = build_session(
+                    {
+                        get_osrm_url(): getattr(settings, "OSRM_POOL_SIZE", 10),
+                        get_nominatim_url(): getattr(settings, "NOMINATIM_POOL_SIZE", 4),
+                    },
+                    default_pool_size=getattr(settings, "HTTP_POOL_SIZE", 10),
+                )
+    return _session
+
+
+def reset_session():
+    """
+    Drop the process-wide session so the next request rebuilds it from settings.
+    
+    The old session is not closed; requests still using it finish normally.
+    """
+    global _session
+    with _session_lock:
+        _session = None
+        _async_clients.clear()
+
+
+# httpx clients can't be shared between event loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from django.conf import settings
+        connect, read = get_timeout()
+        pool_size = getattr(settings, "OSRM_POOL_SIZE", 10) + getattr(settings, "NOMINATIM_POOL_SIZE", 4)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+class SharedSessionAdapter(RequestsAdapter):
+    """geopy adapter that sends geocoder requests through the shared session."""
+    
+    def __init__(self, *, proxies, ssl_context):
+        super().__init__(proxies=proxies, ssl_context=ssl_context)
+        self.session.close()
+        self.session = get_session()
+    
+    # The shared session outlives any single geocoder, so never close it here
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+    
+    def __del__(self):
+        pass
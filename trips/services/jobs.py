@@ -0,0 +1,135 @@
+"""
+Background execution of trip calculations.
+
+Jobs are stored in the database (``TripJob``) so any worker can answer a
+poll, and run on a small in-process thread pool so request workers return
+immediately instead of waiting on Nominatim/OSRM.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from ..models import TripJob
+from .container import get_trip_calculator
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """
+    Runs queued TripJobs on a bounded thread pool.
+    
+    A running job's ``updated_at`` is touched every ``heartbeat`` seconds
+    so pollers don't expire it as stale while it is still being worked on.
+    """
+    
+    def __init__(self, max_workers: int = 2, heartbeat: float = 60.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trip-job")
+        self.heartbeat = heartbeat
+    
+    def submit(self, trip_request: Dict) -> TripJob:
+        """Store a pending job for a validated trip request and queue it."""
+        job = TripJob.objects.create(request=trip_request)
+        self.executor.submit(self._run, job.id)
+        return job
+    
+    def _run(self, job_id):
+        close_old_connections()
+        try:
+            # A job that waited so long in the queue that a poll expired it stays failed
+            started = TripJob.objects.filter(id=job_id, status=TripJob.PENDING).update(
+                status=TripJob.RUNNING, updated_at=timezone.now()
+            )
+            if not started:
+                return
+            job = TripJob.objects.get(id=job_id)
+            with self._heartbeat(job_id):
+                try:
+                    result = get_trip_calculator().calculate_trip(**job.request)
+                except ValueError as e:
+                    self._finish(job, error={"error": "Calculation error", "message": str(e)})
+                except Exception as e:
+                    logger.exception("Trip job %s failed", job_id)
+                    self._finish(job, error={"error": "Server error", "message": str(e)})
+                else:
+                    self._finish(job, result=result)
+        finally:
+            close_old_connections()
+    
+    @contextmanager
+    def _heartbeat(self, job_id):
+        """Touch the running job's updated_at every ``heartbeat`` seconds until the block exits."""
+        stop = threading.Event()
+        
+        def beat():
+            try:
+                while not stop.wait(self.heartbeat):
+                    TripJob.objects.filter(id=job_id, status=TripJob.RUNNING).update(updated_at=timezone.now())
+            except Exception:
+                logger.exception("Heartbeat for trip job %s failed", job_id)
+            finally:
+                connection.close()
+        
+        thread = threading.Thread(target=beat, name="trip-job-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+    
+    def _finish(self, job: TripJob, result: Dict = None, error: Dict = None):
+        # Only a job that is still running is finished here; one expired in the meantime stays failed
+        finished = TripJob.objects.filter(id=job.id, status=TripJob.RUNNING).update(
+            status=TripJob.FAILED if error else TripJob.SUCCEEDED,
+            result=result,
+            error=error,
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        if not finished:
+            logger.warning("Trip job %s finished after it was expired; its result was dropped", job.id)
+
+
+def expire_stale_job(job: TripJob, stale_after: float) -> TripJob:
+    """
+    Fail a job whose worker has not touched it for ``stale_after`` seconds.
+    
+    Jobs live in an in-process pool, so a restarted worker leaves its
+    queued jobs behind; this keeps pollers from waiting on them forever.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    if not job.is_finished and job.updated_at < cutoff:
+        # Conditional, so a heartbeat or a finish that lands first wins
+        TripJob.objects.filter(id=job.id, status__in=(TripJob.PENDING, TripJob.RUNNING), updated_at__lt=cutoff).update(
+            status=TripJob.FAILED,
+            error={"error": "Server error", "message": "Job was interrupted, please resubmit"},
+            finished_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+    return job
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Return the process-wide job runner configured from Django settings."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                from django.conf import settings
+                _runner = JobRunner(
+                    max_workers=getattr(settings, "TRIP_JOB_WORKERS", 2),
+                    # Several beats per stale period, so one slow beat doesn't expire a job
+                    heartbeat=getattr(settings, "TRIP_JOB_STALE_AFTER", 300) / 5,
+                )
+    return _runner
@@ -0,0 +1,271 @@
+"""
+Stage timing and process metrics for the trip API.
+
+``stage("geocode")`` times a block into the ``trips_stage_seconds``
+histogram and, during a request, into that request's Timings (a context
+variable set by ``trips.middleware.TimingMiddleware``), which becomes the
+``Server-Timing`` header and the request log line. Outside a request, or
+on a thread started without the request's context, only the histogram
+is updated.
+
+Metrics live in this process; the exposition format is Prometheus text
+(version 0.0.4) so no client library is needed. Under several workers
+each one reports its own counts.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers cache hits (sub-millisecond) through slow upstreams
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The process's metrics, rendered in Prometheus text format.
+    
+    Collectors are called at scrape time for values that already live
+    elsewhere (cache statistics); each returns (name, kind, documentation,
+    [(labels dict, value), ...]) tuples.
+    """
+    
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable] = []
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def add_collector(self, collector: Callable):
+        self._collectors.append(collector)
+    
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "trips_stage_seconds", "Time spent in each trip planning stage", ("stage",)
+)
+REQUEST_SECONDS = registry.histogram(
+    "trips_request_seconds", "Time to answer an HTTP request", ("view", "method", "status")
+)
+UPSTREAM_SECONDS = registry.histogram(
+    "trips_upstream_request_seconds", "Time spent waiting on an upstream service", ("upstream",)
+)
+UPSTREAM_ERRORS = registry.counter(
+    "trips_upstream_errors_total", "Failed upstream requests (network, HTTP or service errors)", ("upstream",)
+)
+ROUTE_FALLBACKS = registry.counter(
+    "trips_route_fallbacks_total", "Routes estimated without OSRM, by why OSRM wasn't used", ("reason",)
+)
+PLAN_LOOKUPS = registry.counter(
+    "trips_plan_lookups_total", "Stored plan lookups for identical trip requests", ("result",)
+)
+
+
+class Timings:
+    """Stage durations of one request, in the order the stages first ran."""
+    
+    __slots__ = ("started", "stages")
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+    
+    def add(self, name: str, seconds: float):
+        # A stage that runs more than once (e.g. per retry) is reported as its total
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+    
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """The Server-Timing header value, durations in milliseconds."""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(self.elapsed() if total is None else total) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[Timings]] = ContextVar("trip_timings", default=None)
+
+
+def start_timings() -> Tuple[Timings, object]:
+    """Begin collecting stage timings for the current request; returns (timings, reset token)."""
+    timings = Timings()
+    return timings, _current_timings.set(timings)
+
+
+def stop_timings(token):
+    _current_timings.reset(token)
+
+
+def current_timings() -> Optional[Timings]:
+    return _current_timings.get()
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one trip planning stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def _cache_samples():
+    # Imported here: the cache module doesn't depend on metrics
+    from .cache import get_geocode_cache, get_matrix_cache, get_route_cache
+    
+    geocode = get_geocode_cache().stats()
+    route = get_route_cache().stats()
+    matrix = get_matrix_cache().stats()
+    counts = {
+        # Memory hits include cached failures; database hits are hits the memory tier missed
+        "geocode": (geocode["memory"]["hits"] + geocode["persistent_hits"], geocode["misses"], geocode["memory"]["size"]),
+        "route": (route["memory"]["hits"], route["memory"]["misses"], route["memory"]["size"]),
+        "matrix": (matrix["memory"]["hits"], matrix["memory"]["misses"], matrix["memory"]["size"]),
+    }
+    
+    ratios = []
+    for cache, (hits, misses, _) in counts.items():
+        if hits + misses:
+            ratios.append(({"cache": cache}, hits / (hits + misses)))
+    return [
+        ("trips_cache_hits_total", "counter", "Cache lookups answered from the cache",
+         [({"cache": cache}, hits) for cache, (hits, _, _) in counts.items()]),
+        ("trips_cache_misses_total", "counter", "Cache lookups that had to go upstream",
+         [({"cache": cache}, misses) for cache, (_, misses, _) in counts.items()]),
+        ("trips_cache_hit_ratio", "gauge", "Share of cache lookups that were hits since the cache was created",
+         ratios),
+        ("trips_cache_entries", "gauge", "Entries held in the in-process cache",
+         [({"cache": cache}, size) for cache, (_, _, size) in counts.items()]),
+    ]
+
+
+registry.add_collector(_cache_samples)
@@ -0,0 +1,161 @@
+"""
+Trip plan storage.
+
+Calculated trips are stored with their full-resolution route so a
+mid-trip re-plan can reuse the part of the route still ahead of the
+truck instead of geocoding and routing again. Storage is best-effort:
+if the database is unavailable the trip is still returned, just without
+a plan id.
+
+Plans are also content-addressed: a hash of the normalized inputs (and
+the start time bucket) finds an identical plan so it is served instead
+of being recalculated.
+"""
+import hashlib
+import json
+import logging
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+
+from ..models import TripPlan
+from .cache import normalize_address
+from .metrics import PLAN_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class StoredPlan:
+    """The parts of a stored plan needed to re-plan from it."""
+    
+    __slots__ = ("id", "request", "waypoints", "route")
+    
+    def __init__(self, plan_id, request: Dict, waypoints: List[Tuple[float, float]], route: Dict):
+        self.id = plan_id
+        self.request = request
+        self.waypoints = waypoints
+        self.route = route
+    
+    @property
+    def has_pickup(self) -> bool:
+        """Whether the plan still routes through the pickup (start, pickup, dropoff)."""
+        return len(self.waypoints) == 3
+
+
+class PlanStore:
+    """Saves, finds and loads TripPlans."""
+    
+    def key(self, request: Dict) -> Optional[str]:
+        """
+        Content hash of a trip request, or None if plans aren't reused.
+        
+        Addresses are normalized the way the geocode cache does it and the
+        start time is bucketed (TRIP_PLAN_BUCKET_MINUTES), so requests
+        that would produce the same plan share a key.
+        """
+        bucket_minutes = getattr(settings, "TRIP_PLAN_BUCKET_MINUTES", 15)
+        if not getattr(settings, "TRIP_PLANS_PERSISTENT", True) or bucket_minutes <= 0:
+            return None
+        
+        normalized = [
+            normalize_address(request["current_location"]),
+            normalize_address(request["pickup_location"]),
+            normalize_address(request["dropoff_location"]),
+            round(float(request["current_cycle_hours"]), 2),
+            request.get("rule_set"),
+            request.get("geometry_format", "coordinates"),
+            request.get("simplify_zoom"),
+            int(time.time() // (bucket_minutes * 60)),
+        ]
+        return hashlib.sha256(json.dumps(normalized, separators=(",", ":")).encode()).hexdigest()
+    
+    def find(self, input_hash: Optional[str]) -> Optional[Dict]:
+        """Return the stored response for a content hash, or None."""
+        if input_hash is None:
+            return None
+        return self.find_many([input_hash]).get(input_hash)
+    
+    def find_many(self, input_hashes: Iterable[Optional[str]]) -> Dict[str, Dict]:
+        """Return {content hash: stored response} for the hashes that have a plan, in one query."""
+        input_hashes = {h for h in input_hashes if h is not None}
+        if not input_hashes:
+            return {}
+        try:
+            rows = (
+                TripPlan.objects.filter(input_hash__in=input_hashes)
+                .order_by("created_at")
+                .values_list("input_hash", "result")
+            )
+            # Latest plan wins if a race stored the same inputs twice
+            found = dict(rows)
+        except DatabaseError as e:
+            logger.warning("Trip plan lookup failed: %s", e)
+            found = {}
+        PLAN_LOOKUPS.inc(len(found), result="hit")
+        PLAN_LOOKUPS.inc(len(input_hashes) - len(found), result="miss")
+        return found
+    
+    def etag(self, plan_id) -> Optional[str]:
+        """
+        ETag of a stored plan's response, or None if it doesn't exist.
+        
+        Plans are never modified, so the id identifies the representation
+        and answering a conditional GET costs one primary-key lookup.
+        """
+        return str(plan_id) if TripPlan.objects.filter(id=plan_id).exists() else None
+    
+    def get(self, plan_id) -> Optional[Dict]:
+        """Return a stored plan's response, or None if it doesn't exist."""
+        return TripPlan.objects.filter(id=plan_id).values_list("result", flat=True).first()
+    
+    def save(
+        self,
+        request: Dict,
+        waypoints: List[Tuple[float, float]],
+        route: Dict,
+        result: Dict,
+        parent_id=None,
+        input_hash: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Store a calculated trip and set ``result["plan_id"]``.
+        
+        Plans saved with an ``input_hash`` are returned by find() for
+        identical requests.
+        
+        Returns the plan id, or None when plans aren't persisted.
+        """
+        if not getattr(settings, "TRIP_PLANS_PERSISTENT", True):
+            return None
+        
+        plan = TripPlan(
+            parent_id=parent_id,
+            input_hash=input_hash,
+            request=request,
+            waypoints=[list(point) for point in waypoints],
+            route={k: v for k, v in route.items() if k != "coordinates"},
+            geometry=zlib.compress(np.ascontiguousarray(route["coordinates"], dtype=np.float64).tobytes())
+        )
+        result["plan_id"] = str(plan.id)
+        plan.result = result
+        try:
+            plan.save(force_insert=True)
+        except DatabaseError as e:
+            logger.warning("Trip plan not stored: %s", e)
+            del result["plan_id"]
+            return None
+        return result["plan_id"]
+    
+    def load(self, plan_id) -> Optional[StoredPlan]:
+        """Return a stored plan without its response body, or None if it doesn't exist."""
+        plan = TripPlan.objects.filter(id=plan_id).defer("result").first()
+        if plan is None:
+            return None
+        
+        route = dict(plan.route)
+        route["coordinates"] = np.frombuffer(zlib.decompress(plan.geometry), dtype=np.float64).reshape(-1, 2)
+        return StoredPlan(plan.id, plan.request, [tuple(point) for point in plan.waypoints], route)
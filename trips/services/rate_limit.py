@@ -0,0 +1,241 @@
+"""
+Rate limiting and request coalescing for upstream services with usage
+policies (Nominatim allows about one request per second).
+
+``RateLimiter`` is a token bucket for one process. ``SharedRateLimiter``
+keeps the bucket in a small locked file, so every worker process on the
+host (and any other app on it that points at the same file) draws from
+one budget; Nominatim's limit applies per client IP, not per process.
+Callers queue for their token instead of being throttled upstream,
+unless the token would come after their deadline.
+
+``RequestCoalescer`` lets concurrent lookups of the same key wait on a
+single upstream call.
+"""
+import asyncio
+import logging
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, limits stay per process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Bucket state in the shared file: token count, time of that count (epoch seconds)
+_STATE = struct.Struct("<dd")
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: ``rate`` tokens per second, at most ``burst`` saved up.
+    
+    A caller that finds the bucket empty reserves the next token and waits
+    for it, so waiting callers are served in arrival order, 1/rate apart.
+    With the default burst of 1, calls are simply spaced 1/rate seconds
+    apart.
+    """
+    
+    def __init__(self, rate: float = 1.0, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = self._now()
+        self._lock = threading.Lock()
+    
+    def acquire(self, budget: Optional[float] = None) -> bool:
+        """
+        Block until the caller may make the next upstream request.
+        
+        Returns False at once, leaving the token in the bucket, if it
+        would take longer than ``budget`` seconds to come.
+        """
+        delay = self._reserve(budget)
+        if delay is None:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+    
+    async def aacquire(self, budget: Optional[float] = None) -> bool:
+        """Async version of acquire(); waits without blocking the event loop."""
+        delay = self._reserve(budget)
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+    
+    def _reserve(self, budget: Optional[float] = None) -> Optional[float]:
+        """Take the next token and return how long to wait for it, or None if that's over budget."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            tokens, updated, delay = self._take(self._tokens, self._updated, self._now())
+            if budget is not None and delay > budget:
+                return None
+            self._tokens, self._updated = tokens, updated
+        return delay
+    
+    def _take(self, tokens: float, updated: float, now: float) -> Tuple[float, float, float]:
+        """Refill the bucket up to now and take one token; returns (tokens, updated, delay)."""
+        # A clock that stepped backwards refills nothing rather than going negative
+        tokens = min(self.burst, tokens + max(now - updated, 0.0) * self.rate) - 1.0
+        # A negative count is tokens already promised to waiting callers
+        return tokens, now, max(-tokens / self.rate, 0.0)
+    
+    def _now(self) -> float:
+        return time.monotonic()
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    Token bucket shared by every process that uses the same state file.
+    
+    Each reservation holds an exclusive flock on the file just long enough
+    to read and rewrite 16 bytes. Times are wall-clock seconds because
+    monotonic clocks aren't comparable between processes.
+    """
+    
+    def __init__(self, path: str, rate: float = 1.0, burst: float = 1.0):
+        super().__init__(rate=rate, burst=burst)
+        self.path = path
+        self._fd = None
+        self._pid = None
+    
+    def _reserve(self, budget: Optional[float] = None) -> Optional[float]:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = self._now()
+                data = os.pread(fd, _STATE.size, 0)
+                # A new (or truncated) file starts with a full bucket
+                tokens, updated = _STATE.unpack(data) if len(data) == _STATE.size else (self.burst, now)
+                tokens, updated, delay = self._take(tokens, updated, now)
+                if budget is not None and delay > budget:
+                    return None
+                os.pwrite(fd, _STATE.pack(tokens, updated), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        return delay
+    
+    def _file(self) -> int:
+        # A descriptor inherited over fork() shares its lock with the parent, so
+        # each process opens the file itself
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+    
+    def _now(self) -> float:
+        return time.time()
+
+
+class RequestCoalescer:
+    """
+    Single-flight calls: concurrent callers with the same key share one call.
+    
+    The first caller for a key runs the call; callers arriving while it is
+    in flight wait for it and get the same result or exception. Nothing is
+    kept once the call finishes, so results are cached elsewhere.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+    
+    def run(self, key: Hashable, call: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+    
+    async def arun(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Async version of run(); coalesces callers on the same event loop."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(loop_key)
+            if task is None:
+                task = self._tasks[loop_key] = asyncio.ensure_future(call())
+                task.add_done_callback(lambda _: self._forget(loop_key, task))
+        # A cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+    
+    def _forget(self, loop_key, task):
+        with self._lock:
+            if self._tasks.get(loop_key) is task:
+                del self._tasks[loop_key]
+
+
+_nominatim_limiter = None
+_limiter_lock = threading.Lock()
+
+_geocode_coalescer = RequestCoalescer()
+
+
+def get_nominatim_limiter() -> RateLimiter:
+    """Return the Nominatim limiter configured from Django settings (shared across processes by default)."""
+    global _nominatim_limiter
+    if _nominatim_limiter is None:
+        with _limiter_lock:
+            if _nominatim_limiter is None:
+                _nominatim_limiter = _build_nominatim_limiter()
+    return _nominatim_limiter
+
+
+def _build_nominatim_limiter() -> RateLimiter:
+    from django.conf import settings
+    
+    rate = getattr(settings, "NOMINATIM_RATE_LIMIT", 1.0)
+    burst = getattr(settings, "NOMINATIM_RATE_BURST", 1.0)
+    path = getattr(settings, "NOMINATIM_RATE_LIMIT_FILE", "")
+    if path and rate > 0:
+        if fcntl is None:
+            logger.warning("File locks are unavailable here; the Nominatim rate limit applies per process")
+        else:
+            try:
+                limiter = SharedRateLimiter(path, rate=rate, burst=burst)
+                limiter._file()
+                return limiter
+            except OSError as e:
+                logger.warning("Can't use %s for the shared Nominatim rate limit (%s); limiting per process", path, e)
+    return RateLimiter(rate=rate, burst=burst)
+
+
+def get_geocode_coalescer() -> RequestCoalescer:
+    """Return the process-wide coalescer for upstream geocode lookups."""
+    return _geocode_coalescer
+
+
+def reset_nominatim_limiter():
+    """Drop the process-wide limiter so the next call rebuilds it from settings."""
+    global _nominatim_limiter
+    with _limiter_lock:
+        _nominatim_limiter = None
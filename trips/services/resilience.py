@@ -0,0 +1,398 @@
+"""
+Resilience for calls to the routing and geocoding upstreams.
+
+Every OSRM and Nominatim request goes through an ``Upstream``, which
+combines:
+
+- a circuit breaker that opens when too many recent calls failed or were
+  slow, so callers go straight to their fallback instead of waiting out
+  a timeout on a degraded service;
+- hedging: if a request hasn't answered by the upstream's recent p95
+  latency, a duplicate is sent and the first success wins;
+- the trip's deadline budget (``deadline()``): timeouts are cut to the
+  time left, and no request starts once it is spent.
+
+State is per worker process, like the caches.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .http_client import get_timeout
+from .metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS, registry
+
+T = TypeVar("T")
+
+Timeout = Tuple[float, float]
+
+HEDGED = registry.counter(
+    "trips_upstream_hedged_total", "Duplicate requests sent because the first was slower than p95", ("upstream",)
+)
+REJECTED = registry.counter(
+    "trips_upstream_rejected_total", "Upstream requests not sent (circuit open or deadline spent)", ("upstream", "reason")
+)
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream request was not sent or not waited for; use a fallback."""
+    
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} unavailable ({reason.replace('_', ' ')})")
+        self.upstream = upstream
+        self.reason = reason
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("trip_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Bound the upstream time of everything in the block to ``seconds``.
+    
+    Nested deadlines never extend an outer one; None or 0 adds no limit.
+    Threads only see the deadline if started with the caller's context
+    (``contextvars.copy_context().run``).
+    """
+    if not seconds:
+        yield
+        return
+    
+    until = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(until if outer is None else min(outer, until))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    until = _deadline.get()
+    return None if until is None else until - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency circuit breaker over the last ``window`` calls.
+    
+    Closed: calls go through. Once ``min_calls`` outcomes are in the
+    window and at least ``failure_rate`` of them failed or took longer
+    than ``slow_seconds``, it opens. Open: calls are rejected for
+    ``open_seconds``. Half-open: one probe call is let through; success
+    closes the breaker, failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        slow_seconds: float = 5.0,
+        open_seconds: float = 30.0
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)  # True for a bad (failed or slow) call
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+    
+    def allow(self) -> bool:
+        """Whether a call may be made now; in half-open, claims the single probe."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+    
+    def record(self, success: bool, elapsed: float):
+        bad = not success or elapsed > self.slow_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+                if bad:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            
+            self._outcomes.append(bad)
+            if (
+                self._state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) >= self.failure_rate * len(self._outcomes)
+            ):
+                self._open()
+    
+    def release(self):
+        """Give back a claimed probe without an outcome (the call was cancelled, not answered)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+    
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging delay."""
+    
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+    
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+    
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        """The q-quantile of recent latencies, or None with fewer than ``min_samples``."""
+        samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+# Hedged requests run here so the caller can stop waiting for a slow one
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream-hedge")
+
+
+class Upstream:
+    """
+    One upstream service: breaker, hedging and deadline applied to each request.
+    
+    ``request`` callables take the (connect, read) timeout to use and
+    perform one idempotent GET.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        timeout: Timeout,
+        breaker: CircuitBreaker = None,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyTracker()
+    
+    def call(self, request: Callable[[Timeout], T]) -> T:
+        """Make a request; raises UpstreamUnavailable instead of waiting when it can't succeed in time."""
+        timeout, budget = self._admit()
+        started = time.perf_counter()
+        try:
+            delay = self._hedge_delay(timeout)
+            if delay is None and budget is None:
+                result = request(timeout)
+            else:
+                result = self._hedged(request, timeout, delay, budget)
+        except Exception:
+            self._record(False, time.perf_counter() - started)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: no outcome, but a half-open probe must not stay claimed
+            self.breaker.release()
+            raise
+        self._record(True, time.perf_counter() - started)
+        return result
+    
+    async def acall(self, request: Callable[[Timeout], Awaitable[T]]) -> T:
+        """Async version of call()."""
+        timeout, budget = self._admit()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self._ahedged(request, timeout, self._hedge_delay(timeout)), budget
+            )
+        except asyncio.TimeoutError:
+            self._record(False, time.perf_counter() - started)
+            raise UpstreamUnavailable(self.name, "deadline_exceeded") from None
+        except Exception:
+            self._record(False, time.perf_counter() - started)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: no outcome, but a half-open probe must not stay claimed
+            self.breaker.release()
+            raise
+        self._record(True, time.perf_counter() - started)
+        return result
+    
+    def available(self) -> bool:
+        """Cheap pre-check (no probe claimed): False when the circuit is open or the deadline is spent."""
+        budget = remaining_budget()
+        return self.breaker.state != CircuitBreaker.OPEN and (budget is None or budget > 0)
+    
+    def can_retry(self, delay: float) -> bool:
+        """Whether waiting ``delay`` seconds and trying again is worthwhile."""
+        budget = remaining_budget()
+        return self.breaker.state == CircuitBreaker.CLOSED and (budget is None or budget > delay)
+    
+    def _admit(self) -> Tuple[Timeout, Optional[float]]:
+        """The timeout for a request that may start now, and the budget left (None for no deadline)."""
+        budget = remaining_budget()
+        if budget is not None and budget <= 0:
+            REJECTED.inc(upstream=self.name, reason="deadline_exceeded")
+            raise UpstreamUnavailable(self.name, "deadline_exceeded")
+        if not self.breaker.allow():
+            REJECTED.inc(upstream=self.name, reason="circuit_open")
+            raise UpstreamUnavailable(self.name, "circuit_open")
+        
+        connect, read = self.timeout
+        if budget is not None:
+            connect, read = min(connect, budget), min(read, budget)
+        return (connect, read), budget
+    
+    def _hedge_delay(self, timeout: Timeout) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge this request."""
+        if not self.hedge:
+            return None
+        p = self.latencies.quantile(self.hedge_quantile, self.hedge_min_samples)
+        if p is None:
+            return None
+        delay = max(p, self.hedge_min_delay)
+        return delay if delay < timeout[1] else None
+    
+    def _hedged(self, request, timeout: Timeout, delay: Optional[float], budget: Optional[float]):
+        started = time.monotonic()
+        pending = {_hedge_pool.submit(request, timeout)}
+        if delay is not None:
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                HEDGED.inc(upstream=self.name)
+                connect, read = timeout
+                pending.add(_hedge_pool.submit(request, (connect, max(read - delay, 0.001))))
+        
+        error = None
+        while pending:
+            wait_for = None if budget is None else budget - (time.monotonic() - started)
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                # Out of budget: leave the request to finish (or time out) on its own
+                raise UpstreamUnavailable(self.name, "deadline_exceeded")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    async def _ahedged(self, request, timeout: Timeout, delay: Optional[float]):
+        if delay is None:
+            return await request(timeout)
+        
+        pending = {asyncio.ensure_future(request(timeout))}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                HEDGED.inc(upstream=self.name)
+                connect, read = timeout
+                pending.add(asyncio.ensure_future(request((connect, max(read - delay, 0.001)))))
+            
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _record(self, success: bool, elapsed: float):
+        self.breaker.record(success, elapsed)
+        UPSTREAM_SECONDS.observe(elapsed, upstream=self.name)
+        if success:
+            self.latencies.add(elapsed)
+        else:
+            UPSTREAM_ERRORS.inc(upstream=self.name)
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    """Return the process-wide Upstream ("osrm" or "nominatim") configured from Django settings."""
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _upstreams[name] = _build_upstream(name)
+    return upstream
+
+
+def _build_upstream(name: str) -> Upstream:
+    from django.conf import settings
+    
+    return Upstream(
+        name,
+        timeout=get_timeout(),
+        breaker=CircuitBreaker(
+            window=getattr(settings, "UPSTREAM_BREAKER_WINDOW", 20),
+            min_calls=getattr(settings, "UPSTREAM_BREAKER_MIN_CALLS", 10),
+            failure_rate=getattr(settings, "UPSTREAM_BREAKER_FAILURE_RATE", 0.5),
+            slow_seconds=getattr(settings, "UPSTREAM_BREAKER_SLOW_SECONDS", 5.0),
+            open_seconds=getattr(settings, "UPSTREAM_BREAKER_OPEN_SECONDS", 30.0),
+        ),
+        hedge=getattr(settings, f"{name.upper()}_HEDGE", name == "osrm"),
+        hedge_quantile=getattr(settings, "UPSTREAM_HEDGE_QUANTILE", 0.95),
+        hedge_min_delay=getattr(settings, "UPSTREAM_HEDGE_MIN_DELAY", 0.05),
+    )
+
+
+def reset_upstreams():
+    """Drop the process-wide upstreams so the next call rebuilds them (with closed breakers) from settings."""
+    with _upstreams_lock:
+        _upstreams.clear()
+
+
+_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def _breaker_samples():
+    return [(
+        "trips_upstream_circuit_state", "gauge", "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+        [({"upstream": name}, _STATE_VALUES[upstream.breaker.state]) for name, upstream in sorted(_upstreams.items())]
+    )]
+
+
+registry.add_collector(_breaker_samples)
@@ -0,0 +1,494 @@
+"""
+Offline router over a local road graph.
+
+An OSM extract is compiled once (``manage.py build_road_graph``) into a
+compact CSR adjacency file that is memory-mapped at startup, so routes
+need no network and the graph costs almost no resident memory until it
+is searched. Queries snap each waypoint to the nearest road node and run
+A* on travel time, with straight-line distance at the graph's top speed
+as the heuristic. The search is plain Python, so it gives up (NoRoute)
+after ``max_settled`` nodes or once the trip's deadline has passed, and
+the caller asks OSRM instead.
+
+Index layout (little-endian, every array 4- or 8-byte aligned):
+    header     b"RGR1", node count (uint32), edge count (uint32), pad,
+               grid cell size in degrees (float64), top speed m/s (float64)
+    cells      nodes x int64 grid cell key, sorted (nodes are numbered in cell order)
+    indptr     (nodes + 1) x uint32: node i's edges are indptr[i]:indptr[i + 1]
+    targets    edges x uint32
+    lengths    edges x float32 meters
+    durations  edges x float32 seconds
+    coords     nodes x (lng float32, lat float32)
+
+Only the largest strongly connected part of the network is kept, so
+every node can reach every other along one-way roads and a waypoint
+never snaps onto a fragment with no way out.
+"""
+import bz2
+import gzip
+import heapq
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .resilience import remaining_budget
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RGR1"
+HEADER = struct.Struct("<4sII4xdd")
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_MILE = 1609.344
+MPH = METERS_PER_MILE / 3600  # meters per second
+
+# Grid for snapping waypoints to the nearest node (~1 km cells)
+CELL_DEGREES = 0.01
+GRID_COLUMNS = int(360 / CELL_DEGREES) + 1
+
+# Truck speeds (mph) by OSM highway type when a way has no usable maxspeed
+HIGHWAY_SPEEDS = {
+    "motorway": 65, "motorway_link": 40,
+    "trunk": 55, "trunk_link": 35,
+    "primary": 50, "primary_link": 30,
+    "secondary": 45, "secondary_link": 30,
+    "tertiary": 35, "tertiary_link": 25,
+    "unclassified": 30, "residential": 25, "living_street": 10, "service": 15,
+}
+TRUCK_MAX_MPH = 65
+
+# Settled nodes between checks of the trip's deadline
+DEADLINE_CHECK_INTERVAL = 1024
+
+Way = Tuple[Sequence[Tuple[float, float]], Dict[str, str]]
+
+
+class NoRoute(Exception):
+    """The local graph can't answer this query (off the network or unreachable)."""
+
+
+def _haversine_meters(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(h))
+
+
+def _cell_keys(lng: np.ndarray, lat: np.ndarray, cell: float = CELL_DEGREES) -> np.ndarray:
+    row = np.floor((lat + 90.0) / cell).astype(np.int64)
+    col = np.floor((lng + 180.0) / cell).astype(np.int64)
+    return row * GRID_COLUMNS + col
+
+
+class RoadGraph:
+    """
+    Read-only, memory-mapped road graph answering point-to-point route queries.
+    
+    Args:
+        path: Index written by build_graph
+        max_snap_miles: Farthest a waypoint may be from its road node
+        max_settled: Nodes a leg's search may settle before giving up (0 = no limit)
+    """
+    
+    def __init__(self, path: str, max_snap_miles: float = 2.0, max_settled: int = 50000):
+        self.path = path
+        self.max_snap_meters = max_snap_miles * METERS_PER_MILE
+        self.max_settled = max_settled
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.node_count, self.edge_count, self.cell, self.top_speed = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a road graph index")
+        
+        n, m = self.node_count, self.edge_count
+        self._offset = HEADER.size
+        self.cells, _ = self._array("<i8", n, "q")
+        self.indptr, self._indptr = self._array("<u4", n + 1, "I")
+        self.targets, self._targets = self._array("<u4", m, "I")
+        self.lengths, _ = self._array("<f4", m, "f")
+        self.durations, self._durations = self._array("<f4", m, "f")
+        coords, self._coords = self._array("<f4", n * 2, "f")
+        self.coords = coords.reshape(-1, 2)
+    
+    def _array(self, dtype: str, count: int, fmt: str) -> Tuple[np.ndarray, memoryview]:
+        """The next array in the file, as numpy (vectorized use) and as a memoryview (per-element use in A*)."""
+        start = self._offset
+        self._offset += count * np.dtype(dtype).itemsize
+        # Element access from Python is much cheaper through memoryviews than numpy scalars
+        return (
+            np.frombuffer(self._mm, dtype=dtype, count=count, offset=start),
+            memoryview(self._mm)[start:self._offset].cast(fmt)
+        )
+    
+    def __len__(self):
+        return self.node_count
+    
+    def route(self, waypoints: List[Tuple[float, float]]) -> Dict:
+        """
+        Route through (lat, lng) waypoints.
+        
+        Returns the same dict as RouteService.calculate_route (miles, hours,
+        [lng, lat] coordinates, legs); raises NoRoute when a waypoint is
+        off the network, a leg has no path or a search runs over its
+        node limit or the trip's deadline.
+        """
+        nodes = [self.nearest(lat, lng) for lat, lng in waypoints]
+        
+        path = [nodes[0]]
+        legs = []
+        total_meters = total_seconds = 0.0
+        for source, target in zip(nodes, nodes[1:]):
+            leg_nodes, edges = self._shortest_path(source, target)
+            meters = float(self.lengths[edges].sum(dtype=np.float64))
+            seconds = float(self.durations[edges].sum(dtype=np.float64))
+            total_meters += meters
+            total_seconds += seconds
+            path.extend(leg_nodes[1:])
+            legs.append({"distance": round(meters / METERS_PER_MILE, 1), "duration": round(seconds / 3600, 2)})
+        
+        return {
+            "distance": round(total_meters / METERS_PER_MILE, 1),
+            "duration": round(total_seconds / 3600, 2),
+            "coordinates": self.coords[path].astype(np.float64),
+            "legs": legs
+        }
+    
+    def nearest(self, lat: float, lng: float) -> int:
+        """Index of the closest node within the snap distance; raises NoRoute if there is none."""
+        row = math.floor((lat + 90.0) / self.cell)
+        col = math.floor((lng + 180.0) / self.cell)
+        # Search rings of grid cells outward until the snap distance is covered
+        cell_meters = self.cell * math.radians(1.0) * EARTH_RADIUS_METERS * max(math.cos(math.radians(lat)), 0.1)
+        max_ring = int(self.max_snap_meters // cell_meters) + 1
+        best, best_meters = -1, self.max_snap_meters
+        for ring in range(max_ring + 1):
+            for dr in range(-ring, ring + 1):
+                # Only the ring's border: left and right columns, plus top and bottom rows
+                cols = range(-ring, ring + 1) if abs(dr) == ring else (-ring, ring)
+                for dc in cols:
+                    key = (row + dr) * GRID_COLUMNS + col + dc
+                    lo = int(np.searchsorted(self.cells, key, side="left"))
+                    hi = int(np.searchsorted(self.cells, key, side="right"))
+                    for i in range(lo, hi):
+                        meters = _haversine_meters(lng, lat, self._coords[2 * i], self._coords[2 * i + 1])
+                        if meters < best_meters:
+                            best, best_meters = i, meters
+            # Anything in later rings is at least a ring's width farther away
+            if best >= 0 and best_meters <= ring * cell_meters:
+                break
+        if best < 0:
+            raise NoRoute(f"No road within {self.max_snap_meters / METERS_PER_MILE:g} miles of ({lat}, {lng})")
+        return best
+    
+    def _shortest_path(self, source: int, target: int) -> Tuple[List[int], List[int]]:
+        """A* on travel time; returns the path's nodes and edge indexes, or raises NoRoute."""
+        if source == target:
+            return [source], []
+        
+        indptr, targets, durations, coords = self._indptr, self._targets, self._durations, self._coords
+        target_lng, target_lat = coords[2 * target], coords[2 * target + 1]
+        
+        # Heuristic: flat-earth distance at the graph's top speed, in seconds. Longitude
+        # degrees are scaled for a latitude 5 degrees poleward of both ends, so the
+        # estimate stays below the true travel time (keeping A* exact) and is cheap
+        source_lat = coords[2 * source + 1]
+        poleward = min(max(abs(source_lat), abs(target_lat)) + 5.0, 89.0)
+        x_scale = math.cos(math.radians(poleward))
+        seconds_per_degree = math.radians(1.0) * EARTH_RADIUS_METERS / self.top_speed
+        
+        def heuristic(node):
+            dx = (coords[2 * node] - target_lng) * x_scale
+            dy = coords[2 * node + 1] - target_lat
+            return math.sqrt(dx * dx + dy * dy) * seconds_per_degree
+        
+        max_settled = self.max_settled or math.inf
+        settled = 0
+        best = {source: 0.0}
+        via = {}  # node -> (previous node, edge)
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue
+            settled += 1
+            if settled > max_settled:
+                raise NoRoute(f"Search gave up after {self.max_settled} nodes")
+            if settled % DEADLINE_CHECK_INTERVAL == 0:
+                budget = remaining_budget()
+                if budget is not None and budget <= 0:
+                    raise NoRoute("Search ran past the trip's deadline")
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = targets[edge]
+                candidate = cost + durations[edge]
+                if candidate < best.get(neighbor, math.inf):
+                    best[neighbor] = candidate
+                    via[neighbor] = (node, edge)
+                    heapq.heappush(heap, (candidate + heuristic(neighbor), candidate, neighbor))
+        else:
+            raise NoRoute("No road path between the waypoints")
+        
+        nodes, edges = [target], []
+        while nodes[-1] != source:
+            node, edge = via[nodes[-1]]
+            nodes.append(node)
+            edges.append(edge)
+        nodes.reverse()
+        edges.reverse()
+        return nodes, edges
+
+
+def _open_extract(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_osm_xml(path: str) -> Iterator[Way]:
+    """
+    Yield (coordinates, tags) for every way in an OSM XML extract (.osm, .osm.bz2, .osm.gz).
+    
+    Node positions are held in memory while the file is read; for large
+    extracts use the .pbf reader.
+    """
+    nodes: Dict[str, Tuple[float, float]] = {}
+    with _open_extract(path) as f:
+        for _, element in ET.iterparse(f, events=("end",)):
+            if element.tag == "node":
+                nodes[element.get("id")] = (float(element.get("lon")), float(element.get("lat")))
+            elif element.tag == "way":
+                refs = [nd.get("ref") for nd in element.iter("nd")]
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                if "highway" in tags:
+                    yield [nodes[ref] for ref in refs if ref in nodes], tags
+            elif element.tag == "relation":
+                break
+            if element.tag in ("node", "way"):
+                element.clear()
+
+
+def read_osm_pbf(path: str) -> Iterator[Way]:
+    """Yield (coordinates, tags) for every highway in an OSM PBF extract; needs the osmium package."""
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("PBF extracts require the osmium package (pip install osmium)") from None
+    
+    ways: List[Way] = []
+    
+    class Handler(osmium.SimpleHandler):
+        def way(self, way):
+            if "highway" in way.tags:
+                coords = [(n.location.lon, n.location.lat) for n in way.nodes if n.location.valid()]
+                ways.append((coords, {tag.k: tag.v for tag in way.tags}))
+    
+    Handler().apply_file(path, locations=True)
+    yield from ways
+
+
+def read_extract(path: str) -> Iterator[Way]:
+    """Yield ways from an OSM extract, picking the reader by file extension."""
+    return read_osm_pbf(path) if path.endswith(".pbf") else read_osm_xml(path)
+
+
+def way_speed_mph(tags: Dict[str, str]) -> Optional[float]:
+    """Truck speed for a way, or None if trucks can't drive it."""
+    highway = tags.get("highway")
+    if highway not in HIGHWAY_SPEEDS or tags.get("area") == "yes":
+        return None
+    if any(tags.get(key) in ("no", "private") for key in ("access", "motor_vehicle", "hgv")):
+        return None
+    
+    speed = HIGHWAY_SPEEDS[highway]
+    # Posted limits are km/h unless marked mph
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", tags.get("maxspeed", ""))
+    if match and float(match.group(1)) > 0:
+        speed = float(match.group(1)) if match.group(2) else float(match.group(1)) / 1.609344
+    return min(speed, TRUCK_MAX_MPH)
+
+
+def way_directions(tags: Dict[str, str]) -> Tuple[bool, bool]:
+    """(forward, backward) travel allowed along the way's node order."""
+    oneway = tags.get("oneway", "")
+    if oneway == "-1":
+        return False, True
+    if oneway in ("yes", "true", "1"):
+        return True, False
+    if oneway == "no":
+        return True, True
+    implied = tags.get("highway") == "motorway" or tags.get("junction") in ("roundabout", "circular")
+    return True, not implied
+
+
+def build_graph(ways: Iterable[Way], output_path: str) -> Tuple[int, int]:
+    """Compile drivable ways into a road graph index; returns (nodes, edges) written."""
+    ids: Dict[Tuple[float, float], int] = {}
+    points: List[Tuple[float, float]] = []
+    sources: List[int] = []
+    targets: List[int] = []
+    speeds: List[float] = []
+    
+    for coords, tags in ways:
+        speed = way_speed_mph(tags)
+        if speed is None or len(coords) < 2:
+            continue
+        forward, backward = way_directions(tags)
+        indexes = []
+        for point in coords:
+            index = ids.get(point)
+            if index is None:
+                index = ids[point] = len(points)
+                points.append(point)
+            indexes.append(index)
+        for a, b in zip(indexes, indexes[1:]):
+            if a == b:
+                continue
+            if forward:
+                sources.append(a)
+                targets.append(b)
+                speeds.append(speed)
+            if backward:
+                sources.append(b)
+                targets.append(a)
+                speeds.append(speed)
+    
+    if not sources:
+        raise ValueError("The extract has no drivable roads")
+    
+    coords = np.array(points, dtype=np.float64)
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    speeds = np.array(speeds, dtype=np.float64) * MPH
+    
+    # Keep the largest strongly connected part, then number nodes in grid cell order
+    keep = _largest_component(len(coords), sources, targets)
+    edge_kept = keep[sources] & keep[targets]
+    cells = _cell_keys(coords[:, 0], coords[:, 1])
+    kept_nodes = np.flatnonzero(keep)
+    order = kept_nodes[np.argsort(cells[kept_nodes], kind="stable")]
+    renumber = np.full(len(coords), -1, dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    
+    sources, targets, speeds = renumber[sources[edge_kept]], renumber[targets[edge_kept]], speeds[edge_kept]
+    coords, cells = coords[order], cells[order]
+    lng1, lat1 = np.radians(coords[sources, 0]), np.radians(coords[sources, 1])
+    lng2, lat2 = np.radians(coords[targets, 0]), np.radians(coords[targets, 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    lengths = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(h))
+    
+    by_source = np.argsort(sources, kind="stable")
+    sources, targets, lengths, speeds = sources[by_source], targets[by_source], lengths[by_source], speeds[by_source]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=len(coords)))))
+    
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(coords), len(targets), CELL_DEGREES, float(speeds.max())))
+        f.write(cells.astype("<i8").tobytes())
+        f.write(indptr.astype("<u4").tobytes())
+        f.write(targets.astype("<u4").tobytes())
+        f.write(lengths.astype("<f4").tobytes())
+        f.write((lengths / speeds).astype("<f4").tobytes())
+        f.write(coords.astype("<f4").tobytes())
+    return len(coords), len(targets)
+
+
+def _largest_component(count: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Mask of the nodes in the largest strongly connected component.
+    
+    Every node kept can reach every other along one-way roads, so any two
+    snapped waypoints have a path between them. Kosaraju's algorithm with
+    explicit stacks (the graph is far too deep for recursion).
+    """
+    out_starts, out_neighbors = _adjacency(count, sources, targets)
+    in_starts, in_neighbors = _adjacency(count, targets, sources)
+    
+    # Pass 1: nodes in order of finishing a depth-first search along the edges
+    finished = []
+    visited = bytearray(count)
+    for seed in range(count):
+        if visited[seed]:
+            continue
+        visited[seed] = 1
+        stack = [(seed, out_starts[seed])]
+        while stack:
+            node, i = stack[-1]
+            if i < out_starts[node + 1]:
+                stack[-1] = (node, i + 1)
+                neighbor = out_neighbors[i]
+                if not visited[neighbor]:
+                    visited[neighbor] = 1
+                    stack.append((neighbor, out_starts[neighbor]))
+            else:
+                stack.pop()
+                finished.append(node)
+    
+    # Pass 2: against the edges, latest finished first; each search is one component
+    component = [-1] * count
+    sizes = []
+    for seed in reversed(finished):
+        if component[seed] >= 0:
+            continue
+        label = len(sizes)
+        component[seed] = label
+        stack = [seed]
+        size = 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for neighbor in in_neighbors[in_starts[node]:in_starts[node + 1]]:
+                if component[neighbor] < 0:
+                    component[neighbor] = label
+                    stack.append(neighbor)
+        sizes.append(size)
+    return np.array(component) == int(np.argmax(sizes))
+
+
+def _adjacency(count: int, sources: np.ndarray, targets: np.ndarray) -> Tuple[List[int], List[int]]:
+    """CSR adjacency as Python lists (cheap to index from a loop): (starts, neighbors)."""
+    order = np.argsort(sources, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=count))))
+    return starts.tolist(), targets[order].tolist()
+
+
+_road_graph = None
+_road_graph_loaded = False
+_road_graph_lock = threading.Lock()
+
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """Return the process-wide road graph, or None unless it is enabled and built."""
+    global _road_graph, _road_graph_loaded
+    if not _road_graph_loaded:
+        with _road_graph_lock:
+            if not _road_graph_loaded:
+                from django.conf import settings
+                path = getattr(settings, "ROAD_GRAPH_INDEX", "")
+                if getattr(settings, "ROAD_GRAPH_ENABLED", False) and path:
+                    if os.path.exists(path):
+                        _road_graph = RoadGraph(
+                            path,
+                            max_snap_miles=getattr(settings, "ROAD_GRAPH_MAX_SNAP_MILES", 2.0),
+                            max_settled=getattr(settings, "ROAD_GRAPH_MAX_SETTLED", 50000),
+                        )
+                    else:
+                        logger.warning("ROAD_GRAPH_ENABLED is set but %s does not exist; routing with OSRM", path)
+                _road_graph_loaded = True
+    return _road_graph
+
+
+def reset_road_graph():
+    """Drop the process-wide road graph so the next route reloads it from settings."""
+    global _road_graph, _road_graph_loaded
+    with _road_graph_lock:
+        _road_graph = None
+        _road_graph_loaded = False
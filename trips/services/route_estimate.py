@@ -0,0 +1,182 @@
+"""
+Road route estimates from straight-line distance, for when OSRM can't be used.
+
+Great-circle leg distances are scaled by a circuity factor (road miles
+per straight-line mile, about 1.2 across the US) that can differ by
+region, and durations assume a flat average speed. The geometry follows
+the great circle with a vertex every few miles, so stop placement and
+re-plans have a usable polyline.
+
+Every leg of every route is computed in the same NumPy calls, so
+estimating thousands of lanes at once (``estimate_many``) costs about as
+much as a handful of OSRM responses to parse.
+"""
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .geometry import densify_great_circle, haversine_miles
+
+Waypoints = Sequence[Tuple[float, float]]
+
+
+class CircuityRegion:
+    """A lng/lat bounding box whose legs use their own circuity factor."""
+    
+    __slots__ = ("name", "min_lng", "min_lat", "max_lng", "max_lat", "factor")
+    
+    def __init__(self, name: str, bbox: Sequence[float], factor: float):
+        if len(bbox) != 4:
+            raise ValueError(f"Circuity region {name!r} needs a [min_lng, min_lat, max_lng, max_lat] bbox")
+        if factor < 1:
+            raise ValueError(f"Circuity factor for region {name!r} must be at least 1")
+        self.name = name
+        self.min_lng, self.min_lat, self.max_lng, self.max_lat = (float(v) for v in bbox)
+        self.factor = float(factor)
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CircuityRegion":
+        return cls(data.get("name", ""), data["bbox"], data["factor"])
+    
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """Boolean mask of the [lng, lat] rows inside the box."""
+        lng, lat = points[:, 0], points[:, 1]
+        return (lng >= self.min_lng) & (lng <= self.max_lng) & (lat >= self.min_lat) & (lat <= self.max_lat)
+
+
+class RouteEstimator:
+    """
+    Estimates routes in the shape RouteService returns from OSRM.
+    
+    Args:
+        circuity: Road miles per straight-line mile outside every region
+        regions: Regions with their own factor; a leg uses the first
+            region containing its midpoint
+        speed_mph: Average speed over the estimated road miles
+        segment_miles: Longest straight-line gap between geometry vertices
+    """
+    
+    def __init__(
+        self,
+        circuity: float = 1.2,
+        regions: Sequence[CircuityRegion] = (),
+        speed_mph: float = 60.0,
+        segment_miles: float = 10.0
+    ):
+        if circuity < 1:
+            raise ValueError("Circuity factor must be at least 1")
+        if speed_mph <= 0:
+            raise ValueError("Fallback speed must be positive")
+        self.circuity = circuity
+        self.regions = list(regions)
+        self.speed_mph = speed_mph
+        self.segment_miles = segment_miles
+    
+    def estimate(self, waypoints: Waypoints) -> Dict:
+        """Estimate one route through (lat, lng) waypoints."""
+        return self.estimate_many([waypoints])[0]
+    
+    def estimate_many(self, routes: Sequence[Waypoints]) -> List[Dict]:
+        """Estimate several routes at once; returns one route dict per waypoint list."""
+        if not routes:
+            return []
+        
+        # Every waypoint of every route as [lng, lat], and the legs between them
+        counts = np.array([len(waypoints) for waypoints in routes])
+        if counts.min() < 1:
+            raise ValueError("Every route needs at least one waypoint")
+        points = np.array([(lng, lat) for waypoints in routes for lat, lng in waypoints], dtype=np.float64)
+        route_ends = np.cumsum(counts)
+        is_leg_start = np.ones(len(points), dtype=bool)
+        is_leg_start[route_ends - 1] = False
+        starts = points[is_leg_start]
+        ends = points[np.flatnonzero(is_leg_start) + 1]
+        
+        straight = haversine_miles(starts, ends)
+        road = straight * self.circuity_factors((starts + ends) / 2)
+        hours = road / self.speed_mph
+        coordinates = self._densify(starts, ends, straight, points[route_ends - 1], counts - 1)
+        
+        estimates = []
+        leg_bounds = np.concatenate(([0], np.cumsum(counts - 1)))
+        for i in range(len(routes)):
+            first, last = leg_bounds[i], leg_bounds[i + 1]
+            estimates.append({
+                "distance": round(float(road[first:last].sum()), 1),
+                "duration": round(float(hours[first:last].sum()), 2),
+                "coordinates": coordinates[i],
+                "legs": [
+                    {"distance": round(float(d), 1), "duration": round(float(h), 2)}
+                    for d, h in zip(road[first:last], hours[first:last])
+                ]
+            })
+        return estimates
+    
+    def matrix(self, waypoints: Waypoints) -> Tuple[np.ndarray, np.ndarray]:
+        """Estimated road miles and hours between every pair of (lat, lng) waypoints, as (n, n) arrays."""
+        points = np.array([(lng, lat) for lat, lng in waypoints], dtype=np.float64)
+        starts, ends = np.broadcast_arrays(points[:, None, :], points[None, :, :])
+        midpoints = ((starts + ends) / 2).reshape(-1, 2)
+        road = haversine_miles(starts, ends) * self.circuity_factors(midpoints).reshape(len(points), len(points))
+        return road, road / self.speed_mph
+    
+    def circuity_factors(self, points: np.ndarray) -> np.ndarray:
+        """Circuity factor for each [lng, lat] row."""
+        factors = np.full(len(points), self.circuity)
+        unassigned = np.ones(len(points), dtype=bool)
+        for region in self.regions:
+            inside = unassigned & region.contains(points)
+            factors[inside] = region.factor
+            unassigned &= ~inside
+        return factors
+    
+    def _densify(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        straight: np.ndarray,
+        finals: np.ndarray,
+        legs_per_route: np.ndarray
+    ) -> List[np.ndarray]:
+        """Great-circle polylines with vertices at most ``segment_miles`` apart, one per route."""
+        if self.segment_miles > 0:
+            pieces = np.maximum(np.ceil(straight / self.segment_miles), 1).astype(np.int64)
+        else:
+            pieces = np.ones(len(straight), dtype=np.int64)
+        
+        # Each leg's end is the next leg's start, so only the route's last point is missing
+        vertices = densify_great_circle(starts, ends, pieces)
+        
+        # Close each route with its final waypoint
+        route_of_leg = np.repeat(np.arange(len(finals)), legs_per_route)
+        route_ends = np.cumsum(np.bincount(route_of_leg, weights=pieces, minlength=len(finals)).astype(np.int64))
+        vertices = np.insert(vertices, route_ends, finals, axis=0)
+        return np.split(vertices, route_ends[:-1] + np.arange(1, len(finals)))
+
+
+_default_estimator: Optional[RouteEstimator] = None
+_estimator_lock = threading.Lock()
+
+
+def get_route_estimator() -> RouteEstimator:
+    """Return the process-wide estimator configured from Django settings."""
+    global _default_estimator
+    if _default_estimator is None:
+        with _estimator_lock:
+            if _default_estimator is None:
+                from django.conf import settings
+                _default_estimator = RouteEstimator(
+                    circuity=getattr(settings, "ROUTE_CIRCUITY_FACTOR", 1.2),
+                    regions=[CircuityRegion.from_dict(r) for r in getattr(settings, "ROUTE_CIRCUITY_REGIONS", [])],
+                    speed_mph=getattr(settings, "ROUTE_FALLBACK_SPEED_MPH", 60.0),
+                    segment_miles=getattr(settings, "ROUTE_FALLBACK_SEGMENT_MILES", 10.0),
+                )
+    return _default_estimator
+
+
+def reset_route_estimator():
+    """Drop the process-wide estimator so the next call rebuilds it from settings."""
+    global _default_estimator
+    with _estimator_lock:
+        _default_estimator = None
@@ -1,11 +1,52 @@
 """
 Route calculation service using OpenStreetMap Nominatim and OSRM.
 """
+import asyncio
+import contextvars
+import httpx
+import logging
+import numpy as np
 import requests
+import threading
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
 from typing import Dict, List, Tuple
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 import time
+from .gazetteer import Gazetteer, get_gazetteer
+from .metrics import ROUTE_FALLBACKS, UPSTREAM_ERRORS
+from .geometry import as_coords
+from .cache import (
+    GeocodeCache,
+    MISSING,
+    MatrixCache,
+    RouteCache,
+    get_geocode_cache,
+    get_matrix_cache,
+    get_route_cache,
+    normalize_address,
+)
+from .http_client import (
+    SharedSessionAdapter,
+    get_async_client,
+    get_nominatim_url,
+    get_osrm_url,
+    get_session,
+    get_timeout,
+    split_base_url
+)
+from .rate_limit import RateLimiter, RequestCoalescer, get_geocode_coalescer, get_nominatim_limiter
+from .resilience import REJECTED, UpstreamUnavailable, get_upstream, remaining_budget
+from .road_graph import NoRoute, RoadGraph, get_road_graph
+from .route_estimate import RouteEstimator, get_route_estimator
+
+logger = logging.getLogger(__name__)
+
+# Long-lived threads for the Nominatim lookups of every geocode_unique() call.
+# Each keeps its own database connection (for the geocode cache) between lookups
+# rather than every call starting threads that each open a new one.
+_geocode_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geocode")
 
 
 class RouteService:
@@ -69,46 +110,267 @@ class RouteService:
         'miami, florida': (25.7617, -80.1918),
     }
     
-    def __init__(self):
-        # Increase timeout to 10 seconds
-        self.geocoder = Nominatim(user_agent="eld-trip-planner", timeout=10)
-        self.osrm_base = "http://router.project-osrm.org/route/v1/driving"
+    # Default bound on concurrent Nominatim lookups per geocode_unique() call
+    GEOCODE_MAX_WORKERS = 4
+    
+    def __init__(
+        self,
+        geocode_cache: GeocodeCache = None,
+        route_cache: RouteCache = None,
+        rate_limiter: RateLimiter = None,
+        gazetteer: Gazetteer = None,
+        coalescer: RequestCoalescer = None,
+        estimator: RouteEstimator = None,
+        road_graph: RoadGraph = None,
+        matrix_cache: MatrixCache = None
+    ):
+        # Both upstreams share one keep-alive session with (connect, read) timeouts
+        self.session = get_session()
+        self.timeout = get_timeout()
+        scheme, domain = split_base_url(get_nominatim_url())
+        self.geocoder = Nominatim(
+            user_agent="eld-trip-planner",
+            timeout=self.timeout,
+            domain=domain,
+            scheme=scheme,
+            adapter_factory=SharedSessionAdapter
+        )
+        self.osrm_base = f"{get_osrm_url()}/route/v1/driving"
+        self.osrm_table = f"{get_osrm_url()}/table/v1/driving"
+        # Circuit breaker, hedging and deadline handling per upstream (shared by the process)
+        self.osrm = get_upstream("osrm")
+        self.nominatim = get_upstream("nominatim")
+        # Shared across instances unless one is passed in explicitly
+        self.geocode_cache = geocode_cache if geocode_cache is not None else get_geocode_cache()
+        self.route_cache = route_cache if route_cache is not None else get_route_cache()
+        self.matrix_cache = matrix_cache if matrix_cache is not None else get_matrix_cache()
+        # Nominatim's usage policy applies to the whole process, not per instance
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_nominatim_limiter()
+        # Concurrent lookups of one address (from any instance) share a single Nominatim call
+        self.coalescer = coalescer if coalescer is not None else get_geocode_coalescer()
+        # Offline place index; None when no gazetteer has been built
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        # Straight-line route estimates for when OSRM can't be used
+        self.estimator = estimator if estimator is not None else get_route_estimator()
+        # Offline road graph router; None when no graph has been built
+        self.road_graph = road_graph if road_graph is not None else get_road_graph()
     
     def geocode(self, address: str) -> Tuple[float, float]:
-        """Convert address to coordinates (lat, lng) with retry logic and fallback."""
-        # First, try the cache for common cities
-        address_lower = address.lower().strip()
-        if address_lower in self.CITY_COORDS:
-            print(f"Using cached coordinates for: {address}")
-            return self.CITY_COORDS[address_lower]
-        
+        """Convert address to coordinates (lat, lng) with caching, retry logic and fallback."""
+        coords = self._known_coords(address)
+        if coords is MISSING:
+            return self.coalescer.run(normalize_address(address), lambda: self._lookup(address))
+        if coords is None:
+            raise ValueError(self._geocode_error(address))
+        return coords
+    
+    def _known_coords(self, address: str):
+        """
+        Coordinates available without calling Nominatim: the built-in
+        coordinates, the offline gazetteer, then the geocode cache.
+        Returns None for a recently failed lookup, or MISSING.
+        """
+        coords = self._local_coords(address)
+        if coords is not None:
+            return coords
+        cached = self.geocode_cache.get(address)
+        if cached is MISSING:
+            return self._fuzzy_coords(address)
+        return cached
+    
+    def _lookup(self, address: str) -> Tuple[float, float]:
+        """Geocode an address with Nominatim, with retries, and cache the answer."""
         # Try geocoding with retries
         max_retries = 2  # Reduced retries since we have fallback
         retry_delay = 1
         
         for attempt in range(max_retries):
+            # Don't queue for a rate limit slot while Nominatim is known to be down
+            if not self.nominatim.available():
+                raise ValueError(self._unavailable_error(address))
+            # Nor for one that would only come after the trip's deadline
+            if not self.rate_limiter.acquire(remaining_budget()):
+                REJECTED.inc(upstream=self.nominatim.name, reason="deadline_exceeded")
+                raise ValueError(self._unavailable_error(address))
             try:
-                location = self.geocoder.geocode(address)
-                if location:
-                    return (location.latitude, location.longitude)
-                raise ValueError(f"Could not find location: {address}")
-            except Exception as e:
-                if attempt < max_retries - 1:
+                location = self.nominatim.call(lambda timeout: self.geocoder.geocode(address, timeout=timeout))
+            except UpstreamUnavailable:
+                raise ValueError(self._unavailable_error(address))
+            except Exception:
+                # Only retry while Nominatim looks healthy and the trip has time left
+                if attempt < max_retries - 1 and self.nominatim.can_retry(retry_delay):
                     time.sleep(retry_delay)
                     continue
-                else:
-                    # Suggest using common city format
-                    raise ValueError(
-                        f"Could not geocode '{address}'. "
-                        f"Please try using format: 'City, State' (e.g., 'Los Angeles, CA'). "
-                        f"Or use a major city name."
-                    )
+                # Upstream errors are transient, so they are not cached
+                raise ValueError(self._geocode_error(address))
+            
+            if location:
+                coords = (location.latitude, location.longitude)
+                self.geocode_cache.set(address, coords)
+                return coords
+            
+            # Nominatim has no match for this address
+            self.geocode_cache.set(address, None)
+            raise ValueError(self._geocode_error(address))
+    
+    def _local_coords(self, address: str):
+        """Return coordinates known without any network call (but no spelling correction), else None."""
+        address_lower = normalize_address(address)
+        if address_lower in self.CITY_COORDS:
+            logger.debug("Using built-in coordinates for %s", address)
+            return self.CITY_COORDS[address_lower]
+        if self.gazetteer is not None:
+            return self.gazetteer.lookup(address, fuzzy=False)
+        return None
+    
+    def _fuzzy_coords(self, address: str):
+        """
+        The gazetteer's spelling-tolerant match, else MISSING. It scans many
+        index keys, so it only runs once the geocode cache has missed too
+        (and answers are remembered by the gazetteer).
+        """
+        if self.gazetteer is None:
+            return MISSING
+        coords = self.gazetteer.lookup_fuzzy(address)
+        return coords if coords is not None else MISSING
+    
+    def _unavailable_error(self, address: str) -> str:
+        return (
+            f"Could not geocode '{address}': the geocoding service is unavailable right now. "
+            f"Please try again shortly, or use a major city name (e.g., 'Los Angeles, CA')."
+        )
+    
+    def _geocode_error(self, address: str) -> str:
+        # Suggest using common city format
+        return (
+            f"Could not geocode '{address}'. "
+            f"Please try using format: 'City, State' (e.g., 'Los Angeles, CA'). "
+            f"Or use a major city name."
+        )
+    
+    def geocode_many(self, addresses: List[str]) -> List[Tuple[float, float]]:
+        """
+        Geocode several addresses concurrently, returning coords in input order.
+        
+        Addresses that normalize to the same key are looked up once. If any
+        lookup fails, the ValueError for the first failing address is raised.
+        """
+        results = self.geocode_unique(addresses)
+        
+        coords = []
+        for address in addresses:
+            result = results[normalize_address(address)]
+            if isinstance(result, ValueError):
+                raise result
+            coords.append(result)
+        return coords
+    
+    def geocode_unique(self, addresses: List[str], max_workers: int = None) -> Dict:
+        """
+        Geocode each distinct address once, concurrently.
+        
+        Addresses known locally or cached are resolved on the calling thread;
+        only Nominatim lookups go to the shared geocode pool, at most
+        ``max_workers`` of them at a time for this call.
+        
+        Returns a dict keyed by normalized address whose values are (lat, lng)
+        tuples, or the ValueError raised for addresses that failed.
+        """
+        unique = {}
+        for address in addresses:
+            unique.setdefault(normalize_address(address), address)
+        
+        results = {}
+        lookups = {}
+        for key, address in unique.items():
+            coords = self._known_coords(address)
+            if coords is MISSING:
+                lookups[key] = address
+            else:
+                results[key] = coords if coords is not None else ValueError(self._geocode_error(address))
+        
+        if len(lookups) <= 1:
+            results.update({key: self._try_lookup(address) for key, address in lookups.items()})
+            return results
+        
+        slots = threading.Semaphore(min(max_workers or self.GEOCODE_MAX_WORKERS, len(lookups)))
+        futures = {}
+        for key, address in lookups.items():
+            slots.acquire()
+            # Each lookup runs in a copy of the caller's context so the trip's deadline applies
+            future = _geocode_pool.submit(contextvars.copy_context().run, self._pooled_lookup, address)
+            future.add_done_callback(lambda _: slots.release())
+            futures[key] = future
+        results.update({key: future.result() for key, future in futures.items()})
+        return results
+    
+    def _try_lookup(self, address: str):
+        """Look an address up with Nominatim, returning the ValueError instead of raising it."""
+        try:
+            return self.coalescer.run(normalize_address(address), lambda: self._lookup(address))
+        except ValueError as e:
+            return e
+    
+    def _pooled_lookup(self, address: str):
+        """_try_lookup() on a geocode pool thread, dropping its database connection once it is stale."""
+        close_old_connections()
+        try:
+            return self._try_lookup(address)
+        finally:
+            close_old_connections()
     
     def calculate_route(self, waypoints: List[Tuple[float, float]]) -> Dict:
         """
         Calculate route through multiple waypoints.
-        Returns route with coordinates, distance (miles), and duration (hours).
+        Returns route with coordinates (an (n, 2) array of [lng, lat]),
+        distance (miles), and duration (hours).
         """
+        key = self.route_cache.key(waypoints)
+        route, fresh = self.route_cache.get(key)
+        if route is not None:
+            # Serve a stale route now and refresh it for the next caller (not while OSRM is down)
+            if not fresh and self.osrm.available():
+                self.route_cache.refresh(key, lambda: self._request_route(waypoints))
+            return route
+        
+        try:
+            route = self._request_route(waypoints)
+        except (requests.RequestException, UpstreamUnavailable) as e:
+            # Fallback to straight-line distance if routing fails, the OSRM
+            # circuit is open or the trip is out of time (not cached)
+            ROUTE_FALLBACKS.inc(reason=getattr(e, "reason", "error"))
+            return self._fallback_route(waypoints)
+        
+        self.route_cache.set(key, route)
+        return route
+    
+    def _request_route(self, waypoints: List[Tuple[float, float]]) -> Dict:
+        """Route with the local road graph, else OSRM; raises requests.RequestException on failure."""
+        route = self._local_route(waypoints)
+        if route is not None:
+            return route
+        
+        url, params = self._osrm_request(waypoints)
+        
+        def request(timeout):
+            response = self.session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            return response
+        
+        return self._parse_route(self.osrm.call(request).json())
+    
+    def _local_route(self, waypoints: List[Tuple[float, float]]):
+        """Route on the local road graph, or None when there is no graph or it can't route these waypoints."""
+        if self.road_graph is None:
+            return None
+        try:
+            return self.road_graph.route(waypoints)
+        except NoRoute:
+            # Off the extract's network (or unreachable in it): OSRM may still know a way
+            return None
+    
+    def _osrm_request(self, waypoints: List[Tuple[float, float]]) -> Tuple[str, Dict]:
+        """Build the OSRM route URL and query parameters for waypoints."""
         # Format coordinates for OSRM (lng,lat)
         coords_str = ";".join([f"{lng},{lat}" for lat, lng in waypoints])
         
@@ -118,33 +380,203 @@ class RouteService:
             "geometries": "geojson",
             "steps": "false"
         }
+        return url, params
+    
+    def _parse_route(self, data: Dict) -> Dict:
+        """Convert an OSRM route response into the route dict."""
+        if data.get("code") != "Ok":
+            UPSTREAM_ERRORS.inc(upstream="osrm")
+            raise ValueError("OSRM routing failed")
+        
+        route = data["routes"][0]
+        
+        # Convert meters to miles, seconds to hours
+        distance_miles = route["distance"] * 0.000621371
+        duration_hours = route["duration"] / 3600
+        
+        # Extract coordinates (they're in [lng, lat] format)
+        coordinates = as_coords(route["geometry"]["coordinates"])
+        
+        return {
+            "distance": round(distance_miles, 1),
+            "duration": round(duration_hours, 2),
+            "coordinates": coordinates,
+            "legs": self._process_legs(route.get("legs", []))
+        }
+    
+    def distance_matrix(self, waypoints: List[Tuple[float, float]]) -> Dict:
+        """
+        Road distance (miles) and duration (hours) between every pair of waypoints.
+        Returns distances and durations as (n, n) arrays, where row i holds the
+        trips starting at waypoint i, and the source ("osrm" or "estimate").
+        
+        One OSRM table request covers the whole matrix and is cached for the
+        location set. Pairs OSRM can't route are estimated; so is the whole
+        matrix when OSRM fails, its circuit is open or the trip is out of
+        time (not cached).
+        """
+        matrix = self.matrix_cache.get(waypoints)
+        if matrix is not None:
+            return matrix
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            distances, durations = self._request_table(waypoints)
+        except (requests.RequestException, UpstreamUnavailable, ValueError) as e:
+            ROUTE_FALLBACKS.inc(reason=getattr(e, "reason", "error"))
+            distances, durations = self.estimator.matrix(waypoints)
+            return {"distances": distances, "durations": durations, "source": "estimate"}
+        
+        unrouted = np.isnan(distances) | np.isnan(durations)
+        if unrouted.any():
+            estimated_distances, estimated_durations = self.estimator.matrix(waypoints)
+            distances = np.where(unrouted, estimated_distances, distances)
+            durations = np.where(unrouted, estimated_durations, durations)
+        
+        matrix = {"distances": distances, "durations": durations, "source": "osrm"}
+        self.matrix_cache.set(waypoints, matrix)
+        return matrix
+    
+    def _request_table(self, waypoints: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Fetch an OSRM table; raises requests.RequestException or ValueError on failure."""
+        coords_str = ";".join([f"{lng},{lat}" for lat, lng in waypoints])
+        url = f"{self.osrm_table}/{coords_str}"
+        params = {"annotations": "distance,duration"}
+        
+        def request(timeout):
+            response = self.session.get(url, params=params, timeout=timeout)
             response.raise_for_status()
-            data = response.json()
-            
-            if data.get("code") != "Ok":
-                raise ValueError("OSRM routing failed")
-            
-            route = data["routes"][0]
-            
-            # Convert meters to miles, seconds to hours
-            distance_miles = route["distance"] * 0.000621371
-            duration_hours = route["duration"] / 3600
+            return response
+        
+        return self._parse_table(self.osrm.call(request).json(), len(waypoints))
+    
+    def _parse_table(self, data: Dict, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert an OSRM table response into (miles, hours) arrays; unroutable pairs are NaN."""
+        if data.get("code") != "Ok" or "distances" not in data or "durations" not in data:
+            UPSTREAM_ERRORS.inc(upstream="osrm")
+            raise ValueError("OSRM table request failed")
+        
+        # OSRM reports unroutable pairs as null
+        distances = np.array(data["distances"], dtype=np.float64)
+        durations = np.array(data["durations"], dtype=np.float64)
+        if distances.shape != (size, size) or durations.shape != (size, size):
+            UPSTREAM_ERRORS.inc(upstream="osrm")
+            raise ValueError("OSRM table has the wrong shape")
+        
+        # Convert meters to miles, seconds to hours
+        return distances * 0.000621371, durations / 3600
+    
+    # Async variants (for async views under ASGI); they share caches and the
+    # Nominatim rate limiter with the sync methods above.
+    
+    async def ageocode(self, address: str) -> Tuple[float, float]:
+        """Async version of geocode() using the async HTTP client."""
+        coords = self._local_coords(address)
+        if coords is not None:
+            return coords
+        
+        cached = await self.geocode_cache.aget(address)
+        if cached is MISSING:
+            cached = self._fuzzy_coords(address)
+        if cached is not MISSING:
+            if cached is None:
+                raise ValueError(self._geocode_error(address))
+            return cached
+        
+        return await self.coalescer.arun(normalize_address(address), lambda: self._alookup(address))
+    
+    async def _alookup(self, address: str) -> Tuple[float, float]:
+        """Async version of _lookup()."""
+        max_retries = 2
+        retry_delay = 1
+        
+        async def request(timeout):
+            response = await get_async_client().get(
+                f"{get_nominatim_url()}/search",
+                params={"q": address, "format": "json", "limit": 1},
+                headers={"User-Agent": "eld-trip-planner"},
+                timeout=httpx.Timeout(timeout[1], connect=timeout[0])
+            )
+            response.raise_for_status()
+            return response
+        
+        for attempt in range(max_retries):
+            if not self.nominatim.available():
+                raise ValueError(self._unavailable_error(address))
+            if not await self.rate_limiter.aacquire(remaining_budget()):
+                REJECTED.inc(upstream=self.nominatim.name, reason="deadline_exceeded")
+                raise ValueError(self._unavailable_error(address))
+            try:
+                results = (await self.nominatim.acall(request)).json()
+            except UpstreamUnavailable:
+                raise ValueError(self._unavailable_error(address))
+            except Exception:
+                if attempt < max_retries - 1 and self.nominatim.can_retry(retry_delay):
+                    await asyncio.sleep(retry_delay)
+                    continue
+                raise ValueError(self._geocode_error(address))
             
-            # Extract coordinates (they're in [lng, lat] format)
-            coordinates = route["geometry"]["coordinates"]
+            if results:
+                coords = (float(results[0]["lat"]), float(results[0]["lon"]))
+                await self.geocode_cache.aset(address, coords)
+                return coords
             
-            return {
-                "distance": round(distance_miles, 1),
-                "duration": round(duration_hours, 2),
-                "coordinates": coordinates,
-                "legs": self._process_legs(route.get("legs", []))
-            }
-        except requests.RequestException as e:
-            # Fallback to straight-line distance if routing fails
+            await self.geocode_cache.aset(address, None)
+            raise ValueError(self._geocode_error(address))
+    
+    async def ageocode_many(self, addresses: List[str]) -> List[Tuple[float, float]]:
+        """Async version of geocode_many(); distinct addresses are looked up concurrently."""
+        unique = {}
+        for address in addresses:
+            unique.setdefault(normalize_address(address), address)
+        
+        lookups = await asyncio.gather(
+            *(self.ageocode(address) for address in unique.values()),
+            return_exceptions=True
+        )
+        results = dict(zip(unique.keys(), lookups))
+        
+        coords = []
+        for address in addresses:
+            result = results[normalize_address(address)]
+            if isinstance(result, BaseException):
+                raise result
+            coords.append(result)
+        return coords
+    
+    async def acalculate_route(self, waypoints: List[Tuple[float, float]]) -> Dict:
+        """Async version of calculate_route()."""
+        key = self.route_cache.key(waypoints)
+        route, fresh = self.route_cache.get(key)
+        if route is not None:
+            if not fresh and self.osrm.available():
+                self.route_cache.refresh(key, lambda: self._request_route(waypoints))
+            return route
+        
+        if self.road_graph is not None:
+            # A* is CPU-bound; keep it off the event loop
+            route = await sync_to_async(self._local_route, thread_sensitive=False)(waypoints)
+            if route is not None:
+                self.route_cache.set(key, route)
+                return route
+        
+        url, params = self._osrm_request(waypoints)
+        
+        async def request(timeout):
+            response = await get_async_client().get(
+                url, params=params, timeout=httpx.Timeout(timeout[1], connect=timeout[0])
+            )
+            response.raise_for_status()
+            return response
+        
+        try:
+            response = await self.osrm.acall(request)
+        except (httpx.HTTPError, UpstreamUnavailable) as e:
+            ROUTE_FALLBACKS.inc(reason=getattr(e, "reason", "error"))
             return self._fallback_route(waypoints)
+        
+        route = self._parse_route(response.json())
+        self.route_cache.set(key, route)
+        return route
     
     def _process_legs(self, legs: List[Dict]) -> List[Dict]:
         """Process route legs for segment information."""
@@ -157,35 +589,5 @@ class RouteService:
         return processed
     
     def _fallback_route(self, waypoints: List[Tuple[float, float]]) -> Dict:
-        """Fallback to straight-line calculation if routing fails."""
-        total_distance = 0
-        coordinates = []
-        legs = []
-        
-        for i in range(len(waypoints) - 1):
-            start = waypoints[i]
-            end = waypoints[i + 1]
-            
-            # Calculate straight-line distance
-            distance_miles = geodesic(start, end).miles
-            total_distance += distance_miles
-            
-            # Add coordinates (convert to [lng, lat])
-            coordinates.append([start[1], start[0]])
-            
-            legs.append({
-                "distance": round(distance_miles, 1),
-                "duration": round(distance_miles / 60, 2)  # Assume 60 mph
-            })
-        
-        # Add final point
-        coordinates.append([waypoints[-1][1], waypoints[-1][0]])
-        
-        duration_hours = total_distance / 60  # Assume 60 mph average
-        
-        return {
-            "distance": round(total_distance, 1),
-            "duration": round(duration_hours, 2),
-            "coordinates": coordinates,
-            "legs": legs
-        }
+        """Fallback to an estimate from straight-line distance if routing fails."""
+        return self.estimator.estimate(waypoints)
@@ -2,10 +2,20 @@
 Main trip calculation orchestrator.
 Coordinates route calculation, stop insertion, and ELD simulation.
 """
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .cache import normalize_address
+from .departure_optimizer import DepartureOptimizer, Window
+from .geometry import RouteGeometry, render_geometry
+from .metrics import stage
+from .plans import PlanStore, StoredPlan
+from .resilience import deadline
 from .route_service import RouteService
-from .eld_simulator import ELDSimulator
+from .eld_simulator import DutyStatus, ELDSimulator, get_simulator
 
 
 class TripCalculator:
@@ -16,16 +26,28 @@ class TripCalculator:
     PICKUP_DURATION = 1.0  # 1 hour
     DROPOFF_DURATION = 1.0  # 1 hour
     
-    def __init__(self):
-        self.route_service = RouteService()
-        self.eld_simulator = ELDSimulator()
+    # A re-plan within this distance of the stored route reuses it
+    ON_ROUTE_TOLERANCE_MILES = 1.0
+    
+    def __init__(
+        self,
+        route_service: RouteService = None,
+        eld_simulator: ELDSimulator = None,
+        plan_store: PlanStore = None
+    ):
+        self.route_service = route_service if route_service is not None else RouteService()
+        self.eld_simulator = eld_simulator if eld_simulator is not None else ELDSimulator()
+        self.plan_store = plan_store if plan_store is not None else PlanStore()
     
     def calculate_trip(
         self,
         current_location: str,
         pickup_location: str,
         dropoff_location: str,
-        current_cycle_hours: float
+        current_cycle_hours: float,
+        geometry_format: str = "coordinates",
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None
     ) -> Dict:
         """
         Calculate complete trip with route, stops, and ELD logs.
@@ -34,41 +56,490 @@ class TripCalculator:
             current_location: Starting address
             pickup_location: Pickup address
             dropoff_location: Dropoff address
-            current_cycle_hours: Hours already used in 70-hour cycle
+            current_cycle_hours: Hours already used in the current cycle
+            geometry_format: "coordinates" ([lng, lat] list) or "polyline" (encoded)
+            simplify_zoom: Simplify the returned geometry for this map zoom level
+            rule_set: Registered HOS rule set name (defaults to the simulator's)
         
         Returns:
             Complete trip data with route, stops, and daily ELD logs
         """
-        # Step 1: Geocode all locations
-        current_coords = self.route_service.geocode(current_location)
-        pickup_coords = self.route_service.geocode(pickup_location)
-        dropoff_coords = self.route_service.geocode(dropoff_location)
+        # An identical request in this start time bucket was already planned
+        request = self._plan_request(
+            current_location, pickup_location, dropoff_location, current_cycle_hours,
+            geometry_format, simplify_zoom, rule_set
+        )
+        input_hash = self.plan_store.key(request)
+        with stage("plan_lookup"):
+            stored = self.plan_store.find(input_hash)
+        if stored is not None:
+            return stored
         
-        # Step 2: Calculate route through waypoints
-        waypoints = [current_coords, pickup_coords, dropoff_coords]
-        route = self.route_service.calculate_route(waypoints)
+        with self._upstream_deadline():
+            # Step 1: Geocode all locations (concurrently, duplicates looked up once)
+            with stage("geocode"):
+                current_coords, pickup_coords, dropoff_coords = self.route_service.geocode_many(
+                    [current_location, pickup_location, dropoff_location]
+                )
+            
+            # Step 2: Calculate route through waypoints
+            waypoints = [current_coords, pickup_coords, dropoff_coords]
+            with stage("route"):
+                route = self.route_service.calculate_route(waypoints)
         
-        # Step 3: Insert stops (fuel, pickup, dropoff)
-        stops = self._calculate_stops(route)
+        # Steps 3-5: stops, ELD logs and response
+        result = self._build_trip(waypoints, route, current_cycle_hours, geometry_format, simplify_zoom, rule_set)
         
-        # Step 4: Simulate ELD logs
-        eld_data = self.eld_simulator.simulate_trip(
-            total_distance=route["distance"],
-            stops=stops,
+        # Step 6: Keep the plan for re-use and mid-trip re-plans
+        with stage("plan_save"):
+            self.plan_store.save(request, waypoints, route, result, input_hash=input_hash)
+        return result
+    
+    async def acalculate_trip(
+        self,
+        current_location: str,
+        pickup_location: str,
+        dropoff_location: str,
+        current_cycle_hours: float,
+        geometry_format: str = "coordinates",
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None
+    ) -> Dict:
+        """Async version of calculate_trip(); geocoding and routing don't block the event loop."""
+        request = self._plan_request(
+            current_location, pickup_location, dropoff_location, current_cycle_hours,
+            geometry_format, simplify_zoom, rule_set
+        )
+        input_hash = self.plan_store.key(request)
+        with stage("plan_lookup"):
+            stored = await sync_to_async(self.plan_store.find)(input_hash)
+        if stored is not None:
+            return stored
+        
+        with self._upstream_deadline():
+            with stage("geocode"):
+                waypoints = await self.route_service.ageocode_many(
+                    [current_location, pickup_location, dropoff_location]
+                )
+            with stage("route"):
+                route = await self.route_service.acalculate_route(waypoints)
+        result = self._build_trip(waypoints, route, current_cycle_hours, geometry_format, simplify_zoom, rule_set)
+        with stage("plan_save"):
+            await sync_to_async(self.plan_store.save)(request, waypoints, route, result, input_hash=input_hash)
+        return result
+    
+    def optimize_departure(
+        self,
+        current_location: str,
+        pickup_location: str,
+        dropoff_location: str,
+        current_cycle_hours: float,
+        departures: List[datetime],
+        pickup_window: Optional[Window] = None,
+        dropoff_window: Optional[Window] = None,
+        objective: str = "duration",
+        geometry_format: str = "coordinates",
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None,
+        alternatives: int = 5
+    ) -> Dict:
+        """
+        Calculate the trip for the best of several departure times.
+        
+        The trip is geocoded, routed and given its stops once; only the
+        HOS simulation is repeated for each candidate departure.
+        
+        Args:
+            departures: Candidate departure times
+            pickup_window: (opens, closes) appointment at pickup
+            dropoff_window: (opens, closes) delivery window at dropoff
+            objective: "duration" (least elapsed time) or "arrival" (earliest finish)
+            alternatives: Number of runner-up departures to report
+            Other args as for calculate_trip
+        
+        Returns:
+            The calculate_trip response for the best departure, plus a
+            "departure" section describing the sweep
+        """
+        with self._upstream_deadline():
+            with stage("geocode"):
+                waypoints = self.route_service.geocode_many(
+                    [current_location, pickup_location, dropoff_location]
+                )
+            with stage("route"):
+                route = self.route_service.calculate_route(waypoints)
+        with stage("stops"):
+            stops = self._calculate_stops(route)
+        
+        windows = {}
+        for i, stop in enumerate(stops):
+            if stop["type"] == "Pickup" and pickup_window and any(pickup_window):
+                windows[i] = pickup_window
+            elif stop["type"] == "Dropoff" and dropoff_window and any(dropoff_window):
+                windows[i] = dropoff_window
+        
+        optimizer = DepartureOptimizer(self._simulator(rule_set))
+        with stage("departure_sweep"):
+            ranked = optimizer.rank(
+                optimizer.sweep(stops, current_cycle_hours, departures, windows),
+                objective
+            )
+        best = ranked[0]
+        
+        trip = self._build_trip(
+            waypoints, route, current_cycle_hours, geometry_format, simplify_zoom, rule_set,
+            start_time=best.departure, stops=best.stops
+        )
+        # Appointment offsets are simulation input, not part of the response
+        for stop in trip["stops"]:
+            stop.pop("not_before", None)
+        
+        request = self._plan_request(
+            current_location, pickup_location, dropoff_location, current_cycle_hours,
+            geometry_format, simplify_zoom, rule_set
+        )
+        request["start_time"] = best.departure.isoformat()
+        with stage("plan_save"):
+            self.plan_store.save(request, waypoints, route, trip)
+        trip["departure"] = {
+            "objective": objective,
+            **best.to_dict(),
+            "candidates_evaluated": len(ranked),
+            "simulations_run": optimizer.simulations,
+            "alternatives": [candidate.to_dict() for candidate in ranked[1:alternatives + 1]]
+        }
+        return trip
+    
+    def distance_matrix(self, locations: List[str]) -> Dict:
+        """
+        Road distances and durations between every pair of locations, for
+        sequencing multi-stop tours.
+        
+        Returns:
+            locations (name and [lng, lat] coords, in request order),
+            distances (miles) and durations (hours) as lists of rows, where
+            row i holds the trips starting at location i, and the source of
+            the matrix ("osrm" or "estimate")
+        """
+        with self._upstream_deadline():
+            with stage("geocode"):
+                waypoints = self.route_service.geocode_many(locations)
+            with stage("matrix"):
+                matrix = self.route_service.distance_matrix(waypoints)
+        
+        return {
+            "locations": [
+                {"name": name, "coords": [coords[1], coords[0]]}
+                for name, coords in zip(locations, waypoints)
+            ],
+            "distances": matrix["distances"].round(1).tolist(),
+            "durations": matrix["durations"].round(2).tolist(),
+            "source": matrix["source"]
+        }
+    
+    def calculate_trips(self, trips: List[Dict], max_workers: int = 4) -> List[Dict]:
+        """
+        Calculate many trips at once, sharing work across the batch.
+        
+        Trips with a stored plan for identical inputs are answered from it.
+        Of the rest, every distinct address is geocoded once and every
+        distinct waypoint chain (after route cache quantization) is routed
+        once; the remaining per-trip work runs on a pool of ``max_workers``
+        threads. The geocoding step and each route get one trip's deadline,
+        so a slow upstream fails or falls back instead of stalling the batch.
+        
+        Args:
+            trips: Dicts with the keyword arguments of calculate_trip
+            max_workers: Concurrency limit for geocoding, routing and simulation
+        
+        Returns:
+            One dict per trip, in order: {"status": "ok", "trip": ...} or
+            {"status": "error", "error": ..., "message": ...}
+        """
+        results = [None] * len(trips)
+        
+        # Serve trips planned before from their stored plans (one query)
+        requests = [self._plan_request(**trip) for trip in trips]
+        input_hashes = [self.plan_store.key(request) for request in requests]
+        with stage("plan_lookup"):
+            stored = self.plan_store.find_many(input_hashes)
+        pending = []
+        for i, input_hash in enumerate(input_hashes):
+            if input_hash in stored:
+                results[i] = {"status": "ok", "trip": stored[input_hash]}
+            else:
+                pending.append(i)
+        
+        # Step 1: Geocode every distinct address in the batch once
+        addresses = [
+            trips[i][field]
+            for i in pending
+            for field in ("current_location", "pickup_location", "dropoff_location")
+        ]
+        with self._upstream_deadline():
+            with stage("geocode"):
+                geocoded = self.route_service.geocode_unique(addresses, max_workers=max_workers)
+        
+        chains = {}
+        for i in pending:
+            trip = trips[i]
+            waypoints = []
+            for field in ("current_location", "pickup_location", "dropoff_location"):
+                coords = geocoded[normalize_address(trip[field])]
+                if isinstance(coords, ValueError):
+                    results[i] = self._error_result(coords)
+                    break
+                waypoints.append(coords)
+            else:
+                key = self.route_service.route_cache.key(waypoints)
+                chains.setdefault(key, (waypoints, []))[1].append(i)
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # Step 2: Route each distinct waypoint chain once
+            routes = {
+                key: pool.submit(self._route_within_deadline, waypoints)
+                for key, (waypoints, _) in chains.items()
+            }
+            
+            # Steps 3-5: Build each trip from its shared route. Route tasks were
+            # queued first, so a build task never waits on an unstarted route.
+            futures = {}
+            for key, (waypoints, indices) in chains.items():
+                for i in indices:
+                    futures[i] = (
+                        pool.submit(self._build_trip_from_future, waypoints, routes[key], trips[i]),
+                        waypoints,
+                        routes[key]
+                    )
+            
+            for i, (future, waypoints, route_future) in futures.items():
+                try:
+                    trip = future.result()
+                except Exception as e:
+                    results[i] = self._error_result(e)
+                    continue
+                # Plans are saved from this thread so this pool's threads (routing and
+                # simulation only) never open database connections; geocoding ran above,
+                # on this thread or the route service's long-lived lookup pool
+                self.plan_store.save(
+                    requests[i], waypoints, route_future.result(), trip, input_hash=input_hashes[i]
+                )
+                results[i] = {"status": "ok", "trip": trip}
+        
+        return results
+    
+    def _route_within_deadline(self, waypoints: List[Tuple[float, float]]) -> Dict:
+        # Runs on a batch pool thread, so it sets up its own deadline
+        with self._upstream_deadline():
+            return self.route_service.calculate_route(waypoints)
+    
+    def _build_trip_from_future(self, waypoints, route_future, trip: Dict) -> Dict:
+        return self._build_trip(
+            waypoints,
+            route_future.result(),
+            trip["current_cycle_hours"],
+            trip.get("geometry_format", "coordinates"),
+            trip.get("simplify_zoom"),
+            trip.get("rule_set")
+        )
+    
+    def replan_trip(
+        self,
+        plan: StoredPlan,
+        latitude: float,
+        longitude: float,
+        current_cycle_hours: float,
+        status: DutyStatus = None,
+        pickup_completed: bool = False,
+        as_of: Optional[datetime] = None,
+        geometry_format: Optional[str] = None,
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None
+    ) -> Dict:
+        """
+        Re-plan the rest of a stored trip from the truck's current position.
+        
+        Pickup and dropoff coordinates come from the stored plan, so nothing
+        is geocoded. If the truck is still on the stored route, the
+        remaining part of that route is reused and nothing is routed either;
+        otherwise only the remaining legs are routed. Stops and ELD logs are
+        generated for the remaining trip only, starting from the driver's
+        current duty status.
+        
+        Args:
+            plan: The plan being re-planned (see PlanStore.load)
+            latitude, longitude: Current position
+            current_cycle_hours: Hours used in the current cycle as of now
+            status: Driver's driving/window/break counters as of now
+            pickup_completed: Whether the pickup has already been made
+            as_of: Time of the position report (defaults to now)
+            geometry_format, simplify_zoom, rule_set: Override the plan's values
+        
+        Returns:
+            Trip data for the remaining trip, with the new plan_id and
+            "replanned_from"
+        """
+        request = dict(plan.request)
+        rule_set = rule_set or request.get("rule_set")
+        geometry_format = geometry_format or request.get("geometry_format", "coordinates")
+        if simplify_zoom is None:
+            simplify_zoom = request.get("simplify_zoom")
+        
+        simulator = self._simulator(rule_set)
+        if current_cycle_hours > simulator.max_cycle_hours:
+            raise ValueError(f"Current cycle hours must be between 0 and {simulator.max_cycle_hours:g}")
+        
+        include_pickup = plan.has_pickup and not pickup_completed
+        position = (latitude, longitude)
+        waypoints = [position, *plan.waypoints[1:]] if include_pickup else [position, plan.waypoints[-1]]
+        
+        with stage("route"):
+            route = self._remaining_route(plan, position, include_pickup)
+            route_reused = route is not None
+            if route is None:
+                with self._upstream_deadline():
+                    route = self.route_service.calculate_route(waypoints)
+        
+        with stage("stops"):
+            stops = self._calculate_stops(route, include_pickup=include_pickup)
+        result = self._build_trip(
+            waypoints, route, current_cycle_hours, geometry_format, simplify_zoom, rule_set,
+            start_time=as_of, stops=stops, status=status
+        )
+        result["replanned_from"] = str(plan.id)
+        result["route_reused"] = route_reused
+        
+        request.update(
+            current_location=f"{latitude},{longitude}",
             current_cycle_hours=current_cycle_hours,
-            start_time=datetime.now()
+            geometry_format=geometry_format,
+            simplify_zoom=simplify_zoom,
+            rule_set=rule_set
         )
+        with stage("plan_save"):
+            self.plan_store.save(request, waypoints, route, result, parent_id=plan.id)
+        return result
+    
+    def _remaining_route(self, plan: StoredPlan, position: Tuple[float, float], include_pickup: bool) -> Optional[Dict]:
+        """
+        The stored route from the truck's position on, or None if the truck has left it.
+        
+        Leg distances and durations are cut in proportion to the part of
+        each leg still ahead.
+        """
+        stored = plan.route
+        geometry = RouteGeometry(stored["coordinates"], stored["distance"])
+        if len(geometry) < 2:
+            return None
+        
+        done, off_route = geometry.locate(position[1], position[0])
+        if off_route > self.ON_ROUTE_TOLERANCE_MILES:
+            return None
+        
+        legs = stored.get("legs") or [{"distance": stored["distance"], "duration": stored["duration"]}]
+        remaining = []
+        leg_start = 0.0
+        for leg in legs:
+            leg_end = leg_start + leg["distance"]
+            ahead = min(leg["distance"], max(leg_end - done, 0.0))
+            fraction = ahead / leg["distance"] if leg["distance"] else 0.0
+            remaining.append({"distance": round(ahead, 1), "duration": round(leg["duration"] * fraction, 2)})
+            leg_start = leg_end
+        
+        if include_pickup:
+            if len(remaining) != 2 or remaining[0]["distance"] <= 0:
+                # Already past the pickup on the stored route: it needs a new route back
+                return None
+        else:
+            remaining = [{
+                "distance": round(sum(leg["distance"] for leg in remaining), 1),
+                "duration": round(sum(leg["duration"] for leg in remaining), 2)
+            }]
+        
+        return {
+            "distance": round(sum(leg["distance"] for leg in remaining), 1),
+            "duration": round(sum(leg["duration"] for leg in remaining), 2),
+            "coordinates": geometry.suffix(done),
+            "legs": remaining
+        }
+    
+    def _plan_request(
+        self,
+        current_location: str,
+        pickup_location: str,
+        dropoff_location: str,
+        current_cycle_hours: float,
+        geometry_format: str = "coordinates",
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None
+    ) -> Dict:
+        """The trip inputs stored with a plan, with the rule set resolved."""
+        return {
+            "current_location": current_location,
+            "pickup_location": pickup_location,
+            "dropoff_location": dropoff_location,
+            "current_cycle_hours": current_cycle_hours,
+            "geometry_format": geometry_format,
+            "simplify_zoom": simplify_zoom,
+            "rule_set": self._simulator(rule_set).rules.name
+        }
+    
+    def _upstream_deadline(self):
+        # Geocoding and routing share one budget; past it, routing falls back to an estimate
+        return deadline(getattr(settings, "TRIP_DEADLINE_SECONDS", 15))
+    
+    def _error_result(self, error: Exception) -> Dict:
+        """Per-trip error entry, mirroring the single-trip API's error bodies."""
+        return {
+            "status": "error",
+            "error": "Calculation error" if isinstance(error, ValueError) else "Server error",
+            "message": str(error)
+        }
+    
+    def _build_trip(
+        self,
+        waypoints: List[Tuple[float, float]],
+        route: Dict,
+        current_cycle_hours: float,
+        geometry_format: str = "coordinates",
+        simplify_zoom: Optional[float] = None,
+        rule_set: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        stops: Optional[List[Dict]] = None,
+        status: Optional[DutyStatus] = None
+    ) -> Dict:
+        """Insert stops, simulate ELD logs and assemble the trip response."""
+        # Re-plans after the pickup have only a start and a dropoff
+        names = ["Start", "Pickup", "Dropoff"] if len(waypoints) == 3 else ["Start", "Dropoff"]
+        
+        # Step 3: Insert stops (fuel, pickup, dropoff)
+        if stops is None:
+            with stage("stops"):
+                stops = self._calculate_stops(route)
+        
+        # Step 4: Simulate ELD logs
+        with stage("simulate"):
+            eld_data = self._simulator(rule_set).simulate_trip(
+                total_distance=route["distance"],
+                stops=stops,
+                current_cycle_hours=current_cycle_hours,
+                start_time=start_time if start_time is not None else timezone.localtime(),
+                status=status
+            )
+        
+        # Stops use the full geometry; only the response is simplified
+        with stage("geometry"):
+            geometry = render_geometry(route["coordinates"], geometry_format, simplify_zoom)
         
         # Step 5: Prepare response
         return {
             "route": {
                 "total_distance": route["distance"],
                 "total_duration": route["duration"],
-                "coordinates": route["coordinates"],
+                **geometry,
                 "waypoints": [
-                    {"name": "Start", "coords": [current_coords[1], current_coords[0]]},
-                    {"name": "Pickup", "coords": [pickup_coords[1], pickup_coords[0]]},
-                    {"name": "Dropoff", "coords": [dropoff_coords[1], dropoff_coords[0]]}
+                    {"name": name, "coords": [coords[1], coords[0]]}
+                    for name, coords in zip(names, waypoints)
                 ]
             },
             "stops": stops,
@@ -81,10 +552,19 @@ class TripCalculator:
             }
         }
     
-    def _calculate_stops(self, route: Dict) -> List[Dict]:
+    def _simulator(self, rule_set: Optional[str]) -> ELDSimulator:
+        """Simulator for a rule set name; None means this calculator's own simulator."""
+        if rule_set is None or rule_set == self.eld_simulator.rules.name:
+            return self.eld_simulator
+        return get_simulator(rule_set)
+    
+    def _calculate_stops(self, route: Dict, include_pickup: bool = True) -> List[Dict]:
         """
         Calculate all stops including fuel, pickup, and dropoff.
         
+        With ``include_pickup`` off (a re-plan after the pickup) the route
+        has a single leg to the dropoff and no pickup stop is added.
+        
         Returns list of stops with:
         - type: stop type
         - distance_from_start: cumulative distance
@@ -94,9 +574,10 @@ class TripCalculator:
         stops = []
         total_distance = route["distance"]
         legs = route.get("legs", [])
+        geometry = RouteGeometry(route["coordinates"], total_distance)
         
         # Calculate distances for main waypoints
-        distance_to_pickup = legs[0]["distance"] if len(legs) > 0 else 0
+        distance_to_pickup = legs[0]["distance"] if include_pickup and len(legs) > 0 else 0
         distance_to_dropoff = total_distance
         
         # Insert fuel stops
@@ -110,39 +591,34 @@ class TripCalculator:
                 stops.append({
                     "type": "Fuel Stop",
                     "distance_from_start": current_distance,
-                    "duration": self.FUEL_STOP_DURATION,
-                    "coords": self._interpolate_coords(route["coordinates"], current_distance, total_distance)
+                    "duration": self.FUEL_STOP_DURATION
                 })
         
         # Add pickup stop
-        stops.append({
-            "type": "Pickup",
-            "distance_from_start": distance_to_pickup,
-            "duration": self.PICKUP_DURATION,
-            "coords": route["coordinates"][len(route["coordinates"]) // 3] if route["coordinates"] else None
-        })
+        if include_pickup:
+            stops.append({
+                "type": "Pickup",
+                "distance_from_start": distance_to_pickup,
+                "duration": self.PICKUP_DURATION
+            })
         
         # Add dropoff stop
         stops.append({
             "type": "Dropoff",
             "distance_from_start": distance_to_dropoff,
-            "duration": self.DROPOFF_DURATION,
-            "coords": route["coordinates"][-1] if route["coordinates"] else None
+            "duration": self.DROPOFF_DURATION
         })
         
+        # Locate every stop on the route in one vectorized lookup
+        if len(geometry):
+            positions = geometry.positions_at([stop["distance_from_start"] for stop in stops])
+            for stop, coords in zip(stops, positions.tolist()):
+                stop["coords"] = coords
+        else:
+            for stop in stops:
+                stop["coords"] = None
+        
         # Sort by distance
         stops.sort(key=lambda x: x["distance_from_start"])
         
         return stops
-    
-    def _interpolate_coords(self, coordinates: List, target_distance: float, total_distance: float):
-        """Interpolate coordinates for a stop at a given distance."""
-        if not coordinates:
-            return None
-        
-        # Simple interpolation based on distance ratio
-        ratio = target_distance / total_distance
-        index = int(ratio * len(coordinates))
-        index = min(index, len(coordinates) - 1)
-        
-        return coordinates[index]
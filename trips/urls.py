@@ -1,6 +1,31 @@
+from django.conf import settings
 from django.urls import path
-from .views import TripCalculationView
+from .views import (
+    AsyncTripCalculationView,
+    AsyncTripJobDetailView,
+    DistanceMatrixView,
+    MetricsView,
+    TripBatchCalculationView,
+    TripCalculationView,
+    TripDepartureOptimizationView,
+    TripJobCreateView,
+    TripJobDetailView,
+    TripPlanDetailView,
+    TripReplanView
+)
+
+# Serve single-trip calculation from the async view when running under ASGI
+calculate_view = AsyncTripCalculationView if settings.TRIPS_ASYNC_VIEWS else TripCalculationView
+job_detail_view = AsyncTripJobDetailView if settings.TRIPS_ASYNC_VIEWS else TripJobDetailView
 
 urlpatterns = [
-    path('trips/calculate/', TripCalculationView.as_view(), name='calculate-trip'),
+    path('trips/calculate/', calculate_view.as_view(), name='calculate-trip'),
+    path('trips/calculate/batch/', TripBatchCalculationView.as_view(), name='calculate-trip-batch'),
+    path('trips/calculate/departure/', TripDepartureOptimizationView.as_view(), name='optimize-departure'),
+    path('trips/matrix/', DistanceMatrixView.as_view(), name='distance-matrix'),
+    path('trips/plans/<uuid:plan_id>/', TripPlanDetailView.as_view(), name='trip-plan-detail'),
+    path('trips/plans/<uuid:plan_id>/replan/', TripReplanView.as_view(), name='trip-plan-replan'),
+    path('trips/jobs/', TripJobCreateView.as_view(), name='trip-job-create'),
+    path('trips/jobs/<uuid:job_id>/', job_detail_view.as_view(), name='trip-job-detail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
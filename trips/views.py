@@ -1,11 +1,36 @@
 """
 API views for trip calculation.
 """
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import TripCalculationRequestSerializer, TripCalculationResponseSerializer
-from .services import TripCalculator
+from .serializers import (
+    DistanceMatrixRequestSerializer,
+    TripBatchRequestSerializer,
+    TripCalculationRequestSerializer,
+    TripCalculationResponseSerializer,
+    TripDepartureOptimizationSerializer,
+    TripReplanRequestSerializer
+)
+from .models import TripJob
+from .services import get_trip_calculator
+from .services.departure_optimizer import departure_candidates
+from .services.eld_simulator import DutyStatus
+from .services.jobs import expire_stale_job, get_job_runner
+from .services.metrics import registry, stage
 
 
 class TripCalculationView(APIView):
@@ -18,9 +43,11 @@ class TripCalculationView(APIView):
     def post(self, request):
         """Handle trip calculation request."""
         # Validate input
-        serializer = TripCalculationRequestSerializer(data=request.data)
+        with stage("validate"):
+            serializer = TripCalculationRequestSerializer(data=request.data)
+            valid = serializer.is_valid()
         
-        if not serializer.is_valid():
+        if not valid:
             return Response(
                 {"error": "Invalid input", "details": serializer.errors},
                 status=status.HTTP_400_BAD_REQUEST
@@ -30,18 +57,288 @@ class TripCalculationView(APIView):
         data = serializer.validated_data
         
         try:
-            # Calculate trip
-            calculator = TripCalculator()
+            # Calculate trip with the worker-wide (warm) services
+            calculator = get_trip_calculator()
             result = calculator.calculate_trip(
                 current_location=data["current_location"],
                 pickup_location=data["pickup_location"],
                 dropoff_location=data["dropoff_location"],
-                current_cycle_hours=data["current_cycle_hours"]
+                current_cycle_hours=data["current_cycle_hours"],
+                geometry_format=data["geometry_format"],
+                simplify_zoom=data["simplify_zoom"],
+                rule_set=data["rule_set"]
             )
             
             # Return response
             return Response(result, status=status.HTTP_200_OK)
-            
+        
+        except ValueError as e:
+            return Response(
+                {"error": "Calculation error", "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": "Server error", "message": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncTripCalculationView(View):
+    """
+    POST /api/trips/calculate/ (when TRIPS_ASYNC_VIEWS is enabled)
+    
+    Async counterpart of TripCalculationView with the same request and
+    response bodies. Under ASGI, a worker can have many trips in flight
+    while they wait on Nominatim and OSRM.
+    """
+    
+    async def post(self, request):
+        """Handle trip calculation request."""
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError as e:
+            return JsonResponse(
+                {"error": "Invalid input", "details": {"non_field_errors": [f"JSON parse error - {e}"]}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Validate input
+        with stage("validate"):
+            serializer = TripCalculationRequestSerializer(data=payload)
+            valid = serializer.is_valid()
+        
+        if not valid:
+            return JsonResponse(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        
+        try:
+            result = await get_trip_calculator().acalculate_trip(
+                current_location=data["current_location"],
+                pickup_location=data["pickup_location"],
+                dropoff_location=data["dropoff_location"],
+                current_cycle_hours=data["current_cycle_hours"],
+                geometry_format=data["geometry_format"],
+                simplify_zoom=data["simplify_zoom"],
+                rule_set=data["rule_set"]
+            )
+            with stage("render"):
+                return JsonResponse(result, status=status.HTTP_200_OK)
+        
+        except ValueError as e:
+            return JsonResponse(
+                {"error": "Calculation error", "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return JsonResponse(
+                {"error": "Server error", "message": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class TripBatchCalculationView(APIView):
+    """
+    POST /api/trips/calculate/batch/
+    
+    Calculate many trips in one request. Addresses and routes shared between
+    trips are resolved once; each trip gets its own result or error.
+    """
+    
+    def post(self, request):
+        """Handle batch trip calculation request."""
+        # Validate input
+        serializer = TripBatchRequestSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        concurrency = data.get("concurrency", settings.BATCH_MAX_CONCURRENCY)
+        
+        try:
+            results = get_trip_calculator().calculate_trips(data["trips"], max_workers=concurrency)
+        except Exception as e:
+            return Response(
+                {"error": "Server error", "message": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        succeeded = sum(1 for result in results if result["status"] == "ok")
+        return Response(
+            {
+                "results": [{"index": i, **result} for i, result in enumerate(results)],
+                "summary": {
+                    "total": len(results),
+                    "succeeded": succeeded,
+                    "failed": len(results) - succeeded
+                }
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class DistanceMatrixView(APIView):
+    """
+    POST /api/trips/matrix/
+    
+    Road distances and durations between every pair of locations, for
+    sequencing multi-stop tours.
+    """
+    
+    def post(self, request):
+        """Handle distance matrix request."""
+        serializer = DistanceMatrixRequestSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            result = get_trip_calculator().distance_matrix(serializer.validated_data["locations"])
+            return Response(result, status=status.HTTP_200_OK)
+        
+        except ValueError as e:
+            return Response(
+                {"error": "Calculation error", "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": "Server error", "message": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class TripDepartureOptimizationView(APIView):
+    """
+    POST /api/trips/calculate/departure/
+    
+    Calculate a trip for the best departure time in a range, optionally
+    meeting pickup and dropoff appointment windows.
+    """
+    
+    def post(self, request):
+        """Handle departure optimization request."""
+        serializer = TripDepartureOptimizationSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        
+        try:
+            result = get_trip_calculator().optimize_departure(
+                current_location=data["current_location"],
+                pickup_location=data["pickup_location"],
+                dropoff_location=data["dropoff_location"],
+                current_cycle_hours=data["current_cycle_hours"],
+                departures=departure_candidates(
+                    data["earliest_departure"], data["latest_departure"], data["step_minutes"]
+                ),
+                pickup_window=(data["pickup_window_start"], data["pickup_window_end"]),
+                dropoff_window=(data["dropoff_window_start"], data["dropoff_window_end"]),
+                objective=data["objective"],
+                geometry_format=data["geometry_format"],
+                simplify_zoom=data["simplify_zoom"],
+                rule_set=data["rule_set"]
+            )
+            return Response(result, status=status.HTTP_200_OK)
+        
+        except ValueError as e:
+            return Response(
+                {"error": "Calculation error", "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {"error": "Server error", "message": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+def plan_etag(request, plan_id):
+    """ETag for conditional GETs of a stored plan (None if it doesn't exist)."""
+    return get_trip_calculator().plan_store.etag(plan_id)
+
+
+class TripPlanDetailView(APIView):
+    """
+    GET /api/trips/plans/<plan_id>/
+    
+    Return a stored plan without recalculating it. Plans never change, so
+    clients polling with If-None-Match get 304 Not Modified.
+    """
+    
+    @method_decorator(condition(etag_func=plan_etag))
+    def get(self, request, plan_id):
+        """Return the stored trip response."""
+        result = get_trip_calculator().plan_store.get(plan_id)
+        if result is None:
+            return Response(
+                {"error": "Not found", "message": f"No plan with id {plan_id}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class TripReplanView(APIView):
+    """
+    POST /api/trips/plans/<plan_id>/replan/
+    
+    Re-plan the rest of a stored trip from the truck's current position
+    and duty status. Only the remaining part of the trip is recalculated.
+    """
+    
+    def post(self, request, plan_id):
+        """Handle re-plan request."""
+        serializer = TripReplanRequestSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        data = serializer.validated_data
+        calculator = get_trip_calculator()
+        
+        with stage("plan_load"):
+            plan = calculator.plan_store.load(plan_id)
+        if plan is None:
+            return Response(
+                {"error": "Not found", "message": f"No plan with id {plan_id}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            result = calculator.replan_trip(
+                plan,
+                latitude=data["latitude"],
+                longitude=data["longitude"],
+                current_cycle_hours=data["current_cycle_hours"],
+                status=DutyStatus(data["driving_hours"], data["window_hours"], data["driving_since_break"]),
+                pickup_completed=data["pickup_completed"],
+                as_of=data.get("as_of"),
+                geometry_format=data.get("geometry_format"),
+                simplify_zoom=data.get("simplify_zoom"),
+                rule_set=data.get("rule_set")
+            )
+            return Response(result, status=status.HTTP_200_OK)
+        
         except ValueError as e:
             return Response(
                 {"error": "Calculation error", "message": str(e)},
@@ -52,3 +349,141 @@ class TripCalculationView(APIView):
                 {"error": "Server error", "message": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+def serialize_job(request, job: TripJob) -> dict:
+    """Render a TripJob for the jobs API."""
+    body = {
+        "job_id": str(job.id),
+        "status": job.status,
+        "url": request.build_absolute_uri(reverse("trip-job-detail", args=[job.id])),
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == TripJob.SUCCEEDED:
+        body["result"] = job.result
+    elif job.status == TripJob.FAILED:
+        body.update(job.error or {})
+    return body
+
+
+class TripJobCreateView(APIView):
+    """
+    POST /api/trips/jobs/
+    
+    Queue a trip calculation and return a job id immediately.
+    """
+    
+    def post(self, request):
+        """Validate the trip request and queue it for background calculation."""
+        serializer = TripCalculationRequestSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                {"error": "Invalid input", "details": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        job = get_job_runner().submit(dict(serializer.validated_data))
+        return Response(serialize_job(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+def parse_job_wait(params):
+    """The ``wait`` query parameter in seconds, or None if it isn't a number."""
+    try:
+        return max(float(params.get("wait", 0)), 0.0)
+    except ValueError:
+        return None
+
+
+INVALID_WAIT = {"error": "Invalid input", "details": {"wait": ["A number of seconds is required."]}}
+
+
+def job_not_found(job_id) -> dict:
+    return {"error": "Not found", "message": f"No job with id {job_id}"}
+
+
+class TripJobDetailView(APIView):
+    """
+    GET /api/trips/jobs/<job_id>/?wait=<seconds>
+    
+    Return a job's status and, once finished, its result or error. With
+    ``wait`` the request long-polls until the job finishes or the wait
+    runs out. The wait holds a request worker, so here it is capped at
+    MAX_WAIT seconds; unfinished jobs carry a Retry-After header for the
+    next poll. Under ASGI, AsyncTripJobDetailView waits longer.
+    """
+    
+    POLL_INTERVAL = 0.25
+    MAX_WAIT = 2.0
+    RETRY_AFTER = 1
+    
+    def get(self, request, job_id):
+        """Return the job, optionally waiting briefly for it to finish."""
+        wait = parse_job_wait(request.query_params)
+        if wait is None:
+            return Response(INVALID_WAIT, status=status.HTTP_400_BAD_REQUEST)
+        deadline = time.monotonic() + min(wait, self.MAX_WAIT, settings.TRIP_JOB_MAX_WAIT)
+        
+        while True:
+            job = TripJob.objects.filter(id=job_id).first()
+            if job is None:
+                return Response(job_not_found(job_id), status=status.HTTP_404_NOT_FOUND)
+            job = expire_stale_job(job, settings.TRIP_JOB_STALE_AFTER)
+            if job.is_finished:
+                return Response(serialize_job(request, job), status=status.HTTP_200_OK)
+            if time.monotonic() >= deadline:
+                return Response(
+                    serialize_job(request, job),
+                    status=status.HTTP_200_OK,
+                    headers={"Retry-After": str(self.RETRY_AFTER)}
+                )
+            time.sleep(self.POLL_INTERVAL)
+
+
+class AsyncTripJobDetailView(View):
+    """
+    GET /api/trips/jobs/<job_id>/?wait=<seconds> (when TRIPS_ASYNC_VIEWS is enabled)
+    
+    Async counterpart of TripJobDetailView. Waiting costs no worker under
+    ASGI, so ``wait`` long-polls for up to TRIP_JOB_MAX_WAIT seconds.
+    """
+    
+    POLL_INTERVAL = 0.25
+    
+    async def get(self, request, job_id):
+        """Return the job, optionally waiting for it to finish."""
+        wait = parse_job_wait(request.GET)
+        if wait is None:
+            return JsonResponse(INVALID_WAIT, status=status.HTTP_400_BAD_REQUEST)
+        deadline = time.monotonic() + min(wait, settings.TRIP_JOB_MAX_WAIT)
+        
+        while True:
+            job = await TripJob.objects.filter(id=job_id).afirst()
+            if job is None:
+                return JsonResponse(job_not_found(job_id), status=status.HTTP_404_NOT_FOUND)
+            job = await sync_to_async(expire_stale_job)(job, settings.TRIP_JOB_STALE_AFTER)
+            if job.is_finished:
+                return JsonResponse(serialize_job(request, job), status=status.HTTP_200_OK)
+            if time.monotonic() >= deadline:
+                response = JsonResponse(serialize_job(request, job), status=status.HTTP_200_OK)
+                response["Retry-After"] = str(TripJobDetailView.RETRY_AFTER)
+                return response
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+
+class MetricsView(View):
+    """
+    GET /api/metrics/
+    
+    Stage and request latency histograms, upstream error counts and cache
+    hit ratios for this process, in Prometheus text format.
+    """
+    
+    def get(self, request):
+        if not settings.METRICS_ENABLED:
+            return JsonResponse(
+                {"error": "Not found", "message": "Metrics are disabled"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")